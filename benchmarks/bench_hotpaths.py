@@ -0,0 +1,514 @@
+"""
+Benchmarks of fedoralink's hot paths. They run offline - the repository and the search index are in-process
+FakeFedora and FakeElasticsearch servers (see fedoralink.testing).
+
+Usage:
+    python benchmarks/bench_hotpaths.py [--filter save load] [--repeat 5] [--latency 0.001] [--save FILE]
+    python benchmarks/bench_hotpaths.py --compare FILE [--threshold 0.2]
+
+Every benchmark is run --repeat times and the best time per call is reported. --save stores the results as
+a JSON baseline, --compare runs the benchmarks, compares them with the baseline and exits with status 1 if any
+of them got slower by more than --threshold (0.2 means 20 %).
+
+benchmarks/baseline.json is the baseline of the current tree (Python 3.7, Django 1.10). The times depend on
+the machine, so CI first saves a baseline of the target branch on its own runner and then compares the change
+with it:
+    git checkout master && python benchmarks/bench_hotpaths.py --save /tmp/baseline.json
+    git checkout - && python benchmarks/bench_hotpaths.py --compare /tmp/baseline.json
+Regenerate benchmarks/baseline.json with --save when a change makes the hot paths intentionally slower or faster.
+
+The script configures django itself (an in-memory sqlite default database and the fake repository),
+DJANGO_SETTINGS_MODULE is not used.
+"""
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import django                                               # noqa: E402
+from django.conf import settings                            # noqa: E402
+from rdflib import Literal                                  # noqa: E402
+
+from fedoralink.term_pool import get_term_pool              # noqa: E402
+from fedoralink.testing import FakeFedora, FakeFedoraServer, FakeElasticsearch, FakeElasticsearchServer  # noqa
+
+CONTAINER_WIDTH = 500
+SEARCH_DOCUMENTS = 200
+SEARCH_HITS = 100
+
+# benchmarks are registered here by the @benchmark decorator: list of (name, setup function, calls per run)
+BENCHMARKS = []
+
+# templates of the search view benchmark, the row template is the one shipped with fedoralink_ui
+TEMPLATES = {
+    'benchmarks/search.html':
+        '{% for item in page %}{% include item_template %}{% endfor %}'
+        '{% for facet in facets %}{{ facet.0 }}{% for value in facet.1 %}{{ value.0 }} {{ value.1 }}'
+        '{% endfor %}{% endfor %}',
+}
+
+
+class SkipBenchmark(Exception):
+    """
+    Raised from a benchmark setup if the benchmark can not run in this environment
+    """
+
+
+def benchmark(number=1):
+    """
+    Registers a benchmark. The decorated function gets the Environment, prepares the data and returns a callable
+    which is then timed.
+
+    :param number:  number of calls of the returned callable in one timed run
+    """
+    def wrapper(func):
+        BENCHMARKS.append((func.__name__[len('bench_'):], func, number))
+        return func
+    return wrapper
+
+
+class _UrlConf:
+    """
+    ROOT_URLCONF of the benchmarks - the search view and detail urls used by fedoralink_ui templates
+    """
+    urlpatterns = []
+
+
+def configure(repo_url, search_url):
+    settings.configure(
+        DEBUG=False,
+        SECRET_KEY='benchmarks',
+        INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth', 'fedoralink', 'fedoralink_ui'],
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': ':memory:'
+            },
+            'repository': {
+                'ENGINE': 'fedoralink.engine',
+                'REPO_URL': repo_url,
+                'SEARCH_ENGINE': 'fedoralink.indexer.elastic.ElasticIndexer',
+                'SEARCH_URL': search_url,
+                # measure the requests and parsing, not the metadata cache
+                'METADATA_CACHE_SIZE': 0,
+            }
+        },
+        LANGUAGES=(('cs', 'Czech'), ('en', 'English')),
+        LANGUAGE_CODE='en',
+        ROOT_URLCONF=_UrlConf,
+        TEMPLATES=[{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'OPTIONS': {
+                'loaders': [
+                    ('django.template.loaders.locmem.Loader', TEMPLATES),
+                    'django.template.loaders.app_directories.Loader',
+                ],
+                'context_processors': ['django.template.context_processors.request'],
+            },
+        }],
+    )
+    # fedoralink_ui prints the template configuration when it gets ready
+    with contextlib.redirect_stdout(io.StringIO()):
+        django.setup()
+
+
+class Environment:
+    """
+    Data shared by the benchmarks: the fake repository with a root collection and the search index
+    """
+
+    def __init__(self, server, search_server):
+        from fedoralink.models import FedoraObject
+
+        self.server = server
+        self.search_server = search_server
+        self.root = FedoraObject.objects.get(pk='')
+        self._counter = 0
+        self._indexer = None
+
+    @property
+    def indexer(self):
+        """
+        ElasticIndexer with DCObject mapping and SEARCH_DOCUMENTS indexed objects
+        """
+        if self._indexer is None:
+            from django.core.management import call_command
+            from fedoralink.manager import FedoraManager
+            # noinspection PyUnresolvedReferences
+            import fedoralink.management.commands.config_repository_index_elasticsearch    # noqa: F401
+
+            # the command configures debug logging when imported
+            logging.getLogger().setLevel(logging.WARNING)
+            with contextlib.redirect_stdout(io.StringIO()):
+                call_command('config_repository_index_elasticsearch', 'fedoralink.common_namespaces.dc.DCObject')
+
+            self._indexer = FedoraManager.get_indexer()
+            for child in self.create_container(SEARCH_DOCUMENTS).list_children():
+                self._indexer.reindex(child)
+        return self._indexer
+
+    def unique(self, prefix):
+        self._counter += 1
+        return '%s-%d' % (prefix, self._counter)
+
+    def create_container(self, children, flavour=None):
+        """
+        Creates a container with the given number of DCObject children in the repository
+        """
+        from fedoralink.common_namespaces.dc import DCObject
+        from fedoralink.models import FedoraObject
+
+        container = self.root.create_subcollection(self.unique('container'), flavour=flavour or DCObject,
+                                                   slug=self.unique('container'))
+        container.save()
+        FedoraObject.save_multiple([self.new_child(container, i) for i in range(children)])
+        return container
+
+    @staticmethod
+    def new_child(container, i):
+        from fedoralink.common_namespaces.dc import DCObject
+
+        child = container.create_child('Child number %d' % i, flavour=DCObject)
+        child.creator = 'Creator %d' % (i % 10)
+        child.contributor = 'Contributor %d' % i
+        child.abstract = [Literal('Abstrakt %d' % i, lang='cs'), Literal('Abstract %d' % i, lang='en')]
+        return child
+
+
+@benchmark(number=5)
+def bench_save_create(env):
+    """
+    FedoraManager.save of new objects: 20 children in one save_multiple
+    """
+    from fedoralink.models import FedoraObject
+
+    container = env.create_container(0)
+    return lambda: FedoraObject.save_multiple([env.new_child(container, i) for i in range(20)])
+
+
+@benchmark(number=5)
+def bench_save_update(env):
+    """
+    FedoraManager.save of changed objects: 20 updated children in one save_multiple
+    """
+    from fedoralink.models import FedoraObject
+
+    container = env.create_container(20)
+    children = container.list_children()
+    counter = iter(range(10 ** 9))
+
+    def run():
+        value = 'Creator %d' % next(counter)
+        for child in children:
+            child.creator = value
+        FedoraObject.save_multiple(children)
+
+    return run
+
+
+@benchmark(number=5)
+def bench_save_unchanged(env):
+    """
+    FedoraManager.save of unchanged objects: 20 children re-saved with the values they already have
+    """
+    from fedoralink.models import FedoraObject
+
+    container = env.create_container(20)
+    children = container.list_children()
+    FedoraObject.save_multiple(children)
+
+    def run():
+        for child in children:
+            child.creator = child.creator
+        FedoraObject.save_multiple(children)
+
+    return run
+
+
+@benchmark(number=100)
+def bench_serialize_sparql(env):
+    """
+    RDFMetadata.serialize_sparql of an object with 20 fields, each with 10 replaced values
+    """
+    from rdflib import URIRef, XSD
+    from fedoralink.rdfmetadata import RDFMetadata
+
+    metadata = RDFMetadata('http://example.com/object')
+    for field in range(20):
+        predicate = URIRef('http://example.com/ns#field%d' % field)
+        metadata[predicate] = [Literal('Old "value" %d\n%d' % (field, i), datatype=XSD.string) for i in range(10)]
+    metadata.mark_saved()
+    for field in range(20):
+        predicate = URIRef('http://example.com/ns#field%d' % field)
+        metadata[predicate] = [Literal('New value %d' % i, lang='en') for i in range(10)]
+    return metadata.serialize_sparql
+
+
+@benchmark(number=5)
+def bench_get_object(env):
+    """
+    FedoraConnection.get_object of a container with embedded children - a request and parsing of the response
+    """
+    from fedoralink.models import FedoraObject
+
+    container = env.create_container(CONTAINER_WIDTH)
+    connection = FedoraObject.objects.connection
+    return lambda: list(connection.get_object(container.id))
+
+
+@benchmark(number=3)
+def bench_load_children(env):
+    """
+    FedoraManager.load_children on a wide container - fetch and materialization of the children
+    """
+    from fedoralink.models import FedoraObject
+
+    container = env.create_container(CONTAINER_WIDTH)
+    return lambda: FedoraObject.objects.load_children(container)
+
+
+@benchmark(number=10)
+def bench_pickle_object(env):
+    """
+    pickle.dumps and pickle.loads of a fetched container with embedded children, as done by django cache
+    """
+    import pickle
+
+    from fedoralink.models import FedoraObject
+
+    container = env.create_container(CONTAINER_WIDTH)
+    fetched = FedoraObject.objects.get(pk=container.id)
+    fetched.title                           # parsed, as after any use of the object
+    return lambda: pickle.loads(pickle.dumps(fetched, pickle.HIGHEST_PROTOCOL))
+
+
+@benchmark(number=1000)
+def bench_get_object_class(env):
+    """
+    FedoraTypeManager.get_object_class for metadata of a DCObject
+    """
+    from fedoralink.common_namespaces.dc import DCObject
+    from fedoralink.type_manager import FedoraTypeManager
+
+    container = env.create_container(1)
+    metadata = container.list_children()[0].metadata
+    return lambda: FedoraTypeManager.get_object_class(metadata, DCObject)
+
+
+@benchmark(number=5)
+def bench_reindex(env):
+    """
+    ElasticIndexer.reindex of 20 objects
+    """
+    indexer = env.indexer
+    children = env.create_container(20).list_children()
+
+    def run():
+        for child in children:
+            indexer.reindex(child)
+
+    return run
+
+
+@benchmark(number=10)
+def bench_search(env):
+    """
+    ElasticIndexer.search - query building, the search request and build_instance of the returned hits
+    """
+    from django.db.models import Q
+    from fedoralink.common_namespaces.dc import DCObject
+
+    indexer = env.indexer
+
+    def run():
+        query = ((Q(creator__fulltext='creator') | Q(contributor__in=['Contributor 1', 'Contributor 2'])) &
+                 ~Q(creator='Creator 3'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            # search prints the query
+            result = indexer.search(query, DCObject, 0, SEARCH_HITS, ['creator', 'contributor'],
+                                    ['title@cs', '-_fedora_created'], None)
+        return list(result['data'])
+
+    return run
+
+
+@benchmark(number=20)
+def bench_build_instance(env):
+    """
+    ElasticIndexer.build_instance - materialization of search hits to metadata
+    """
+    from fedoralink.common_namespaces.dc import DCObject
+    from fedoralink.utils import url2id
+
+    indexer = env.indexer
+    id2fld = {url2id(fld.rdf_name): fld.name for fld in DCObject._meta.fields}
+    hits = indexer.es.search(body={'query': {'match_all': {}}, 'size': SEARCH_HITS})['hits']['hits']
+    return lambda: [indexer.build_instance(doc, id2fld) for doc in hits]
+
+
+@benchmark(number=1000)
+def bench_url2id_id2url(env):
+    """
+    url2id and id2url round trip of the predicates of DCObject
+    """
+    from fedoralink.common_namespaces.dc import DCObject
+    from fedoralink.utils import url2id, id2url
+
+    urls = [str(fld.rdf_name) for fld in DCObject._meta.fields]
+    return lambda: [id2url(url2id(url)) for url in urls]
+
+
+@benchmark(number=10)
+def bench_search_view(env):
+    """
+    GenericSearchView - search, pagination and rendering of a result page with fedoralink_ui templates
+    """
+    try:
+        from fedoralink_ui.views import GenericSearchView
+    except ImportError as e:
+        raise SkipBenchmark('fedoralink_ui.views can not be imported: %s' % e)
+
+    from django.conf.urls import url, include
+    from django.test import RequestFactory
+    from fedoralink.common_namespaces.dc import DCObject
+
+    env.indexer
+
+    class SearchView(GenericSearchView):
+        model_class = DCObject
+        template_name = 'benchmarks/search.html'
+        facets = (('creator', 'Creator'), ('contributor', 'Contributor'))
+        orderings = (('title@lang', 'Title'),)
+
+    view = SearchView.as_view()
+    _UrlConf.urlpatterns = [
+        url(r'^', include(([
+            url(r'^search/$', view, name='search'),
+            url(r'^detail/(?P<id>.*)$', view, name='detail'),
+        ], 'benchmarks'), namespace='benchmarks'))
+    ]
+    request = RequestFactory().get('/search/', {'page': '2'})
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return view(request)
+
+    return run
+
+
+def run_benchmark(func, number, env, repeat):
+    """
+    Times the benchmark
+
+    :return: dictionary with the best and median time of one call in seconds
+    """
+    call = func(env)
+    call()                      # warm up
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        times.append((time.perf_counter() - start) / number)
+    times.sort()
+    return {
+        'best': times[0],
+        'median': times[len(times) // 2],
+        'number': number,
+        'repeat': repeat
+    }
+
+
+def compare(baseline, results, threshold):
+    """
+    Prints the comparison of results with a baseline
+
+    :return: names of the benchmarks which got slower by more than threshold
+    """
+    regressions = []
+    print('%-22s %14s %14s %9s' % ('benchmark', 'baseline [ms]', 'current [ms]', 'change'))
+    for name, result in results.items():
+        if name not in baseline:
+            print('%-22s %14s %14.3f %9s' % (name, '-', result['best'] * 1000, 'new'))
+            continue
+        old = baseline[name]['best']
+        change = result['best'] / old - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = ' REGRESSION'
+        print('%-22s %14.3f %14.3f %+8.1f%%%s' % (name, old * 1000, result['best'] * 1000, change * 100, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', nargs='+', default=None,
+                        help='run only benchmarks whose name contains one of the strings')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='latency in seconds added by the fake servers to each request')
+    parser.add_argument('--save', metavar='FILE', help='save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results with a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown against the baseline, as a fraction (default 0.2)')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    with FakeFedoraServer(FakeFedora(latency=args.latency, record_requests=False)) as server, \
+            FakeElasticsearchServer(FakeElasticsearch(latency=args.latency)) as search_server:
+        configure(server.url, search_server.url + '/benchmarks')
+        env = Environment(server, search_server)
+
+        results = {}
+        for name, func, number in BENCHMARKS:
+            if args.filter and not any(x in name for x in args.filter):
+                continue
+            try:
+                results[name] = run_benchmark(func, number, env, args.repeat)
+            except SkipBenchmark as e:
+                print('%-22s skipped: %s' % (name, e))
+                continue
+            if not baseline:
+                print('%-22s %10.3f ms %10.3f ms (median)' % (name, results[name]['best'] * 1000,
+                                                               results[name]['median'] * 1000))
+
+    term_pool = get_term_pool().stats()
+    print('term pool: %d terms, %d lookups, hit rate %.1f %%, %.1f MB saved' % (
+        term_pool['terms'], term_pool['lookups'], term_pool['hit_rate'] * 100, term_pool['bytes_saved'] / 2 ** 20))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'created': datetime.datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'machine': platform.node(),
+                'latency': args.latency,
+                'term_pool': term_pool,
+                'results': results
+            }, f, indent=4, sort_keys=True)
+
+    if baseline:
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print('Slower than the baseline by more than %d %%: %s' % (args.threshold * 100, ', '.join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
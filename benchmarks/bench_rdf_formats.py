@@ -0,0 +1,106 @@
+"""
+Compares parse time and memory of the RDF formats Fedora can return (see RDF_FORMAT setting) for a container
+with embedded children, as returned by FedoraConnection.get_object(fetch_child_metadata=True). Both rdflib.Graph
+parsing and RDFMetadata built from the response bytes (the path fedoralink takes) are measured.
+
+Usage:
+    python benchmarks/bench_rdf_formats.py [--children 1000 10000] [--repeat 3]
+"""
+import argparse
+import gc
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import rdflib
+from rdflib import Literal, URIRef, XSD
+from rdflib.namespace import DC, RDF
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fedoralink.connection import RDF_FORMATS                # noqa: E402
+from fedoralink.fedorans import FEDORA, LDP, EBUCORE        # noqa: E402
+from fedoralink.rdfmetadata import RDF_PARSERS, RDFMetadata  # noqa: E402
+
+REPO_URL = 'http://localhost:8080/rest/'
+
+
+def container_graph(children):
+    """
+    Builds a graph resembling Fedora's response for a container with embedded children
+    """
+    g = rdflib.Graph()
+    container = URIRef(REPO_URL + 'container')
+    for t in (FEDORA.Container, FEDORA.Resource, LDP.RDFSource, LDP.Container, EBUCORE.Collection):
+        g.add((container, RDF.type, t))
+    g.add((container, DC.title, Literal('Container', datatype=XSD.string)))
+    g.add((container, FEDORA.hasParent, URIRef(REPO_URL)))
+
+    for i in range(children):
+        child = URIRef('%scontainer/%02x/%02x/%06d' % (REPO_URL, i % 256, (i // 256) % 256, i))
+        g.add((container, LDP.contains, child))
+        for t in (FEDORA.Container, FEDORA.Resource, LDP.RDFSource, LDP.Container):
+            g.add((child, RDF.type, t))
+        g.add((child, FEDORA.hasParent, container))
+        g.add((child, FEDORA.created, Literal('2016-01-01T00:00:00.%03dZ' % (i % 1000), datatype=XSD.dateTime)))
+        g.add((child, FEDORA.lastModified, Literal('2016-01-02T00:00:00.%03dZ' % (i % 1000),
+                                                   datatype=XSD.dateTime)))
+        g.add((child, FEDORA.createdBy, Literal('bypassAdmin', datatype=XSD.string)))
+        g.add((child, FEDORA.writable, Literal(True)))
+        g.add((child, DC.title, Literal('Child number %d' % i, datatype=XSD.string)))
+        g.add((child, DC.description, Literal('Description of child %d with some čeština' % i, lang='cs')))
+    return g
+
+
+def parse_graph(data, media_type):
+    g = rdflib.Graph()
+    g.parse(io.BytesIO(data), format=RDF_PARSERS[media_type])
+    return g
+
+
+def parse_metadata(data, media_type):
+    metadata = RDFMetadata(REPO_URL + 'container', data, media_type)
+    # the bytes are parsed on the first access to a predicate that is not scanned
+    metadata[DC.title]
+    return metadata
+
+
+def measure(parse, data, media_type, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        parse(data, media_type)
+        times.append(time.perf_counter() - start)
+
+    # memory is measured in a separate run as tracemalloc slows the parsing down considerably
+    gc.collect()
+    tracemalloc.start()
+    parse(data, media_type)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--children', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('%-10s %-10s %-10s %12s %10s %12s %10s' % ('children', 'format', 'parser', 'bytes', 'parse [s]',
+                                                     'peak [MB]', 'triples'))
+    for children in args.children:
+        g = container_graph(children)
+        for name, media_type in sorted(RDF_FORMATS.items()):
+            data = g.serialize(format=RDF_PARSERS[media_type], encoding='utf-8')
+            for parser_name, parse in (('rdflib', parse_graph), ('fedoralink', parse_metadata)):
+                best, peak = measure(parse, data, media_type, args.repeat)
+                print('%-10d %-10s %-10s %12d %10.3f %12.1f %10d' % (children, name, parser_name, len(data), best,
+                                                                     peak / 2 ** 20, len(g)))
+
+
+if __name__ == '__main__':
+    main()
@@ -28,6 +28,10 @@ def delete_from_index(sender, **kwargs):
     instance = kwargs['instance']
     db = kwargs['using']
 
+    if kwargs.get('in_bulk'):
+        # sent by FedoraManager.delete_tree which calls bulk_delete_from_index itself
+        return
+
     # print("do_index called", db, instance, settings.DATABASES[db].get('USE_INTERNAL_INDEXER', False))
 
     if settings.DATABASES[db].get('USE_INTERNAL_INDEXER', False) and isinstance(instance, IndexableFedoraObject):
@@ -35,6 +39,17 @@ def delete_from_index(sender, **kwargs):
         indexer.delete(instance)
 
 
+def bulk_delete_from_index(instances, db):
+
+    from fedoralink.indexer.models import IndexableFedoraObject
+    from django.db import connections
+    from django.conf import settings
+
+    instances = [x for x in instances if isinstance(x, IndexableFedoraObject)]
+    if instances and settings.DATABASES[db].get('USE_INTERNAL_INDEXER', False):
+        connections[db].indexer.delete_many(instances)
+
+
 def upload_binary_files(sender, **kwargs):
 
     from fedoralink.models import UploadedFileStream
@@ -0,0 +1,577 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+from urllib.error import HTTPError
+
+import rdflib
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from .connection import FedoraConnectionBase, _UploadStream, UPLOAD_CHUNK_SIZE
+from .engine.delegated_requests import add_delegation_headers, HTTPError as RequestsHTTPError
+from .executor import run_async_tasks, run_in_thread
+from .fedorans import FEDORA
+from .middleware import FedoraProfillingMiddleware
+from .query import DoesNotExist
+
+log = logging.getLogger('fedoralink.async_connection')
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class AsyncSession:
+    """
+    A keep-alive httpx.AsyncClient with a bounded connection pool and a semaphore limiting the number of requests
+    running at the same time. Adds On-Behalf-Of headers and logs times of requests for profiling the same way
+    as delegated_requests. Cookies are never stored, requests are authenticated with the credentials the session
+    has been created with.
+
+    The client is bound to the event loop it has been created in, use get_async_session to get the session
+    of the current loop. Closing the session waits for the requests in progress, including not yet closed
+    streamed responses.
+    """
+
+    def __init__(self, max_connections=10, concurrency=10, max_retries=0, auth=None, semaphore=None, client=None):
+        """
+        :param max_connections: maximum number of connections, keep-alive connections are limited to the same number
+        :param concurrency:     maximum number of requests running at the same time, the others wait
+        :param max_retries:     number of retries on failed connects
+        :param auth:            optional tuple (username, password) for http basic authentication
+        :param semaphore:       asyncio.Semaphore limiting the requests instead of concurrency, to share the limit
+                                with other sessions
+        :param client:          httpx.AsyncClient (or an object with the same interface) to use instead of
+                                creating one from the other arguments
+        """
+        if client is None:
+            limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(limits=limits, retries=max_retries),
+                                       timeout=None, auth=tuple(auth) if auth else None)
+            client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self._client = client
+        self._semaphore = semaphore or asyncio.Semaphore(concurrency)
+        self._in_use = 0            # number of requests in progress and open streamed responses
+        self._closing = False
+        self.last_used = time.monotonic()
+
+    async def request(self, method, url, headers=None, stream=False, **kwargs):
+        """
+        Makes a http request
+
+        :param method:      http method
+        :param url:         url
+        :param headers:     optional dictionary of headers
+        :param stream:      if True, the body of the response is not read. Call aclose() on the response when done
+        :param kwargs:      other arguments of httpx.AsyncClient.build_request, for example content
+        :return:            httpx.Response
+        """
+        headers = add_delegation_headers(dict(headers or {}))
+        do_debug = FedoraProfillingMiddleware.profilling_enabled()
+        t1 = time.time()
+        self._in_use += 1
+        response = None
+        try:
+            async with self._semaphore:
+                request = self._client.build_request(method, url, headers=headers, **kwargs)
+                response = await self._client.send(request, stream=stream)
+                return response
+        finally:
+            if do_debug:
+                FedoraProfillingMiddleware.log_time('%s %s - %r' % (method, url, headers), time.time() - t1)
+            if stream and response is not None:
+                self._release_on_close(response)
+            else:
+                await self._release()
+
+    def _release_on_close(self, response):
+        """
+        Keeps the session in use until the streamed response is closed
+        """
+        response_aclose = response.aclose
+        released = []
+
+        async def aclose():
+            try:
+                await response_aclose()
+            finally:
+                # httpx closes the response at the end of the iteration, the caller might close it again
+                if not released:
+                    released.append(True)
+                    await self._release()
+
+        response.aclose = aclose
+
+    async def _release(self):
+        self._in_use -= 1
+        if self._closing and not self._in_use:
+            await self._client.aclose()
+
+    async def aclose(self):
+        """
+        Closes the client. If requests are still in progress, the client is closed after the last one finishes
+        """
+        if self._closing:
+            return
+        self._closing = True
+        if not self._in_use:
+            await self._client.aclose()
+
+
+_sessions      = weakref.WeakKeyDictionary()       # event loop -> OrderedDict {key: AsyncSession}, LRU first
+_semaphores    = weakref.WeakKeyDictionary()       # event loop -> {key: asyncio.Semaphore}
+_sessions_lock = threading.Lock()
+_closing       = set()                             # tasks closing evicted sessions
+
+
+def get_async_session(key, max_sessions=None, idle_timeout=None, **options):
+    """
+    Returns AsyncSession of the running event loop registered under the given key, creating it if necessary.
+    Sessions are evicted the same way as by delegated_requests.get_session, evicted sessions are closed
+    in a background task after the requests they are running finish.
+
+    :param key:             key of the session, for example the repository url and the credentials
+    :param max_sessions:    maximum number of sessions kept in the loop, None for unlimited
+    :param idle_timeout:    number of seconds after which an unused session is closed, None for never
+    :param options:         arguments of AsyncSession constructor, used only when the session is created
+    :return:                instance of AsyncSession
+    """
+    loop = asyncio.get_event_loop()
+    now = time.monotonic()
+    evicted = []
+    with _sessions_lock:
+        loop_sessions = _sessions.setdefault(loop, OrderedDict())
+        session = loop_sessions.get(key)
+        if session is None:
+            session = loop_sessions[key] = AsyncSession(**options)
+            log.debug('Created async session, %d sessions open', len(loop_sessions))
+        else:
+            loop_sessions.move_to_end(key)
+        session.last_used = now
+
+        while len(loop_sessions) > 1:
+            oldest_key, oldest = next(iter(loop_sessions.items()))
+            over_limit = max_sessions is not None and len(loop_sessions) > max_sessions
+            expired = idle_timeout is not None and now - oldest.last_used > idle_timeout
+            if not (over_limit or expired):
+                break
+            evicted.append(loop_sessions.pop(oldest_key))
+
+    for s in evicted:
+        task = loop.create_task(s.aclose())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+    return session
+
+
+def get_async_semaphore(key, concurrency):
+    """
+    Returns asyncio.Semaphore of the running event loop registered under the given key, creating it if necessary
+
+    :param key:             key of the semaphore, for example the repository url
+    :param concurrency:     value of the semaphore, used only when it is created
+    """
+    loop = asyncio.get_event_loop()
+    with _sessions_lock:
+        loop_semaphores = _semaphores.setdefault(loop, {})
+        semaphore = loop_semaphores.get(key)
+        if semaphore is None:
+            semaphore = loop_semaphores[key] = asyncio.Semaphore(concurrency)
+        return semaphore
+
+
+class AsyncBitstream:
+    """
+    Content of a binary resource streamed from Fedora. Iterate it with "async for" to get chunks of bytes,
+    the response is closed when the iteration ends. Call aclose() if the content is not read to the end.
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self.status    = response.status_code
+        self.headers   = response.headers
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            async for chunk in self._response.aiter_raw(DOWNLOAD_CHUNK_SIZE):
+                yield chunk
+        finally:
+            await self._response.aclose()
+
+    async def aclose(self):
+        await self._response.aclose()
+
+
+class AsyncFedoraConnection(FedoraConnectionBase):
+    """
+    A connection to fedora server for asyncio code. It has the same methods as FedoraConnection, but they are
+    coroutines. Requires httpx.
+
+    The number of requests to Fedora running at the same time is limited by ASYNC_CONCURRENCY option (default
+    is CONNECTION_POOL_MAXSIZE). Credentials (as_user) and delegation (as_delegated_user) are read when a method
+    is called, so they apply to the whole call. A transaction belongs to the connection instance - do not share
+    an instance in a transaction between concurrently running tasks.
+
+    Server-managed triples of saved metadata can not be fetched lazily (see RDFMetadata.mark_saved) without
+    blocking the event loop, they are fetched right after the write instead - inside a transaction after
+    the buffered update is sent.
+    """
+
+    def __init__(self, fedora_url, username=None, password=None, options=None):
+        """
+        creates a new connection, see FedoraConnectionBase for the options
+        """
+        if httpx is None:
+            raise ImportError('AsyncFedoraConnection requires httpx library, install it with "pip install httpx"')
+        super().__init__(fedora_url, username, password, options)
+
+    @property
+    def _session(self):
+        options = self._options
+        max_connections = options.get('CONNECTION_POOL_MAXSIZE', 10)
+        # the limit of concurrent requests is shared by the sessions of all users
+        semaphore = get_async_semaphore(self._fedora_url, options.get('ASYNC_CONCURRENCY', max_connections))
+        return get_async_session(self._get_session_key(),
+                                 max_sessions=options.get('SESSION_CACHE_SIZE', 16),
+                                 idle_timeout=options.get('SESSION_IDLE_TIMEOUT', 300),
+                                 max_connections=max_connections,
+                                 semaphore=semaphore,
+                                 max_retries=options.get('CONNECTION_MAX_RETRIES', 0),
+                                 auth=self._get_credentials())
+
+    async def create_objects(self, data):
+        """
+        create new objects in Fedora repository, see FedoraConnection.create_objects
+        """
+        data = list(data)
+
+        async def create(item, parent_metadata):
+            if parent_metadata is not None:
+                item['metadata'][FEDORA.hasParent] = rdflib.URIRef(parent_metadata.id)
+            return await self._create_single_resource(item)
+
+        return await self._run_batch(create, data, self._get_create_dependencies(data))
+
+    async def _create_single_resource(self, item):
+        metadata, parent, parent_url = self._prepare_create(item)
+
+        if item['bitstream'] is not None:
+            created_object_id = await self._create_object_from_bitstream(parent_url, item['bitstream'], item['slug'])
+            metadata.set_id(created_object_id)
+            return await self._update_single_resource(created_object_id, metadata, parent=parent)
+        else:
+            return await self._create_object_from_metadata(parent_url, metadata, item['slug'], parent)
+
+    async def _run_batch(self, func, data, depends_on=None):
+        # a transaction in Fedora must not be used concurrently
+        concurrency = 1 if self._in_transaction else self._options.get('WRITE_CONCURRENCY', 4)
+        results, errors = await run_async_tasks(func, data, concurrency, depends_on)
+        return self._batch_results(data, results, errors)
+
+    async def _create_object_from_bitstream(self, parent_url, bitstream, slug):
+        log.info('Creating child from bitstream in %s', parent_url)
+        headers = {}
+        if slug:
+            headers['SLUG'] = slug
+        resp, digest = await self._upload_bitstream('POST', parent_url, bitstream, headers)
+        if resp.status_code >= 400:
+            raise RequestsHTTPError("Resource not created, error code %s : %s" % (resp.status_code, resp.content))
+
+        created_object_id = self._get_created_object_id(resp)
+        if digest:
+            await self._verify_upload_digest(created_object_id, digest)
+
+        # do not make a version as this will be done after metadata are uploaded ...
+
+        return created_object_id
+
+    async def _update_object_bitstream(self, url, bitstream):
+        resp, digest = await self._upload_bitstream('PUT', url, bitstream, {})
+        if resp.status_code >= 400:
+            raise RequestsHTTPError("Bitstream not updated, error code %s : %s" % (resp.status_code, resp.content))
+        if digest:
+            await self._verify_upload_digest(url, digest)
+
+    async def _upload_bitstream(self, method, url, bitstream, headers):
+        """
+        Streams the bitstream to the server in chunks, see FedoraConnection._upload_bitstream. The stream
+        is read in a worker thread so that reading a local file does not block the event loop.
+        """
+        headers, computed_algorithm = await run_in_thread(self._get_upload_headers, bitstream, headers)
+
+        size = bitstream.size
+        upload = _UploadStream(bitstream.stream, size, computed_algorithm)
+        if size == 0:
+            body = b''
+        else:
+            if size is not None:
+                headers['Content-Length'] = str(size)
+            body = self._read_chunks(upload)
+
+        resp = await self._session.request(method, url, content=body, headers=headers,
+                                           timeout=self._get_httpx_timeout('upload'))
+
+        if computed_algorithm:
+            return resp, (computed_algorithm, upload.hexdigest())
+        return resp, None
+
+    @staticmethod
+    async def _read_chunks(upload):
+        loop = asyncio.get_event_loop()
+        while True:
+            data = await loop.run_in_executor(None, upload.read, UPLOAD_CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+
+    async def _verify_upload_digest(self, object_id, digest):
+        algorithm, hexdigest = digest
+        if algorithm != 'sha1':
+            log.warning('Can not verify %s digest of uploaded %s, Fedora stores only sha1 digests',
+                        algorithm, object_id)
+            return
+        metadata = await self.get_object(object_id, fetch_child_metadata=False)
+        self._check_upload_digest(object_id, hexdigest, metadata)
+
+    async def _create_object_from_metadata(self, parent_url, metadata, slug, parent=None):
+        payload = str(metadata)
+        log.info('Creating child in %s', parent_url)
+        log.debug("    payload %s", payload)
+        headers = {'Content-Type' : 'text/turtle; encoding=utf-8'}
+        if slug:
+            headers['SLUG'] = slug
+        resp = await self._session.request('POST', parent_url, content=payload.encode('utf-8'), headers=headers,
+                                           timeout=self._get_httpx_timeout('write'))
+        if resp.status_code >= 400:
+            raise RequestsHTTPError("Resource not created, error code %s : %s" % (resp.status_code, resp.content))
+        created_object_id = self._get_created_object_id(resp)
+
+        self._invalidate_cached_metadata(created_object_id)
+        await self._version_written(created_object_id)
+
+        metadata.set_id(created_object_id)
+        self._mark_saved(metadata, resp, parent)
+        await self._fetch_server_managed(metadata)
+        return metadata
+
+    async def update_objects(self, data):
+        """
+        Update objects in repository, see FedoraConnection.update_objects
+        """
+        async def update(item, _):
+            metadata = item['metadata']
+            url = self._get_request_url(metadata.id)
+            return await self._update_single_resource(url, metadata, item['bitstream'])
+
+        return await self._run_batch(update, list(data))
+
+    async def _update_single_resource(self, url, metadata, bitstream=None, parent=None):
+        if bitstream is None and parent is None and not metadata.has_changes():
+            log.debug("Object %s not changed, not updating", url)
+            return metadata
+        log.info("Updating object %s", url)
+        if bitstream is not None:
+            await self._update_object_bitstream(url, bitstream)
+
+        if self._in_transaction and self._options.get('TRANSACTION_BUFFER', True):
+            return self._buffer_update(metadata, parent)
+
+        resp = await self._patch_metadata(url, metadata, metadata.serialize_sparql())
+        self._mark_saved(metadata, resp, parent)
+        await self._fetch_server_managed(metadata)
+        return metadata
+
+    async def _patch_metadata(self, url, metadata, payload):
+        if log.isEnabledFor(logging.DEBUG):
+            # decoding a large update is not for free
+            log.debug("      payload %s", payload.decode('utf-8'))
+        resp = await self._session.request('PATCH', url + "/fcr:metadata", content=payload,
+                                           headers={'Content-Type': 'application/sparql-update; encoding=utf-8'},
+                                           timeout=self._get_httpx_timeout('write'))
+        self._invalidate_cached_metadata(metadata.id)
+        if resp.status_code // 100 != 2:
+            raise Exception('Error updating resource in Fedora: %s' % resp.content)
+        await self._version_written(metadata.id)
+        return resp
+
+    async def _flush_pending_updates(self, object_ids=None):
+        """
+        Sends updates buffered in the transaction to the server, see FedoraConnection._flush_pending_updates
+        """
+        pending = self._take_pending_updates(object_ids)
+        if not pending:
+            return
+
+        async def send(update, _):
+            if update.is_empty():
+                return
+            log.info("Sending buffered update of %s", update.url)
+            payload = update.metadata.serialize_sparql((update.removed, update.added))
+            await self._patch_metadata(update.url, update.metadata, payload)
+            await self._fetch_server_managed(update.metadata)
+
+        # the transaction must not be used concurrently
+        results, errors = await run_async_tasks(send, pending, 1)
+        self._batch_results(pending, results, errors)
+
+    def _get_refetch(self, metadata):
+        # a refetch would block the event loop, server-managed triples are fetched by _fetch_server_managed
+        return None
+
+    async def _fetch_server_managed(self, metadata):
+        """
+        Fetches server-managed triples of written metadata, see RDFMetadata.update_server_managed
+        """
+        metadata.update_server_managed(await self.get_object(metadata.id, fetch_child_metadata=False))
+
+    async def get_object(self, object_id, fetch_child_metadata=True):
+        """
+        Fetches the resource with the given object_id parameter, see FedoraConnection.get_object
+
+        :return:    the RDFMetadata of the fetched object (not a generator as in FedoraConnection)
+        """
+        try:
+            await self._flush_pending_updates([object_id])
+            req_url, headers, cache_lookup = self._prepare_get_object(object_id, fetch_child_metadata)
+            r = await self._read(req_url + "/fcr:metadata", headers)
+            return self._get_metadata_from_response(req_url, r.status_code, r.headers, r.content, cache_lookup)
+        except HTTPError as e:
+            raise DoesNotExist(e)
+
+    async def get_objects(self, object_ids, fetch_child_metadata=False, concurrency=None):
+        """
+        Fetches many resources concurrently, see FedoraConnection.get_objects
+        """
+        object_ids = list(object_ids)
+
+        async def fetch(object_id, _):
+            return await self.get_object(object_id, fetch_child_metadata=fetch_child_metadata)
+
+        results, errors = await run_async_tasks(fetch, object_ids, self._get_read_concurrency(concurrency))
+        return self._get_objects_results(object_ids, results, errors)
+
+    async def raw_get(self, url):
+        await self._flush_pending_updates([url])
+        r = await self._read(url)
+        if r.status_code // 100 != 2:
+            raise HTTPError(url, r.status_code, r.content, hdrs=r.headers, fp=None)
+        return r.content
+
+    async def _read(self, url, headers=None):
+        """
+        GETs the url (an idempotent read), hedging the request if enabled
+        """
+        session = self._session
+        timeout = self._get_httpx_timeout('read')
+
+        async def get():
+            return await session.request('GET', url, headers=headers, timeout=timeout)
+
+        if self._use_hedging():
+            return await self._hedger.arun(get)
+        return await get()
+
+    async def get_bitstream(self, object_id, range=None, if_range=None):
+        """
+        Returns the content of a binary resource, see FedoraConnection.get_bitstream
+
+        :return:            AsyncBitstream. Its status is 206 and its headers contain Content-Range if
+                            Fedora honoured the range, 200 if the whole content is returned
+        """
+        req_url = self._get_request_url(object_id)
+        log.info("Bitstream request url %s, range %s", req_url, range)
+        headers = {}
+        if range:
+            headers['Range'] = range
+            if if_range:
+                headers['If-Range'] = if_range
+        response = await self._session.request('GET', req_url, headers=headers, stream=True,
+                                               timeout=self._get_httpx_timeout('download'))
+        return AsyncBitstream(response)
+
+    async def delete(self, object_id):
+        """
+        Deletes an object
+
+        :param object_id:     id of the object. Might be full url or a fragment
+                              which will be appended after repository_url
+        """
+        req_url = self._get_request_url(object_id)
+        log.info('Deleting resource with url %s', req_url)
+        # buffered updates of deleted resources are useless
+        self._take_pending_updates([object_id], descendants=True)
+        await self._session.request('DELETE', req_url, timeout=self._get_httpx_timeout('write'))
+        self._invalidate_cached_metadata(object_id, descendants=True)
+
+    async def make_version(self, object_id, version):
+        """
+        Marks the current object data inside repository with a new version, see FedoraConnection.make_version
+        """
+        await self._flush_pending_updates([object_id])
+        await self._session.request('POST', self._get_request_url(object_id) + '/fcr:versions',
+                                    headers={'Slug': 'snapshot_at_%s' % version},
+                                    timeout=self._get_httpx_timeout('write'))
+
+    async def _version_written(self, object_id):
+        if self._version_required(object_id):
+            await self.make_version(object_id, time.time())
+
+    async def begin_transaction(self):
+        url = self.dumb_concatenate_url(self._fedora_url, "fcr:tx")
+        log.info('Requesting transaction, url %s', url)
+        req = await self._session.request('POST', url, timeout=self._get_httpx_timeout('write'))
+        self._transaction_url = req.headers['Location']
+        self._in_transaction = True
+
+    async def commit(self):
+        await self._end_transaction(True)
+
+    async def rollback(self):
+        await self._end_transaction(False)
+
+    async def _end_transaction(self, do_commit):
+        error = None
+        try:
+            if self._in_transaction:
+                if do_commit:
+                    try:
+                        await self._flush_pending_updates()
+                    except Exception as e:
+                        log.error('Could not send buffered updates, rolling back the transaction')
+                        error, do_commit = e, False
+                url = self._get_transaction_end_url(do_commit)
+                log.info('Finishing transaction, url %s', url)
+                await self._session.request('POST', url, timeout=self._get_httpx_timeout('write'))
+        finally:
+            written = self._reset_transaction()
+
+        for object_id in self._transaction_finished(do_commit, written):
+            await self.make_version(object_id, time.time())
+
+        if error is not None:
+            raise error
+
+    async def direct_put(self, url, data, content_type='application/binary'):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        await self._flush_pending_updates([url])
+        req = await self._session.request('PUT', self._get_request_url(url), content=data,
+                                          headers={'Content-Type': content_type},
+                                          timeout=self._get_httpx_timeout('write'))
+        log.debug(req.text)
+        self._invalidate_cached_metadata(url)
+
+    def _get_httpx_timeout(self, operation):
+        timeout = self._get_timeout(operation)
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return httpx.Timeout(None, connect=connect, read=read)
+        return httpx.Timeout(timeout)
@@ -1,24 +1,48 @@
 import logging
-import sys
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from contextlib import closing
 from urllib.error import HTTPError
 from urllib.parse import urljoin, quote
 
-import io
+import hashlib
 import os.path
 import rdflib
 # import requests
 from .engine import delegated_requests as requests
-from requests.auth import HTTPBasicAuth
 
 from fedoralink.query import DoesNotExist
-from .fedorans import FEDORA
-from .rdfmetadata import RDFMetadata
+from .fedorans import FEDORA, PREMIS, LDP
+from .rdfmetadata import RDFMetadata, RDF_PARSERS
 from .authentication.as_user import fedora_auth_local
+from .middleware import FedoraUserDelegationMiddleware
+from . import metadata_cache
+from . import versioning
+from .executor import run_tasks, ThreadLocalContext
+from .engine.hedging import get_hedger
 
 log = logging.getLogger('fedoralink.connection')
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# RDF_FORMAT setting -> value of Accept header, one of rdfmetadata.RDF_PARSERS
+RDF_FORMATS = {
+    'n-triples': 'application/n-triples',
+    'turtle':    'text/turtle',
+    'rdf+xml':   'application/rdf+xml',
+}
+
+# operation -> timeout used if TIMEOUTS setting does not specify it. Timeout is either a number of seconds
+# or a tuple (connect timeout, read timeout), None means no timeout. Read timeout is the time the server may
+# take to send the next part of the response, so it does not limit the size of bitstreams
+DEFAULT_TIMEOUTS = {
+    'read':     (10, 60),       # reading metadata
+    'download': (10, 60),       # reading bitstreams
+    'write':    (10, 120),      # creating, updating and deleting resources, versions and transactions
+    'upload':   (10, 600),      # uploading bitstreams, the server may compute digests of large files
+}
+
 # TODO: transactions
 
 
@@ -26,16 +50,187 @@ class RepositoryException(HTTPError):
     pass
 
 
-class FedoraConnection:
+class BatchWriteException(Exception):
     """
-    A connection to fedora server
+    Raised when some of the resources in a batch could not be written. The other resources have been written.
+    """
+
+    def __init__(self, results, errors):
+        """
+        :param results: list in the order of the batch, written RDFMetadata or None if the write failed
+        :param errors:  dictionary index in the batch -> exception
+        """
+        super().__init__('%s of %s resources could not be written: %s' % (
+            len(errors), len(results), '; '.join('%s: %s' % (k, v) for k, v in sorted(errors.items()))))
+        self.results = results
+        self.errors  = errors
+
+
+class DeleteTreeException(Exception):
+    """
+    Raised when some resources of a tree could not be fetched or deleted. Their ancestors are not deleted either,
+    the other resources have been deleted.
     """
 
-    def __init__(self, fedora_url, username=None, password=None):
+    def __init__(self, deleted, errors):
+        """
+        :param deleted: list of ids of deleted resources
+        :param errors:  dictionary id of resource -> exception
+        """
+        super().__init__('%s resources could not be deleted: %s' % (
+            len(errors), '; '.join('%s: %s' % (k, v) for k, v in sorted(errors.items())[:10])))
+        self.deleted = deleted
+        self.errors  = errors
+
+
+class _UploadStream:
+    """
+    File-like wrapper of a bitstream being uploaded. It is read in chunks by http.client, so the whole
+    bitstream is never held in memory, and it updates the digest of the uploaded data on the fly.
+    __len__ gives requests the Content-Length; if the size is unknown, send chunks() instead to get
+    a chunked transfer encoding.
+    """
+
+    def __init__(self, stream, size, digest_algorithm=None):
+        self._stream = stream
+        self._size   = size
+        self._digest = hashlib.new(digest_algorithm) if digest_algorithm else None
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        if self._digest is not None:
+            self._digest.update(data)
+        return data
+
+    def __len__(self):
+        return self._size
+
+    def chunks(self):
+        while True:
+            data = self.read(UPLOAD_CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+def _is_seekable(stream):
+    # noinspection PyBroadException
+    try:
+        return stream.seekable()
+    except Exception:
+        return False
+
+
+class _PendingUpdate:
+    """
+    Changes of a resource saved inside a transaction and not yet sent to the server. Change sets of successive
+    saves are merged so that the resulting SPARQL update has the same effect as sending them one by one.
+    """
+
+    def __init__(self, url, metadata):
+        self.url      = url
+        self.metadata = metadata     # the last saved metadata of the resource
+        self.removed  = {}
+        self.added    = {}
+
+    def merge(self, removed, added):
+        """
+        Adds changes of a later save, arguments are the return value of RDFMetadata.get_changes
+
+        SPARQL update deletes before it inserts, so the merged update removes everything removed by any of
+        the saves unless it is added back later, and adds what has been added and not removed later.
+        """
+        for predicate, values in removed.items():
+            self._include(self.removed, predicate, values)
+            self._exclude(self.added, predicate, values)
+        for predicate, values in added.items():
+            self._include(self.added, predicate, values)
+            self._exclude(self.removed, predicate, values)
+
+    @staticmethod
+    def _include(changes, predicate, values):
+        current = changes.setdefault(predicate, [])
+        current.extend(value for value in values if value not in current)
+
+    @staticmethod
+    def _exclude(changes, predicate, values):
+        if predicate in changes:
+            changes[predicate] = [value for value in changes[predicate] if value not in values]
+            if not changes[predicate]:
+                del changes[predicate]
+
+    def is_empty(self):
+        return not any(self.removed.values()) and not any(self.added.values())
+
+
+class FedoraConnectionBase:
+    """
+    Parts of a connection to fedora server that do not make any http calls - urls, transactions, caching,
+    versioning policy and processing of requests and responses. Shared by FedoraConnection and
+    fedoralink.async_connection.AsyncFedoraConnection
+    """
+
+    def __init__(self, fedora_url, username=None, password=None, options=None):
         """
         creates a new connection
 
         :param fedora_url: url of fedora REST api
+        :param options:    optional dictionary of settings, usually DATABASES['repository']. Recognized keys:
+                            CONNECTION_POOL_SIZE      number of per-host connection pools kept (default 10)
+                            CONNECTION_POOL_MAXSIZE   number of keep-alive connections per host (default 10)
+                            CONNECTION_POOL_BLOCK     if True, wait for a free connection instead of opening
+                                                      a not pooled one when the pool is exhausted (default False)
+                            CONNECTION_MAX_RETRIES    number of retries on failed connects (default 0)
+                            SESSION_CACHE_SIZE        every combination of credentials (configured user, as_user)
+                                                      and delegation (On-Behalf-Of) gets its own http session
+                                                      with a connection pool. At most this many sessions are
+                                                      kept, the least recently used are closed (default 16)
+                            SESSION_IDLE_TIMEOUT      sessions not used for this many seconds are closed
+                                                      (default 300)
+                            VERSIONING                when to make versions of written resources, one of
+                                                      fedoralink.versioning.POLICIES (default 'always').
+                                                      Can be overridden by versioning.versioning_policy
+                            VERSIONING_QUIET_PERIOD   for 'coalesced' versioning, number of seconds without
+                                                      writes after which a version is made (default 60)
+                            WRITE_CONCURRENCY         maximum number of resources created/updated in parallel
+                                                      by create_objects/update_objects (default 4). Inside
+                                                      a transaction the resources are always written serially
+                            READ_CONCURRENCY          maximum number of resources fetched in parallel by
+                                                      get_objects and iter_objects (default 4). Inside
+                                                      a transaction the resources are always fetched serially
+                            TRANSACTION_BUFFER        if True (default), updates of metadata inside a transaction
+                                                      are buffered and merged into a single SPARQL update per
+                                                      resource, sent just before the commit (or before
+                                                      the resource is read). Versions are made after the buffered
+                                                      update is sent
+                            UPLOAD_DIGEST             None (default), 'sha1' or 'sha256'. If set, bitstreams
+                                                      are uploaded with a Digest header that Fedora verifies.
+                                                      The digest of a non-seekable stream is computed during
+                                                      the upload and checked against the stored sha1 digest
+                            RDF_FORMAT                format in which metadata are fetched from Fedora, one of
+                                                      RDF_FORMATS (default 'n-triples', the fastest to parse)
+                            METADATA_CACHE_SIZE       number of resources whose metadata are cached in process
+                                                      memory and revalidated with ETag (default 0, the cache is
+                                                      disabled). Containers fetched with embedded children are
+                                                      never cached - Fedora does not change the container's ETag
+                                                      when a child changes
+                            METADATA_CACHE_BYTES      maximum total size of metadata cached in process memory
+                                                      (default 16 MB)
+                            METADATA_CACHE_DJANGO     alias of django cache used as a second, shared tier of
+                                                      the metadata cache (default None)
+                            METADATA_CACHE_TIMEOUT    timeout of metadata in django cache in seconds (default None
+                                                      meaning the default of the django cache)
+                            TIMEOUTS                  dictionary operation -> timeout, see DEFAULT_TIMEOUTS.
+                                                      (connect, read) might be given as a list as well
+                            HEDGE_READS               if True, metadata reads that take longer than
+                                                      HEDGE_PERCENTILE (default 95) of recent latencies are sent
+                                                      once more and the first response wins (default False).
+                                                      The delay is clamped to HEDGE_MIN_DELAY and HEDGE_MAX_DELAY
+                                                      (default 0.05 and 2 seconds), at most HEDGE_MAX_OUTSTANDING
+                                                      (default 8) duplicate requests run at the same time
         """
         self._fedora_url      = fedora_url
         if not self._fedora_url.endswith('/'):
@@ -43,9 +238,549 @@ class FedoraConnection:
 
         self._in_transaction  = False
         self._transaction_url = ''
+        # object_id -> versioning policy, resources to be versioned when the transaction is committed
+        self._transaction_versioned = {}
+        # (object_id, descendants) written in the transaction, removed from metadata cache when it is committed
+        self._transaction_invalidated = set()
+        # request url -> _PendingUpdate, updates buffered in the transaction
+        self._pending_updates = OrderedDict()
+        # RDFMetadata saved in the transaction, they get ids outside of it when the transaction ends
+        self._transaction_saved = []
         self._username = username
         self._password = password
 
+        if options is None:
+            options = {}
+        self._options = options
+
+        rdf_format = options.get('RDF_FORMAT', 'n-triples')
+        if rdf_format not in RDF_FORMATS:
+            raise AttributeError('Unknown RDF_FORMAT %s, expected one of %s' % (rdf_format, sorted(RDF_FORMATS)))
+        self._accept = RDF_FORMATS[rdf_format]
+
+        if options.get('METADATA_CACHE_SIZE', 0):
+            self._metadata_cache = metadata_cache.get_metadata_cache(self._fedora_url,
+                                                                     options['METADATA_CACHE_SIZE'],
+                                                                     options.get('METADATA_CACHE_DJANGO'),
+                                                                     options.get('METADATA_CACHE_TIMEOUT'),
+                                                                     options.get('METADATA_CACHE_BYTES',
+                                                                                 16 * 1024 * 1024))
+        else:
+            self._metadata_cache = None
+
+        self._timeouts = dict(DEFAULT_TIMEOUTS)
+        for operation, timeout in options.get('TIMEOUTS', {}).items():
+            # settings loaded from json or yaml have lists instead of tuples
+            self._timeouts[operation] = tuple(timeout) if isinstance(timeout, list) else timeout
+
+        if options.get('HEDGE_READS', False):
+            self._hedger = get_hedger(self._fedora_url,
+                                      percentile=options.get('HEDGE_PERCENTILE', 95),
+                                      min_delay=options.get('HEDGE_MIN_DELAY', 0.05),
+                                      max_delay=options.get('HEDGE_MAX_DELAY', 2.0),
+                                      max_hedges=options.get('HEDGE_MAX_OUTSTANDING', 8))
+        else:
+            self._hedger = None
+
+        self._coalescing_versioner = None
+
+    def _get_read_concurrency(self, concurrency=None):
+        # a transaction in Fedora is bound to a single session that must not be used concurrently
+        if self._in_transaction:
+            return 1
+        return concurrency or self._options.get('READ_CONCURRENCY', 4)
+
+    @staticmethod
+    def _get_objects_results(object_ids, results, errors):
+        """
+        Processes results of fetching many resources by get_objects
+
+        :return: tuple (list of RDFMetadata of found resources in the order of object_ids, list of missing ids)
+        :raise   the first error other than DoesNotExist
+        """
+        for index in sorted(errors):
+            if not isinstance(errors[index], DoesNotExist):
+                raise errors[index]
+        found = [metadata for metadata in results if metadata is not None]
+        misses = [object_ids[index] for index in sorted(errors)]
+        return found, misses
+
+    def _get_timeout(self, operation):
+        """
+        :param operation:   one of the keys of DEFAULT_TIMEOUTS
+        :return:            timeout for the operation, number of seconds or tuple (connect, read)
+        """
+        return self._timeouts[operation]
+
+    def _use_hedging(self):
+        # requests inside a transaction are never duplicated
+        return self._hedger is not None and not self._in_transaction
+
+    def get_hedging_stats(self):
+        """
+        Returns counters of hedged reads (see engine.hedging.Hedger) and the current hedging delay,
+        None if hedging is not enabled
+        """
+        if self._hedger is None:
+            return None
+        stats = dict(self._hedger.stats)
+        stats['delay'] = self._hedger.get_delay()
+        return stats
+
+    def _prepare_create(self, item):
+        """
+        Removes FEDORA:hasParent from metadata of a resource to be created, it is given by the url the resource
+        is posted to
+
+        :param item:    item of create_objects
+        :return:        tuple (metadata, parent uri or None, url of the parent)
+        """
+        metadata = item['metadata']
+        parent = metadata[FEDORA.hasParent]
+        if not parent:
+            parent = None
+            parent_url = ''
+        else:
+            parent = parent[0]
+            parent_url = str(parent)
+            del metadata[FEDORA.hasParent]
+        return metadata, parent, self._get_request_url(parent_url)
+
+    def _get_create_dependencies(self, data):
+        """
+        For each item to be created returns the index of the item that is its parent or None
+        """
+        def key(object_id):
+            return self._get_request_url(str(object_id)).rstrip('/')
+
+        created_ids = {}
+        for index, item in enumerate(data):
+            metadata = item['metadata']
+            if str(metadata.id):
+                created_ids[key(metadata.id)] = index
+            parent = metadata[FEDORA.hasParent]
+            if parent and item.get('slug'):
+                created_ids[key(parent[0]) + '/' + item['slug']] = index
+
+        depends_on = []
+        for index, item in enumerate(data):
+            parent = item['metadata'][FEDORA.hasParent]
+            dependency = created_ids.get(key(parent[0])) if parent else None
+            depends_on.append(dependency if dependency != index else None)
+        return depends_on
+
+    @staticmethod
+    def _batch_results(data, results, errors):
+        if errors:
+            if len(data) == 1:
+                raise errors[0]
+            raise BatchWriteException(results, errors)
+        return results
+
+    def _get_upload_headers(self, bitstream, headers):
+        """
+        Returns headers for upload of a bitstream
+
+        :param bitstream:   TypedStream
+        :param headers:     additional headers
+        :return:            tuple (headers, algorithm). Algorithm is set if the digest can not be computed
+                            beforehand and must be computed during the upload and verified afterwards
+        """
+        headers = dict(headers)
+        headers['Content-Type'] = bitstream.mimetype
+        if bitstream.filename:
+            filename_header = 'filename="%s"' % quote(os.path.basename(bitstream.filename).encode('utf-8'))
+            headers['Content-Disposition'] = 'attachment; ' + filename_header
+
+        stream = bitstream.stream
+        algorithm = self._options.get('UPLOAD_DIGEST')
+        computed_algorithm = None
+        if algorithm:
+            if _is_seekable(stream):
+                # compute the digest beforehand so that Fedora can check it, reading the stream twice
+                # is much cheaper than holding it in memory
+                headers['Digest'] = '%s=%s' % (algorithm, self._compute_digest(stream, algorithm))
+            else:
+                computed_algorithm = algorithm
+        return headers, computed_algorithm
+
+    @staticmethod
+    def _compute_digest(stream, algorithm):
+        position = stream.tell()
+        digest = hashlib.new(algorithm)
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        stream.seek(position)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _check_upload_digest(object_id, hexdigest, metadata):
+        stored_digests = [str(x) for x in metadata[PREMIS.hasMessageDigest]]
+        if 'urn:sha1:' + hexdigest not in stored_digests:
+            raise Exception('Digest of uploaded bitstream %s does not match: sent sha1 %s, stored %s' %
+                            (object_id, hexdigest, stored_digests))
+
+    @staticmethod
+    def _get_created_object_id(resp):
+        return resp.headers.get('Location') or resp.text
+
+    def _mark_saved(self, metadata, resp, parent=None):
+        """
+        Marks metadata as written to the server. Server-managed triples will be fetched only when needed.
+
+        :param metadata:    the metadata that have been written
+        :param resp:        response of the write
+        :param parent:      parent uri if the resource has just been created - it is known, so keep it locally
+        """
+        if parent is not None:
+            metadata.add(FEDORA.hasParent, parent)
+        metadata.mark_saved(self._get_refetch(metadata),
+                            resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+        if self._in_transaction:
+            self._transaction_saved.append(metadata)
+
+    def _get_refetch(self, metadata):
+        """
+        Returns a callable without parameters returning current RDFMetadata of the object. The id of the metadata
+        is read when the callable is called, it changes when the transaction the metadata have been saved in ends.
+        """
+        raise NotImplementedError()
+
+    def _prepare_get_object(self, object_id, fetch_child_metadata):
+        """
+        Prepares request for metadata of an object
+
+        :return: tuple (request url, headers, cache lookup). Cache lookup is passed to _get_metadata_from_response
+        """
+        req_url = self._get_request_url(object_id)
+        log.info('Requesting url %s' % req_url)
+        headers = {
+            'Accept' : self._accept,
+        }
+        if fetch_child_metadata:
+            headers['Prefer'] = 'return=representation; ' + \
+                                'include="http://fedora.info/definitions/v4/repository#EmbedResources"'
+        else:
+            headers['Prefer'] = 'return=representation; ' + \
+                                'omit="http://fedora.info/definitions/v4/repository#EmbedResources"'
+
+        # resources inside a transaction are not cached, they are not visible to anyone else. Nor are containers
+        # with embedded children, the container's ETag does not change when a child changes
+        cache = self._metadata_cache if not self._in_transaction and not fetch_child_metadata else None
+        cache_variant = (headers.get('Prefer'), self._accept) + self._get_identity()
+        cached = cache.get(req_url, cache_variant) if cache is not None else None
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            elif cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+            else:
+                cached = None
+
+        return req_url, headers, (cache, cache_variant, cached)
+
+    def _get_metadata_from_response(self, req_url, status_code, response_headers, data, cache_lookup):
+        """
+        Creates RDFMetadata from response to a request prepared by _prepare_get_object. The response body
+        is parsed lazily, on the first access to the metadata which needs it.
+
+        :raise RepositoryException  if the server returned an error
+        """
+        cache, cache_variant, cached = cache_lookup
+        log.debug("response headers %s", response_headers)
+        if status_code == 304 and cached is not None:
+            log.debug("   ... not modified, using cached metadata")
+            data          = cached.data
+            content_type  = cached.content_type
+            etag          = response_headers.get('ETag', cached.etag)
+            last_modified = response_headers.get('Last-Modified', cached.last_modified)
+        elif status_code // 100 != 2:
+            raise RepositoryException(url=req_url, code=status_code,
+                                      msg='Error accessing repository: %s' % data.decode('utf-8', 'replace'),
+                                      hdrs=response_headers, fp=None)
+        else:
+            log.debug("   ... data %s", data)
+            content_type = response_headers.get('Content-Type', '').split(';')[0].strip()
+            if content_type not in RDF_PARSERS:
+                content_type = self._accept
+            etag          = response_headers.get('ETag')
+            last_modified = response_headers.get('Last-Modified')
+            if cache is not None and (etag or last_modified):
+                cache.put(req_url, cache_variant,
+                          metadata_cache.CachedMetadata(etag, last_modified, data, content_type))
+
+        metadata = RDFMetadata(req_url, data, content_type)
+        metadata.etag          = etag
+        metadata.last_modified = last_modified
+        return metadata
+
+    def _remove_transactions_from_paths(self, data):
+        # remove transaction from data ... let's do it the simple way even though it is not kosher
+        if self._in_transaction:
+            if not self._transaction_url.startswith(self._fedora_url):
+                raise Exception('Error in getting transaction id: path %s not within fedora REST api %s' %
+                                (self._transaction_url, self._fedora_url))
+
+            txid = self._transaction_url[len(self._fedora_url):]
+            if txid.startswith('/'):
+                txid = txid[1:]
+            if not txid.endswith('/'):
+                txid += '/'
+
+            # as txid is based on uuid, let's hope it occurs only in transactions ...
+            data = data.replace(txid, '')
+        return data
+
+    def _invalidate_cached_metadata(self, object_id, descendants=False):
+        """
+        Removes the resource and its ancestors from the metadata cache - their representations embed
+        children's metadata which might not be reflected in their ETag
+
+        :param object_id:   id of the written/deleted resource
+        :param descendants: True if the resource has been deleted together with its descendants
+        """
+        if self._metadata_cache is None:
+            return
+        if self._in_transaction:
+            url = self._remove_transactions_from_paths(self._get_request_url(object_id))
+            self._transaction_invalidated.add((url, descendants))
+            return
+
+        url = self._get_request_url(object_id).rstrip('/')
+        urls = [url, url + '/']
+        root = self._fedora_url.rstrip('/')
+        while url.startswith(root + '/'):
+            url = url.rsplit('/', 1)[0]
+            urls.append(url)
+            urls.append(url + '/')
+        self._metadata_cache.invalidate(urls, descendants=descendants)
+
+    def _version_required(self, object_id):
+        """
+        Applies the active versioning policy to a created or updated resource
+
+        :param object_id:   id of the written object
+        :return:            True if the caller should make a version of the resource right now
+        """
+        policy = versioning.get_versioning_policy(self._options.get('VERSIONING', versioning.ALWAYS))
+        if policy == versioning.NEVER:
+            return False
+
+        if policy == versioning.ALWAYS or (policy == versioning.ONCE_PER_TRANSACTION and not self._in_transaction):
+            return True
+        elif self._in_transaction:
+            # version with the url outside of the transaction after commit
+            url = self._remove_transactions_from_paths(self._get_request_url(object_id))
+            self._transaction_versioned[url] = policy
+        else:
+            self._get_coalescing_versioner().schedule(self._get_request_url(object_id))
+        return False
+
+    def _get_coalescing_versioner(self):
+        if self._coalescing_versioner is not None:
+            return self._coalescing_versioner
+
+        def make_version(object_id):
+            versioning_connection.make_version(object_id, time.time())
+
+        # the versioner runs in its own thread, so it gets its own connection which is never in a transaction
+        versioning_connection = FedoraConnection(self._fedora_url, self._username, self._password, self._options)
+        self._coalescing_versioner = versioning.get_coalescing_versioner(
+            self._fedora_url, make_version, self._options.get('VERSIONING_QUIET_PERIOD', 60))
+        return self._coalescing_versioner
+
+    @staticmethod
+    def dumb_concatenate_url(url, tx_prefix):
+        if url.endswith('/'):
+            url += tx_prefix
+        else:
+            url += "/" + tx_prefix
+        return url
+
+    def _get_transaction_end_url(self, do_commit):
+        return self.dumb_concatenate_url(self._transaction_url,
+                                         'fcr:tx/' + ('fcr:commit' if do_commit else 'fcr:rollback'))
+
+    def _reset_transaction(self):
+        """
+        Leaves the transaction
+
+        :return: tuple of resources versioned and invalidated in the transaction, pass them to _transaction_finished
+        """
+        if self._in_transaction:
+            # the transaction urls stop working, metadata saved in it are refetched from outside of it
+            for metadata in self._transaction_saved:
+                metadata.set_id(self._remove_transactions_from_paths(str(metadata.id)))
+        ret = (self._transaction_versioned, self._transaction_invalidated)
+        self._in_transaction = False
+        self._transaction_url = ''
+        self._transaction_versioned = {}
+        self._transaction_invalidated = set()
+        self._pending_updates = OrderedDict()
+        self._transaction_saved = []
+        return ret
+
+    def _get_pending_key(self, object_id):
+        return self._get_request_url(str(object_id)).rstrip('/')
+
+    def _buffer_update(self, metadata, parent=None):
+        """
+        Records changes of metadata saved inside a transaction instead of sending them to the server,
+        see TRANSACTION_BUFFER option
+
+        :param metadata:    the saved metadata
+        :param parent:      parent uri if the resource has just been created
+        :return:            the metadata
+        """
+        url = self._get_pending_key(metadata.id)
+        pending = self._pending_updates.get(url)
+        if pending is None:
+            pending = self._pending_updates[url] = _PendingUpdate(url, metadata)
+        pending.merge(*metadata.get_changes())
+        pending.metadata = metadata
+        # the parent is known locally, it is maintained by the server and must not get into the update
+        if parent is not None:
+            metadata.add(FEDORA.hasParent, parent)
+        log.debug('Buffered update of %s', url)
+        # the refetch sends the buffered update first, see get_object
+        metadata.mark_saved(self._get_refetch(metadata))
+        self._transaction_saved.append(metadata)
+        return metadata
+
+    def _take_pending_updates(self, object_ids=None, descendants=False):
+        """
+        Removes buffered updates from the buffer
+
+        :param object_ids:  ids of the resources, None for all buffered updates
+        :param descendants: if True, updates of descendants of the resources are taken as well
+        :return:            list of _PendingUpdate
+        """
+        if object_ids is None:
+            urls = list(self._pending_updates)
+        else:
+            keys = [self._get_pending_key(object_id) for object_id in object_ids]
+            urls = [url for url in self._pending_updates
+                    if url in keys or (descendants and any(url.startswith(key + '/') for key in keys))]
+        return [self._pending_updates.pop(url) for url in urls]
+
+    def _transaction_finished(self, do_commit, written):
+        """
+        Processes resources written in a finished transaction
+
+        :param do_commit:   True if the transaction has been committed
+        :param written:     return value of _reset_transaction
+        :return:            list of ids of objects the caller should make a version of
+        """
+        if not do_commit:
+            return []
+        transaction_versioned, transaction_invalidated = written
+        for object_id, descendants in transaction_invalidated:
+            self._invalidate_cached_metadata(object_id, descendants)
+        versioned = []
+        for object_id, policy in transaction_versioned.items():
+            if policy == versioning.COALESCED:
+                self._get_coalescing_versioner().schedule(object_id)
+            else:
+                versioned.append(object_id)
+        return versioned
+
+    def _get_request_url(self, object_id):
+        if ':' in object_id and not object_id.startswith('http'):
+            req_url = self._fedora_url + '/' + object_id
+        else:
+            req_url = urljoin(self._fedora_url, object_id)
+        if self._in_transaction:
+            if not req_url.startswith(self._fedora_url):
+                raise Exception('Could not make request url relative so that it can play part in transaction. ' +
+                                'Object url %s, fedora url %s' % (req_url, self._fedora_url))
+            req_url = req_url[len(self._fedora_url):]
+            if req_url.startswith('/'):
+                req_url = req_url[1:]
+            if req_url.startswith('tx:'):
+                slash_position = req_url.find('/')
+                # TODO: check txid
+                # txid = req_url[:slash_position]
+                req_url = req_url[slash_position + 1:]
+            req_url = self.dumb_concatenate_url(self._transaction_url, req_url)
+        return req_url
+
+    def __eq__(self, other):
+        if not hasattr(other, '_fedora_url'):
+            return False
+        # noinspection PyProtectedMember
+        return self._fedora_url == other._fedora_url
+
+    def _get_credentials(self):
+        """
+        Returns tuple (username, password) used for calls to Fedora or None
+        """
+        if (hasattr(fedora_auth_local, 'Credentials')):
+            credentials = getattr(fedora_auth_local, 'Credentials')
+            if credentials is not None:
+                return credentials.username, credentials.password
+        if self._username:
+            return self._username, self._password
+        else:
+            return None
+
+    def _get_identity(self):
+        """
+        Returns a tuple identifying the user on whose behalf calls to Fedora are made
+        """
+        credentials = self._get_credentials()
+        username = credentials[0] if credentials else None
+        if FedoraUserDelegationMiddleware.is_enabled():
+            return (username,
+                    ','.join(FedoraUserDelegationMiddleware.get_on_behalf_of()),
+                    ','.join(FedoraUserDelegationMiddleware.get_on_behalf_of_groups()))
+        return username, None, None
+
+    def _get_session_key(self):
+        """
+        Returns the key of the http session for the current call. Calls with different credentials or made
+        on behalf of different users get different sessions, so their keep-alive connections are never shared
+        """
+        credentials = self._get_credentials()
+        if credentials:
+            # the password is a part of the key so that changed credentials are not served by an old session
+            credentials = (credentials[0], hashlib.sha256((credentials[1] or '').encode('utf-8')).hexdigest())
+        return (self._fedora_url, credentials) + self._get_identity()[1:]
+
+    def get_local_id(self, object_id):
+        if object_id.startswith(self._fedora_url):
+            object_id = object_id[len(self._fedora_url):]
+            if object_id[:1] == '/':
+                object_id = object_id[1:]
+            return object_id
+        return None
+
+
+class FedoraConnection(FedoraConnectionBase):
+    """
+    A connection to fedora server
+    """
+
+    def __init__(self, fedora_url, username=None, password=None, options=None):
+        """
+        creates a new connection, see FedoraConnectionBase for the options
+        """
+        super().__init__(fedora_url, username, password, options)
+
+    @property
+    def _session(self):
+        """
+        the pooled session of the current credentials and delegation
+        """
+        options = self._options
+        return requests.get_session(self._get_session_key(),
+                                    max_sessions=options.get('SESSION_CACHE_SIZE', 16),
+                                    idle_timeout=options.get('SESSION_IDLE_TIMEOUT', 300),
+                                    pool_connections=options.get('CONNECTION_POOL_SIZE', 10),
+                                    pool_maxsize=options.get('CONNECTION_POOL_MAXSIZE', 10),
+                                    pool_block=options.get('CONNECTION_POOL_BLOCK', False),
+                                    max_retries=options.get('CONNECTION_MAX_RETRIES', 0),
+                                    auth=self._get_credentials())
+
     def create_objects(self, data):
         """
         create new objects in Fedora repository
@@ -55,51 +790,58 @@ class FedoraConnection:
                         metadata:  RDFMetadata (must contain FEDORA:hasParent property)
                         bitstream: optional bitstream to upload
                     }
-        :return: list of modified metadata received from server.
-                 Each is of type RDFMetadata and has 'id' property filled
+        :return: list of modified metadata in the order of data. Each is of type RDFMetadata and has 'id'
+                 property filled. Server-managed triples are fetched lazily, see RDFMetadata.mark_saved
+
+        The resources are created in parallel. If a resource's parent is created in the same batch
+        (FEDORA:hasParent equals the parent's id or parent's FEDORA:hasParent + '/' + parent's slug),
+        it is created after the parent and its FEDORA:hasParent is set to the parent's new id.
+
+        :raise BatchWriteException  if some resources of the batch could not be created. If the batch has
+                                    just one resource, the original exception is raised instead
         """
-        metadata_from_server = []
-        for item in data:
-            metadata = item['metadata']
-            parent_url = metadata[FEDORA.hasParent]
-            if not parent_url:
-                parent_url = ''
-            else:
-                parent_url = str(parent_url[0])
-                del metadata[FEDORA.hasParent]
-            parent_url = self._get_request_url(parent_url)
+        data = list(data)
 
-            if item['bitstream'] is not None:
-                created_object_meta = self._create_object_from_bitstream(parent_url, item['bitstream'], item['slug'])
-                self._update_single_resource(created_object_meta.id, metadata)
-            else:
-                created_object_meta = self._create_object_from_metadata(parent_url, metadata, item['slug'])
+        def create(item, parent_metadata):
+            if parent_metadata is not None:
+                item['metadata'][FEDORA.hasParent] = rdflib.URIRef(parent_metadata.id)
+            return self._create_single_resource(item)
+
+        return self._run_batch(create, data, self._get_create_dependencies(data))
 
-            metadata_from_server.append(created_object_meta)
+    def _create_single_resource(self, item):
+        metadata, parent, parent_url = self._prepare_create(item)
 
-        return metadata_from_server
+        if item['bitstream'] is not None:
+            created_object_id = self._create_object_from_bitstream(parent_url, item['bitstream'], item['slug'])
+            metadata.set_id(created_object_id)
+            return self._update_single_resource(created_object_id, metadata, parent=parent)
+        else:
+            return self._create_object_from_metadata(parent_url, metadata, item['slug'], parent)
+
+    def _run_batch(self, func, data, depends_on=None):
+        # a transaction in Fedora is bound to a single session that must not be used concurrently
+        concurrency = 1 if self._in_transaction else self._options.get('WRITE_CONCURRENCY', 4)
+        results, errors = run_tasks(func, data, concurrency, depends_on)
+        return self._batch_results(data, results, errors)
 
     def _create_object_from_bitstream(self, parent_url, bitstream, slug):
         log.info('Creating child from bitstream in %s', parent_url)
         try:
-            # TODO: this is because of Content-Length header, need to handle it more intelligently
-            data = bitstream.stream.read()
-            headers = {'Content-Type' : bitstream.mimetype}
-            if bitstream.filename:
-                filename_header = 'filename="%s"' % quote(os.path.basename(bitstream.filename).encode('utf-8'))
-                headers['Content-Disposition'] = 'attachment; ' + filename_header
+            headers = {}
             if slug:
                 headers['SLUG'] = slug
-            resp = requests.post(parent_url, data, headers=headers, auth=self._get_auth())
-            created_object_id = resp.text
+            resp, digest = self._upload_bitstream(self._session.post, parent_url, bitstream, headers)
+            if resp.status_code >= 400:
+                raise requests.HTTPError("Resource not created, error code %s : %s" % (resp.status_code, resp.content))
+
+            created_object_id = self._get_created_object_id(resp)
+            if digest:
+                self._verify_upload_digest(created_object_id, digest)
 
             # do not make a version as this will be done after metadata are uploaded ...
 
-            # need to get the metadata from the server as otherwise we would not be able to update the resource
-            # later (Fedora mandates that last modification time in sent data is the same as last modification
-            # time in the metadata on server)
-            created_object_meta = list(self.get_object(created_object_id))[0]
-            return created_object_meta
+            return created_object_id
 
         except HTTPError as e:
             log.error("%s : %s", e.msg, e.fp.read())
@@ -107,19 +849,56 @@ class FedoraConnection:
 
     def _update_object_bitstream(self, url, bitstream):
         try:
-            # TODO: this is because of Content-Length header, need to handle it more intelligently
-            data = bitstream.stream.read()
-            headers = {'Content-Type': bitstream.mimetype}
-            if bitstream.filename:
-                filename_header = 'filename="%s"' % quote(os.path.basename(bitstream.filename).encode('utf-8'))
-                headers['Content-Disposition'] = 'attachment; ' + filename_header
-            requests.put(url, data, headers=headers, auth=self._get_auth())
+            resp, digest = self._upload_bitstream(self._session.put, url, bitstream, {})
+            if resp.status_code >= 400:
+                raise requests.HTTPError("Bitstream not updated, error code %s : %s" % (resp.status_code,
+                                                                                       resp.content))
+            if digest:
+                self._verify_upload_digest(url, digest)
 
         except HTTPError as e:
             log.error("%s : %s", e.msg, e.fp.read())
             raise
 
-    def _create_object_from_metadata(self, parent_url, metadata, slug):
+    def _upload_bitstream(self, send, url, bitstream, headers):
+        """
+        Streams the bitstream to the server in chunks. Content-Length is taken from the size of the bitstream,
+        if it is not known, chunked transfer encoding is used.
+
+        :param send:        session method to call (post or put)
+        :param url:         url to send the bitstream to
+        :param bitstream:   TypedStream
+        :param headers:     additional headers
+        :return:            tuple (response, digest). Digest is a tuple (algorithm, hex digest) if it has been
+                            computed during the upload and needs to be verified, None otherwise
+        """
+        headers, computed_algorithm = self._get_upload_headers(bitstream, headers)
+
+        size = bitstream.size
+        upload = _UploadStream(bitstream.stream, size, computed_algorithm)
+        if size is None:
+            body = upload.chunks()
+        elif size == 0:
+            body = b''
+        else:
+            body = upload
+
+        resp = send(url, body, headers=headers, timeout=self._get_timeout('upload'))
+
+        if computed_algorithm:
+            return resp, (computed_algorithm, upload.hexdigest())
+        return resp, None
+
+    def _verify_upload_digest(self, object_id, digest):
+        algorithm, hexdigest = digest
+        if algorithm != 'sha1':
+            log.warning('Can not verify %s digest of uploaded %s, Fedora stores only sha1 digests',
+                        algorithm, object_id)
+            return
+        metadata = next(self.get_object(object_id, fetch_child_metadata=False))
+        self._check_upload_digest(object_id, hexdigest, metadata)
+
+    def _create_object_from_metadata(self, parent_url, metadata, slug, parent=None):
         payload = str(metadata)
         log.info('Creating child in %s', parent_url)
         log.debug("    payload %s", payload)
@@ -127,20 +906,21 @@ class FedoraConnection:
             headers = {'Content-Type' : 'text/turtle; encoding=utf-8'}
             if slug:
                 headers['SLUG'] = slug
-            resp = requests.post(parent_url, payload.encode('utf-8'), headers=headers, auth=self._get_auth())
+            resp = self._session.post(parent_url, payload.encode('utf-8'), headers=headers,
+                                           timeout=self._get_timeout('write'))
             if resp.status_code >= 400:
                 # print(payload)
                 raise requests.HTTPError("Resource not created, error code %s : %s" % (resp.status_code, resp.content))
-            created_object_id = resp.text
+            created_object_id = self._get_created_object_id(resp)
 
-            # make a version
-            self.make_version(created_object_id, time.time())
+            self._invalidate_cached_metadata(created_object_id)
+            self._version_written(created_object_id)
 
-            # need to get the metadata from the server as otherwise we would not be able to update the resource
-            # later (Fedora mandates that last modification time in sent data is the same as last modification
-            # time in the metadata on server)
-            created_object_meta = list(self.get_object(created_object_id))[0]
-            return created_object_meta
+            # do not refetch the metadata, they are the same as those sent apart from server-managed triples
+            # which are fetched only when someone needs them
+            metadata.set_id(created_object_id)
+            self._mark_saved(metadata, resp, parent)
+            return metadata
 
         except HTTPError as e:
             log.error("%s : %s", e.msg, e.fp.read())
@@ -151,45 +931,83 @@ class FedoraConnection:
         Update objects in repository
 
         :param data: Same as in create_objects, but must have 'id' property non-null
-        :return:     list of modified metadata received from server.
-                     Each is of type RDFMetadata and has 'id' property filled
+        :return:     list of modified metadata in the order of data. Each is of type RDFMetadata and has 'id'
+                     property filled. Server-managed triples are fetched lazily, see RDFMetadata.mark_saved
+        :raise BatchWriteException  if some resources of the batch could not be updated. If the batch has
+                                    just one resource, the original exception is raised instead
         """
-        metadata_from_server = []
-        for item in data:
+        def update(item, _):
             metadata = item['metadata']
             url = self._get_request_url(metadata.id)
-            metadata_from_server.append(self._update_single_resource(url, metadata, item['bitstream']))
+            return self._update_single_resource(url, metadata, item['bitstream'])
 
-        return metadata_from_server
+        return self._run_batch(update, list(data))
 
-    def _update_single_resource(self, url, metadata, bitstream=None):
-        payload = metadata.serialize_sparql()
+    def _update_single_resource(self, url, metadata, bitstream=None, parent=None):
+        if bitstream is None and parent is None and not metadata.has_changes():
+            log.debug("Object %s not changed, not updating", url)
+            return metadata
         log.info("Updating object %s", url)
-        log.debug("      payload %s", payload.decode('utf-8'))
-        # print(payload.decode('utf-8'))
         try:
             if bitstream is not None:
                 self._update_object_bitstream(url, bitstream)
 
-            resp = requests.patch(url + "/fcr:metadata", data=payload,
-                                  headers={'Content-Type': 'application/sparql-update; encoding=utf-8'},
-                                  auth=self._get_auth())
-            log.debug('Response: ', resp.content)
-            if resp.status_code // 100 != 2:
-                raise Exception('Error updating resource in Fedora: %s' % resp.content)
-            self.make_version(metadata.id, time.time())
+            if self._in_transaction and self._options.get('TRANSACTION_BUFFER', True):
+                return self._buffer_update(metadata, parent)
 
-            # need to get the metadata from the server as otherwise we would not be able to update the resource
-            # later (Fedora mandates that last modification time in sent data is the same as last modification
-            # time in the metadata on server)
-            created_object_meta = list(self.get_object(metadata.id))[0]
+            resp = self._patch_metadata(url, metadata, metadata.serialize_sparql())
 
-            return created_object_meta
+            # sparql update does not check last modification time, so there is no need to refetch the metadata.
+            # Server-managed triples are fetched only when someone needs them
+            self._mark_saved(metadata, resp, parent)
+            return metadata
 
         except HTTPError as e:
             log.error("%s : %s", e.msg, e.fp.read())
             raise
 
+    def _patch_metadata(self, url, metadata, payload):
+        if log.isEnabledFor(logging.DEBUG):
+            # decoding a large update is not for free
+            log.debug("      payload %s", payload.decode('utf-8'))
+        resp = self._session.patch(url + "/fcr:metadata", data=payload,
+                                   headers={'Content-Type': 'application/sparql-update; encoding=utf-8'},
+                                        timeout=self._get_timeout('write'))
+        log.debug('Response: %s', resp.content)
+        self._invalidate_cached_metadata(metadata.id)
+        if resp.status_code // 100 != 2:
+            raise Exception('Error updating resource in Fedora: %s' % resp.content)
+        self._version_written(metadata.id)
+        return resp
+
+    def _flush_pending_updates(self, object_ids=None):
+        """
+        Sends updates buffered in the transaction to the server, see _buffer_update
+
+        :param object_ids:  ids of the resources whose updates should be sent, None for all
+        :raise BatchWriteException  if some of the updates could not be sent
+        """
+        pending = self._take_pending_updates(object_ids)
+        if not pending:
+            return
+
+        def send(update, _):
+            if update.is_empty():
+                return
+            log.info("Sending buffered update of %s", update.url)
+            payload = update.metadata.serialize_sparql((update.removed, update.added))
+            resp = self._patch_metadata(update.url, update.metadata, payload)
+            update.metadata.etag = resp.headers.get('ETag')
+            update.metadata.last_modified = resp.headers.get('Last-Modified')
+
+        # the updates are sent inside the transaction, which is bound to a single session that must not be used
+        # concurrently
+        results, errors = run_tasks(send, pending, 1)
+        self._batch_results(pending, results, errors)
+
+    def _get_refetch(self, metadata):
+        return lambda: next(self.get_object(str(metadata.id)))
+
     def get_object(self, object_id, fetch_child_metadata=True):
         """
         Fetches the resource with the given object_id parameter
@@ -200,70 +1018,131 @@ class FedoraConnection:
         :return:    the RDFMetadata of the fetched object
         """
         try:
-            req_url = self._get_request_url(object_id)
-            log.info('Requesting url %s' % req_url)
-            headers = {
-                'Accept' : 'application/rdf+xml; encoding=utf-8',
-            }
-            if fetch_child_metadata:
-                headers['Prefer'] = 'return=representation; ' + \
-                                    'include="http://fedora.info/definitions/v4/repository#EmbedResources"'
-
-            with closing(requests.get(req_url + "/fcr:metadata",
-                                      headers=headers, auth=self._get_auth())) as r:
-
-                g = rdflib.Graph()
-                log.debug("making request to %s", req_url)
-                log.debug(r.headers)
-                log.debug(r.raw)
-                # for chunk in r.iter_content(chunk_size=1024):
-                #     if chunk:
-                #         print("chunk")
-                #         print(chunk)
-                #         r.content += chunk
-                data = r.content.decode('utf-8')
-                if r.status_code // 100 != 2:
-                    raise RepositoryException(url=req_url, code=r.status_code,
-                                              msg='Error accessing repository: %s' % data,
-                                              hdrs=r.headers, fp=None)
+            self._flush_pending_updates([object_id])
+            req_url, headers, cache_lookup = self._prepare_get_object(object_id, fetch_child_metadata)
 
-            log.debug("   ... data %s", data)
-            sys.stdout.flush()
-            g.parse(io.StringIO(data))
-            yield RDFMetadata(req_url, g)
+            log.debug("making request to %s", req_url)
+            with closing(self._read(req_url + "/fcr:metadata", headers)) as r:
+                data = r.content
+
+            yield self._get_metadata_from_response(req_url, r.status_code, r.headers, data, cache_lookup)
 
         except HTTPError as e:
             # log.error("%s: %s : %s", e.code, e.msg, e.fp.read() if e.fp else '')
             raise DoesNotExist(e)
 
+    def get_objects(self, object_ids, fetch_child_metadata=False, concurrency=None):
+        """
+        Fetches many resources in parallel
+
+        :param object_ids:              list of ids
+        :param fetch_child_metadata:    see get_object
+        :param concurrency:             maximum number of requests running at the same time (default
+                                        READ_CONCURRENCY)
+        :return:    tuple (list of RDFMetadata of found resources in the order of object_ids, list of missing ids)
+        """
+        object_ids = list(object_ids)
+
+        def fetch(object_id, _):
+            return next(self.get_object(object_id, fetch_child_metadata=fetch_child_metadata))
+
+        results, errors = run_tasks(fetch, object_ids, self._get_read_concurrency(concurrency))
+        return self._get_objects_results(object_ids, results, errors)
+
+    def get_child_ids(self, object_id):
+        """
+        Lists children of a resource without fetching their metadata
+
+        :param object_id:   id of the container
+        :return:            list of ids of the children
+        """
+        metadata = next(self.get_object(object_id, fetch_child_metadata=False))
+        return [str(child) for child in metadata[LDP.contains]]
+
+    def iter_objects(self, object_ids, page_size=100, concurrency=None):
+        """
+        Fetches metadata of many resources, without embedded children, in parallel. At most page_size resources
+        are being fetched or waiting to be consumed at any time. Resources that do not exist are skipped.
+
+        :param object_ids:      iterable of ids
+        :param page_size:       maximum number of resources fetched ahead of the consumer
+        :param concurrency:     maximum number of requests running at the same time (default READ_CONCURRENCY)
+        :return:                generator of RDFMetadata in the order they arrive
+        """
+        concurrency = self._get_read_concurrency(concurrency)
+        object_ids  = iter(object_ids)
+        context     = ThreadLocalContext()
+
+        def fetch(object_id):
+            with context:
+                try:
+                    return next(self.get_object(object_id, fetch_child_metadata=False))
+                except DoesNotExist:
+                    log.warning('Resource %s does not exist, skipping it', object_id)
+                    return None
+
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        running  = set()
+        try:
+            while True:
+                for object_id in object_ids:
+                    running.add(executor.submit(fetch, object_id))
+                    if len(running) >= page_size:
+                        break
+                if not running:
+                    return
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.result() is not None:
+                        yield future.result()
+        finally:
+            # the consumer might have stopped early
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=True)
+
     def raw_get(self, url):
-        with closing(requests.get(url, auth=self._get_auth())) as r:
+        self._flush_pending_updates([url])
+        with closing(self._read(url)) as r:
             if r.status_code // 100 != 2:
                 raise HTTPError(url, r.status_code, r.content, hdrs=r.headers, fp=None)
 
             return r.content
 
-    def get_bitstream(self, object_id):
-        req_url = self._get_request_url(object_id)
-        log.info("Bitstream request url %s", req_url)
-        return requests.get(req_url, stream=True, auth=self._get_auth()).raw
+    def _read(self, url, headers=None):
+        """
+        GETs the url (an idempotent read), hedging the request if enabled
 
-    def _remove_transactions_from_paths(self, data):
-        # remove transaction from data ... let's do it the simple way even though it is not kosher
-        if self._in_transaction:
-            if not self._transaction_url.startswith(self._fedora_url):
-                raise Exception('Error in getting transaction id: path %s not within fedora REST api %s' %
-                                (self._transaction_url, self._fedora_url))
+        :return:    response with content already read
+        """
+        session = self._session
+        timeout = self._get_timeout('read')
 
-            txid = self._transaction_url[len(self._fedora_url):]
-            if txid.startswith('/'):
-                txid = txid[1:]
-            if not txid.endswith('/'):
-                txid += '/'
+        def get():
+            return session.get(url, headers=dict(headers or {}), timeout=timeout)
 
-            # as txid is based on uuid, let's hope it occurs only in transactions ...
-            data = data.replace(txid, '')
-        return data
+        if self._use_hedging():
+            return self._hedger.run(get, discard=lambda response: response.close())
+        return get()
+
+    def get_bitstream(self, object_id, range=None, if_range=None):
+        """
+        Returns a stream with the content of a binary resource
+
+        :param object_id:   id of the binary resource
+        :param range:       optional value of the Range header, for example 'bytes=0-1023', passed to Fedora
+        :param if_range:    optional value of the If-Range header (ETag or date), passed to Fedora
+        :return:            the raw http response. Its status is 206 and its headers contain Content-Range if
+                            Fedora honoured the range, 200 if the whole content is returned
+        """
+        req_url = self._get_request_url(object_id)
+        log.info("Bitstream request url %s, range %s", req_url, range)
+        headers = {}
+        if range:
+            headers['Range'] = range
+            if if_range:
+                headers['If-Range'] = if_range
+        return self._session.get(req_url, stream=True, headers=headers, timeout=self._get_timeout('download')).raw
 
     def delete(self, object_id):
         """
@@ -274,7 +1153,117 @@ class FedoraConnection:
         """
         req_url = self._get_request_url(object_id)
         log.info('Deleting resource with url %s', req_url)
-        requests.delete(req_url, auth=self._get_auth())
+        # buffered updates of deleted resources are useless
+        self._take_pending_updates([object_id], descendants=True)
+        self._session.delete(req_url, timeout=self._get_timeout('write'))
+        self._invalidate_cached_metadata(object_id, descendants=True)
+
+    def delete_tree(self, object_id, purge_tombstones=True, concurrency=None,
+                    before_delete=None, after_delete=None):
+        """
+        Deletes a resource together with all its descendants. The tree is walked in parallel and the resources
+        are deleted leaves first, so that Fedora never deletes a large subtree in a single request.
+
+        :param object_id:           id of the root of the tree
+        :param purge_tombstones:    if True, the fcr:tombstone left by each deleted resource is removed right away
+        :param concurrency:         maximum number of requests running at the same time (default WRITE_CONCURRENCY).
+                                    Inside a transaction the requests are always made serially
+        :param before_delete:       optional callable(RDFMetadata) called before a resource is deleted
+        :param after_delete:        optional callable(RDFMetadata) called after a resource has been deleted
+        :return:                    list of ids of deleted resources, the root is the last one
+        :raise DeleteTreeException  if some resources could not be fetched or deleted
+        """
+        if concurrency is None:
+            concurrency = self._options.get('WRITE_CONCURRENCY', 4)
+        if self._in_transaction:
+            concurrency = 1
+        # buffered updates of deleted resources are useless
+        self._take_pending_updates([object_id], descendants=True)
+
+        def fetch(node):
+            try:
+                return next(self.get_object(node, fetch_child_metadata=False))
+            except DoesNotExist:
+                # deleted in the meantime
+                return None
+
+        def delete(node):
+            self._delete_resource(node, purge_tombstones)
+
+        parents   = {str(object_id): None}
+        remaining = {}                          # id -> number of children not yet deleted
+        metadata  = {}                          # id -> RDFMetadata of fetched and not yet deleted resources
+        to_fetch  = deque([str(object_id)])
+        to_delete = []                          # deleting first keeps the number of fetched resources low
+        deleted   = []
+        errors    = {}
+        context   = ThreadLocalContext()
+
+        def call(func, node):
+            with context:
+                return func(node)
+
+        def node_removed(node):
+            parent = parents.pop(node)
+            if parent is not None:
+                remaining[parent] -= 1
+                if not remaining[parent]:
+                    to_delete.append(parent)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            running = {}
+            while to_fetch or to_delete or running:
+                while len(running) < concurrency and (to_fetch or to_delete):
+                    if to_delete:
+                        node = to_delete.pop()
+                        if before_delete is not None:
+                            before_delete(metadata[node])
+                        running[executor.submit(call, delete, node)] = (delete, node)
+                    else:
+                        node = to_fetch.popleft()
+                        running[executor.submit(call, fetch, node)] = (fetch, node)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    action, node = running.pop(future)
+                    if future.exception() is not None:
+                        log.error('Could not delete %s: %s', node, future.exception())
+                        errors[node] = future.exception()
+                        metadata.pop(node, None)
+                    elif action is fetch and future.result() is None:
+                        node_removed(node)
+                    elif action is fetch:
+                        metadata[node] = future.result()
+                        children = [str(child) for child in metadata[node][LDP.contains]]
+                        remaining[node] = len(children)
+                        for child in children:
+                            parents[child] = node
+                        to_fetch.extend(children)
+                        if not children:
+                            to_delete.append(node)
+                    else:
+                        deleted.append(node)
+                        node_metadata = metadata.pop(node)
+                        if after_delete is not None:
+                            after_delete(node_metadata)
+                        node_removed(node)
+
+        self._invalidate_cached_metadata(object_id, descendants=True)
+        if errors:
+            raise DeleteTreeException(deleted, errors)
+        return deleted
+
+    def _delete_resource(self, object_id, purge_tombstone):
+        req_url = self._get_request_url(object_id)
+        urls = [req_url, req_url.rstrip('/') + '/fcr:tombstone'] if purge_tombstone else [req_url]
+        for url in urls:
+            log.debug('Deleting %s', url)
+            resp = self._session.delete(url, timeout=self._get_timeout('write'))
+            # 404 and 410 (tombstone) mean the resource has already been deleted
+            if resp.status_code // 100 != 2 and resp.status_code not in (404, 410):
+                raise RepositoryException(url=url, code=resp.status_code,
+                                          msg='Error deleting resource: %s' % resp.content.decode('utf-8', 'replace'),
+                                          hdrs=resp.headers, fp=None)
 
     def make_version(self, object_id, version):
         """
@@ -284,58 +1273,51 @@ class FedoraConnection:
                                  which will be appended after repository_url
         :param version:          the id of the version, [a-zA-Z_][a-zA-Z0-9_]*
         """
-        requests.post(self._get_request_url(object_id) + '/fcr:versions',
-                      headers={'Slug': 'snapshot_at_%s' % version}, auth=self._get_auth())
+        self._flush_pending_updates([object_id])
+        self._session.post(self._get_request_url(object_id) + '/fcr:versions',
+                           headers={'Slug': 'snapshot_at_%s' % version}, timeout=self._get_timeout('write'))
+
+    def _version_written(self, object_id):
+        """
+        Makes a version of a created or updated resource according to the active versioning policy
+
+        :param object_id:   id of the written object
+        """
+        if self._version_required(object_id):
+            self.make_version(object_id, time.time())
 
     def begin_transaction(self):
         tx_prefix = "fcr:tx"
         url = self.dumb_concatenate_url(self._fedora_url, tx_prefix)
         log.info('Requesting transaction, url %s', url)
-        req = requests.post(url, auth=self._get_auth())
+        req = self._session.post(url, timeout=self._get_timeout('write'))
         self._transaction_url = req.headers['Location']
         self._in_transaction = True
 
-    @staticmethod
-    def dumb_concatenate_url(url, tx_prefix):
-        if url.endswith('/'):
-            url += tx_prefix
-        else:
-            url += "/" + tx_prefix
-        return url
-
     def commit(self):
         self._end_transaction(True)
 
     def _end_transaction(self, do_commit):
+        error = None
         try:
             if self._in_transaction:
-                url = self.dumb_concatenate_url(self._transaction_url,
-                                                'fcr:tx/' + ('fcr:commit' if do_commit else 'fcr:rollback'))
+                if do_commit:
+                    try:
+                        self._flush_pending_updates()
+                    except Exception as e:
+                        log.error('Could not send buffered updates, rolling back the transaction')
+                        error, do_commit = e, False
+                url = self._get_transaction_end_url(do_commit)
                 log.info('Finishing transaction, url %s', url)
-                requests.post(url, auth=self._get_auth())
+                self._session.post(url, timeout=self._get_timeout('write'))
         finally:
-            self._in_transaction = False
-            self._transaction_url = ''
+            written = self._reset_transaction()
 
-    def _get_request_url(self, object_id):
-        if ':' in object_id and not object_id.startswith('http'):
-            req_url = self._fedora_url + '/' + object_id
-        else:
-            req_url = urljoin(self._fedora_url, object_id)
-        if self._in_transaction:
-            if not req_url.startswith(self._fedora_url):
-                raise Exception('Could not make request url relative so that it can play part in transaction. ' +
-                                'Object url %s, fedora url %s' % (req_url, self._fedora_url))
-            req_url = req_url[len(self._fedora_url):]
-            if req_url.startswith('/'):
-                req_url = req_url[1:]
-            if req_url.startswith('tx:'):
-                slash_position = req_url.find('/')
-                # TODO: check txid
-                # txid = req_url[:slash_position]
-                req_url = req_url[slash_position + 1:]
-            req_url = self.dumb_concatenate_url(self._transaction_url, req_url)
-        return req_url
+        for object_id in self._transaction_finished(do_commit, written):
+            self.make_version(object_id, time.time())
+
+        if error is not None:
+            raise error
 
     def rollback(self):
         self._end_transaction(False)
@@ -344,32 +1326,11 @@ class FedoraConnection:
         if isinstance(data, str):
             data = data.encode('utf-8')
         try:
-            req = requests.put(self._get_request_url(url), data=data, headers={'Content-Type': content_type},
-                               auth=self._get_auth())
+            self._flush_pending_updates([url])
+            req = self._session.put(self._get_request_url(url), data=data, headers={'Content-Type': content_type},
+                                    timeout=self._get_timeout('write'))
             log.debug(req.text)
+            self._invalidate_cached_metadata(url)
         except HTTPError as e:
             log.error("Error when calling direct_put at {0}: {1}".format(url, e.fp.read()))
 
-    def __eq__(self, other):
-        if not hasattr(other, '_fedora_url'):
-            return False
-        # noinspection PyProtectedMember
-        return self._fedora_url == other._fedora_url
-
-    def _get_auth(self):
-        if (hasattr(fedora_auth_local, 'Credentials')):
-            credentials = getattr(fedora_auth_local, 'Credentials')
-            if credentials is not None:
-                return HTTPBasicAuth(credentials.username, credentials.password)
-        if self._username:
-            return HTTPBasicAuth(self._username, self._password)
-        else:
-            return None
-
-    def get_local_id(self, object_id):
-        if object_id.startswith(self._fedora_url):
-            object_id = object_id[len(self._fedora_url):]
-            if object_id[:1] == '/':
-                object_id = object_id[1:]
-            return object_id
-        return None
\ No newline at end of file
@@ -1,5 +1,8 @@
 from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.base.client import BaseDatabaseClient
+from django.db.backends.base.creation import BaseDatabaseCreation
 from django.db.backends.base.features import BaseDatabaseFeatures
+from django.db.backends.base.introspection import BaseDatabaseIntrospection
 from ..connection import FedoraConnection
 
 __author__ = 'simeki'
@@ -11,6 +14,9 @@ class DatabaseFeatures(BaseDatabaseFeatures):
 
 class DatabaseOps:
 
+    def __init__(self, connection=None):
+        self.connection = connection
+
     def max_name_length(self):
         return 100000
 
@@ -27,11 +33,18 @@ class FakeValidation:
 
 
 class DatabaseWrapper(BaseDatabaseWrapper):
+    # django 2+ instantiates the helper classes in BaseDatabaseWrapper.__init__, older versions ignore them
+    client_class        = BaseDatabaseClient
+    creation_class      = BaseDatabaseCreation
+    features_class      = DatabaseFeatures
+    introspection_class = BaseDatabaseIntrospection
+    ops_class           = DatabaseOps
 
     def __init__(self, *args, **kwargs):
         super(DatabaseWrapper, self).__init__(*args, **kwargs)
         self.features = DatabaseFeatures(self)
         self._commit_on_exit = False
+        self._async_connection = None
         self.ops = DatabaseOps()
 
     def get_connection_params(self):
@@ -40,7 +53,22 @@ class DatabaseWrapper(BaseDatabaseWrapper):
     def get_new_connection(self, conn_params):
         return FedoraConnection(self.settings_dict['REPO_URL'],
                                 self.settings_dict.get('USERNAME', None),
-                                self.settings_dict.get('PASSWORD', None))
+                                self.settings_dict.get('PASSWORD', None),
+                                options=self.settings_dict)
+
+    @property
+    def async_connection(self):
+        """
+        AsyncFedoraConnection to the repository, requires httpx. It is created lazily without
+        calling connect() so that it can be used inside an event loop.
+        """
+        if self._async_connection is None:
+            from ..async_connection import AsyncFedoraConnection
+            self._async_connection = AsyncFedoraConnection(self.settings_dict['REPO_URL'],
+                                                           self.settings_dict.get('USERNAME', None),
+                                                           self.settings_dict.get('PASSWORD', None),
+                                                           options=self.settings_dict)
+        return self._async_connection
 
     def _set_autocommit(self, autocommit):
         pass
@@ -78,6 +106,11 @@ class DatabaseWrapper(BaseDatabaseWrapper):
     def validation(self):
         return FakeValidation()
 
+    @validation.setter
+    def validation(self, _value):
+        # set by BaseDatabaseWrapper.__init__ of django 2+, the fake validation is used instead
+        pass
+
 
 def import_class( kls ):
     parts = kls.split('.')
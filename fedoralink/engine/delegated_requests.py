@@ -1,12 +1,36 @@
 import traceback
 
 import logging
+import threading
+import time
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+
 import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
 
 from fedoralink.middleware import FedoraUserDelegationMiddleware, FedoraProfillingMiddleware
 
 HTTPError = requests.HTTPError
 
+log = logging.getLogger('fedoralink.engine.delegated_requests')
+
+
+def add_delegation_headers(headers):
+    """
+    Adds On-Behalf-Of headers of the user the current thread works for
+
+    :param headers:     dictionary of request headers, modified in place
+    :return:            the headers
+    """
+    if FedoraUserDelegationMiddleware.is_enabled():
+        headers['On-Behalf-Of'] = ','.join(FedoraUserDelegationMiddleware.get_on_behalf_of())
+        groups = ','.join(FedoraUserDelegationMiddleware.get_on_behalf_of_groups())
+        if groups:
+            headers['On-Behalf-Of-Django-Groups'] = groups
+    return headers
+
 
 def wrapper(func):
     import time
@@ -18,11 +42,7 @@ def wrapper(func):
         try:
             if 'headers' not in kwargs:
                 kwargs['headers'] = {}
-            if FedoraUserDelegationMiddleware.is_enabled():
-                kwargs['headers']['On-Behalf-Of'] = ','.join(FedoraUserDelegationMiddleware.get_on_behalf_of())
-                groups = ','.join(FedoraUserDelegationMiddleware.get_on_behalf_of_groups())
-                if groups:
-                    kwargs['headers']['On-Behalf-Of-Django-Groups'] = groups
+            add_delegation_headers(kwargs['headers'])
             return func(*args, **kwargs)
         finally:
             if do_debug:
@@ -37,3 +57,86 @@ put = wrapper(requests.put)
 get = wrapper(requests.get)
 patch = wrapper(requests.patch)
 delete = wrapper(requests.delete)
+
+
+class PooledSession:
+    """
+    A keep-alive http session with a bounded connection pool. It has the same post/put/get/patch/delete
+    interface as this module, including On-Behalf-Of header injection and profiling.
+
+    The session is shared between threads - urllib3 connection pools are thread-safe. Cookies are never stored
+    so that a servlet session created for one user's request can not be picked up by another user's request.
+    Requests are authenticated with the credentials the session has been created with.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, max_retries=0, auth=None):
+        """
+        :param pool_connections:    number of hosts for which a connection pool is kept
+        :param pool_maxsize:        maximum number of keep-alive connections kept per host
+        :param pool_block:          if True, block when all connections to a host are in use, otherwise
+                                    open a new (not pooled) connection
+        :param max_retries:         number of retries on failed connects
+        :param auth:                optional tuple (username, password) for http basic authentication
+        """
+        self._session = requests.Session()
+        self._session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        if auth:
+            self._session.auth = HTTPBasicAuth(*auth)
+        self.last_used = time.monotonic()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                              pool_block=pool_block, max_retries=max_retries)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        self.post   = wrapper(self._session.post)
+        self.put    = wrapper(self._session.put)
+        self.get    = wrapper(self._session.get)
+        self.patch  = wrapper(self._session.patch)
+        self.delete = wrapper(self._session.delete)
+
+    def close(self):
+        self._session.close()
+
+
+_sessions      = OrderedDict()      # key -> PooledSession, the least recently used first
+_sessions_lock = threading.Lock()
+
+
+def get_session(key, max_sessions=None, idle_timeout=None, **pool_options):
+    """
+    Returns a process-wide PooledSession registered under the given key, creating it if necessary. Django
+    recreates database connections on every request, so the session must outlive FedoraConnection instances
+    for the keep-alive connections to be reused.
+
+    Sessions not used for idle_timeout seconds are closed, and so are the least recently used ones when there
+    are more than max_sessions of them. A closed session still works if someone holds it, it just opens
+    new connections.
+
+    :param key:             key of the session, for example the repository url and the credentials
+    :param max_sessions:    maximum number of sessions kept, None for unlimited
+    :param idle_timeout:    number of seconds after which an unused session is closed, None for never
+    :param pool_options:    arguments of PooledSession constructor, used only when the session is created
+    :return:                instance of PooledSession
+    """
+    now = time.monotonic()
+    evicted = []
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = PooledSession(**pool_options)
+            log.debug('Created pooled session, %d sessions open', len(_sessions))
+        else:
+            _sessions.move_to_end(key)
+        session.last_used = now
+
+        while len(_sessions) > 1:
+            oldest_key, oldest = next(iter(_sessions.items()))
+            over_limit = max_sessions is not None and len(_sessions) > max_sessions
+            expired = idle_timeout is not None and now - oldest.last_used > idle_timeout
+            if not (over_limit or expired):
+                break
+            evicted.append(_sessions.pop(oldest_key))
+
+    for s in evicted:
+        s.close()
+    return session
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from fedoralink.executor import ThreadLocalContext
+
+log = logging.getLogger('fedoralink.engine.hedging')
+
+
+class LatencyTracker:
+    """
+    Keeps latencies of the last `window` requests and computes their percentiles
+    """
+
+    def __init__(self, window=1000):
+        self._latencies = deque(maxlen=window)
+        self._lock      = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, percent):
+        """
+        :param percent:     0-100
+        :return:            latency in seconds or None if no latencies have been recorded yet
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))]
+
+    def __len__(self):
+        return len(self._latencies)
+
+
+class Hedger:
+    """
+    Sends hedged requests: if the response to a request does not arrive within the given percentile of recent
+    latencies, a duplicate request is sent and the first response wins. Use only for idempotent requests.
+
+    The delay is measured from the moment the primary request starts, not from when it has been submitted
+    to a busy worker pool. Duplicate requests run in their own threads and at most max_hedges of them are
+    outstanding, when the limit is reached slow requests are not hedged.
+
+    Counters in `stats`:
+        requests        number of hedged calls
+        hedged          number of calls for which the duplicate request was sent
+        hedge_wins      number of calls answered by the duplicate request
+        hedges_skipped  number of slow calls not hedged because of max_hedges
+    """
+
+    # number of recorded latencies needed before the percentile is trusted, max_delay is used until then
+    MIN_SAMPLES = 20
+
+    def __init__(self, percentile=95, min_delay=0.05, max_delay=2.0, max_workers=32, max_hedges=8):
+        """
+        :param percentile:      percentile of recent latencies after which the duplicate request is sent
+        :param min_delay:       minimal delay before the duplicate request, in seconds
+        :param max_delay:       maximal delay before the duplicate request, in seconds
+        :param max_workers:     maximal number of threads making the primary blocking requests
+        :param max_hedges:      maximal number of duplicate requests outstanding at the same time
+        """
+        self.percentile = percentile
+        self.min_delay  = min_delay
+        self.max_delay  = max_delay
+        self.latencies  = LatencyTracker()
+        self.stats      = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'hedges_skipped': 0}
+        self._stats_lock = threading.Lock()
+        self._executor  = ThreadPoolExecutor(max_workers=max_workers)
+        # hedges never wait in a queue: a slot is taken before a hedge is submitted
+        self._hedge_executor = ThreadPoolExecutor(max_workers=max_hedges)
+        self._hedge_slots    = threading.BoundedSemaphore(max_hedges)
+
+    def get_delay(self):
+        """
+        Returns the number of seconds after which the duplicate request is sent
+        """
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return self.max_delay
+        return min(self.max_delay, max(self.min_delay, self.latencies.percentile(self.percentile)))
+
+    def _count(self, counter):
+        with self._stats_lock:
+            self.stats[counter] += 1
+
+    def _timed(self, func):
+        start = time.time()
+        ret = func()
+        self.latencies.record(time.time() - start)
+        return ret
+
+    def _take_hedge_slot(self):
+        """
+        Returns True if a duplicate request might be sent, the slot is released by _release_hedge_slot
+        """
+        if self._hedge_slots.acquire(blocking=False):
+            self._count('hedged')
+            return True
+        self._count('hedges_skipped')
+        log.debug('Too many hedged requests outstanding, not hedging')
+        return False
+
+    def _release_hedge_slot(self, _future):
+        self._hedge_slots.release()
+
+    def run(self, func, discard=None):
+        """
+        Calls func() in worker threads, hedging it if needed
+
+        :param func:        callable making the request, it is called with thread-local state of the calling thread
+        :param discard:     optional callable called with the losing result, for example to close the response
+        :return:            the first successful result. If both calls fail, the exception of the first one is raised
+        """
+        self._count('requests')
+        context = ThreadLocalContext()
+        started = threading.Event()
+
+        def call():
+            started.set()
+            with context:
+                return self._timed(func)
+
+        primary = self._executor.submit(call)
+        # the request might wait for a free worker, the delay starts when it is really sent
+        started.wait()
+        done, _ = wait([primary], timeout=self.get_delay())
+        if done or not self._take_hedge_slot():
+            return primary.result()
+
+        log.debug('Request has not finished in %s seconds, sending hedged request', self.get_delay())
+        hedge = self._hedge_executor.submit(call)
+        hedge.add_done_callback(self._release_hedge_slot)
+
+        def discard_result(future):
+            if future.exception() is None:
+                discard(future.result())
+
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner, first_error = self._select_winner(done, first_error)
+            if winner is not None:
+                if winner is hedge:
+                    self._count('hedge_wins')
+                if discard is not None:
+                    for loser in (done | pending) - {winner}:
+                        loser.add_done_callback(discard_result)
+                return winner.result()
+        raise first_error
+
+    @staticmethod
+    def _select_winner(done, first_error):
+        winner = None
+        for future in done:
+            if future.exception() is not None:
+                if first_error is None:
+                    first_error = future.exception()
+            elif winner is None:
+                winner = future
+        return winner, first_error
+
+    async def arun(self, coroutine_function):
+        """
+        Asyncio variant of run
+
+        :param coroutine_function:  coroutine function without parameters making the request
+        :return:                    the first successful result
+        """
+        self._count('requests')
+
+        async def call():
+            start = time.time()
+            ret = await coroutine_function()
+            self.latencies.record(time.time() - start)
+            return ret
+
+        primary = asyncio.ensure_future(call())
+        done, _ = await asyncio.wait([primary], timeout=self.get_delay())
+        if done or not self._take_hedge_slot():
+            return await primary
+
+        hedge = asyncio.ensure_future(call())
+        hedge.add_done_callback(self._release_hedge_slot)
+
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner, first_error = self._select_winner(done, first_error)
+            if winner is not None:
+                if winner is hedge:
+                    self._count('hedge_wins')
+                for loser in pending:
+                    loser.cancel()
+                return winner.result()
+        raise first_error
+
+
+_hedgers      = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(key, **options):
+    """
+    Returns a process-wide Hedger registered under the given key, creating it if necessary
+
+    :param key:         key of the hedger, for example the repository url
+    :param options:     arguments of Hedger constructor, used only when the hedger is created
+    :return:            instance of Hedger
+    """
+    with _hedgers_lock:
+        hedger = _hedgers.get(key)
+        if hedger is None:
+            hedger = _hedgers[key] = Hedger(**options)
+        return hedger
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .authentication.as_user import fedora_auth_local
+from .middleware import FedoraUserDelegationMiddleware, FedoraProfillingMiddleware
+from .versioning import versioning_local
+
+log = logging.getLogger('fedoralink.executor')
+
+
+class DependencyFailed(Exception):
+    """
+    The task has not been run because a task it depends on has failed
+    """
+    pass
+
+
+class ThreadLocalContext:
+    """
+    Snapshot of fedoralink's thread-local state (as_user credentials, On-Behalf-Of delegation, profiling and
+    versioning policy) taken in the calling thread. Use it as a context manager in a worker thread to make
+    calls to Fedora on behalf of the same user and with the same settings.
+    """
+
+    storages = (fedora_auth_local,
+                FedoraUserDelegationMiddleware.thread_local_storage,
+                FedoraProfillingMiddleware.thread_local_storage,
+                versioning_local)
+
+    def __init__(self):
+        self._state = [dict(storage.__dict__) for storage in self.storages]
+        self._original_state = None
+
+    def __enter__(self):
+        self._original_state = [dict(storage.__dict__) for storage in self.storages]
+        self._apply(self._state)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._apply(self._original_state)
+
+    def _apply(self, state):
+        for storage, values in zip(self.storages, state):
+            storage.__dict__.clear()
+            storage.__dict__.update(values)
+
+
+def run_tasks(func, items, concurrency=1, depends_on=None):
+    """
+    Calls func(item, result_of_dependency) for each item, running at most `concurrency` calls at the same time.
+    A task is started only after the task it depends on has successfully finished.
+
+    :param func:            callable(item, result_of_dependency), result_of_dependency is None if the item
+                            does not depend on another one
+    :param items:           list of items
+    :param concurrency:     maximum number of concurrently running tasks. If 1, tasks are run in the calling thread
+    :param depends_on:      optional list, for each item index of the item it depends on or None
+    :return:                tuple (results, errors). Results are in the order of items, None for failed ones.
+                            Errors is a dictionary index of item -> exception
+    """
+    items = list(items)
+    if not items:
+        return [], {}
+    if depends_on is None:
+        depends_on = [None] * len(items)
+
+    results  = [None] * len(items)
+    errors   = {}
+    finished = set()
+    ready    = []
+    children = {}
+    for index, dependency in enumerate(depends_on):
+        if dependency is None:
+            ready.append(index)
+        else:
+            children.setdefault(dependency, []).append(index)
+
+    def task_finished(index):
+        finished.add(index)
+        for child in children.get(index, ()):
+            if index in errors:
+                errors[child] = DependencyFailed('Item %s depends on item %s which failed' % (child, index))
+                task_finished(child)
+            else:
+                ready.append(child)
+
+    def dependency_result(index):
+        dependency = depends_on[index]
+        return results[dependency] if dependency is not None else None
+
+    if concurrency <= 1:
+        while ready:
+            index = ready.pop(0)
+            try:
+                results[index] = func(items[index], dependency_result(index))
+            except Exception as e:
+                errors[index] = e
+            task_finished(index)
+    else:
+        context = ThreadLocalContext()
+
+        def call(index, result_of_dependency):
+            with context:
+                return func(items[index], result_of_dependency)
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as executor:
+            running = {}
+            while ready or running:
+                while ready:
+                    index = ready.pop(0)
+                    running[executor.submit(call, index, dependency_result(index))] = index
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    exception = future.exception()
+                    if exception is not None:
+                        errors[index] = exception
+                    else:
+                        results[index] = future.result()
+                    task_finished(index)
+
+    for index in range(len(items)):
+        if index not in finished:
+            errors[index] = DependencyFailed('Item %s is part of a dependency cycle' % index)
+
+    return results, errors
+
+
+def _find_cycles(depends_on):
+    """
+    Returns set of indices of items that are part of a dependency cycle
+    """
+    in_cycle = set()
+    checked  = set()
+    for start in range(len(depends_on)):
+        chain = []
+        index = start
+        while index is not None and index not in checked and index not in chain:
+            chain.append(index)
+            index = depends_on[index]
+        if index is not None and index in chain:
+            in_cycle.update(chain[chain.index(index):])
+        checked.update(chain)
+    return in_cycle
+
+
+async def run_async_tasks(func, items, concurrency=1, depends_on=None):
+    """
+    Asyncio variant of run_tasks: awaits func(item, result_of_dependency) for each item, running at most
+    `concurrency` calls at the same time. A task is started only after the task it depends on has successfully
+    finished.
+
+    :param func:            coroutine function(item, result_of_dependency)
+    :param items:           list of items
+    :param concurrency:     maximum number of concurrently running tasks
+    :param depends_on:      optional list, for each item index of the item it depends on or None
+    :return:                tuple (results, errors), see run_tasks
+    """
+    items = list(items)
+    if depends_on is None:
+        depends_on = [None] * len(items)
+
+    results   = [None] * len(items)
+    errors    = {}
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    finished  = [asyncio.Event() for _ in items]
+
+    in_cycle = _find_cycles(depends_on)
+    for index in in_cycle:
+        errors[index] = DependencyFailed('Item %s is part of a dependency cycle' % index)
+        finished[index].set()
+
+    async def run(index):
+        dependency = depends_on[index]
+        try:
+            if dependency is not None:
+                await finished[dependency].wait()
+                if dependency in errors:
+                    raise DependencyFailed('Item %s depends on item %s which failed' % (index, dependency))
+            async with semaphore:
+                results[index] = await func(items[index], results[dependency] if dependency is not None else None)
+        except Exception as e:
+            errors[index] = e
+        finally:
+            finished[index].set()
+
+    await asyncio.gather(*[run(index) for index in range(len(items)) if index not in in_cycle])
+    return results, errors
+
+
+async def run_in_thread(func, *args):
+    """
+    Runs a blocking function in the default executor of the event loop with fedoralink's thread-local state
+    of the calling thread, see ThreadLocalContext
+
+    :return:    return value of func
+    """
+    context = ThreadLocalContext()
+
+    def call():
+        with context:
+            return func(*args)
+
+    return await asyncio.get_event_loop().run_in_executor(None, call)
@@ -5,4 +5,11 @@ log = logging.getLogger('fedoralink.indexer')
 class Indexer:
     # abstract method
     def search(self, query, model_class, start, end, facets, ordering, values):
-        raise Exception("Please reimplement this method in inherited classes")
\ No newline at end of file
+        raise Exception("Please reimplement this method in inherited classes")
+
+    def delete_many(self, objs):
+        """
+        Removes objects from the index. Reimplement in inherited classes if the index supports bulk operations
+        """
+        for obj in objs:
+            self.delete(obj)
@@ -12,6 +12,7 @@ from django.conf import settings
 from django.core.mail import mail_admins
 from django.db.models import Q
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
 from elasticsearch.serializer import JSONSerializer
 from rdflib import Literal, URIRef, RDF
 
@@ -22,6 +23,7 @@ from fedoralink.indexer.models import IndexableFedoraObject, fedoralink_classes
 from fedoralink.middleware import FedoraProfillingMiddleware
 from fedoralink.models import FedoraObject
 from fedoralink.rdfmetadata import RDFMetadata
+from fedoralink.term_pool import get_term_pool
 from fedoralink.utils import url2id, id2url
 
 
@@ -86,6 +88,22 @@ class ElasticIndexer(Indexer):
 
         self.es.delete(index=self.index_name, doc_type=doc_type, id=encoded_fedora_id)
 
+    def delete_many(self, objs):
+        actions = []
+        for obj in objs:
+            clz = fedoralink_classes(obj)[0]
+            if not issubclass(clz, IndexableFedoraObject):
+                continue
+            actions.append({
+                '_op_type': 'delete',
+                '_index': self.index_name,
+                '_type': self._get_elastic_class(clz),
+                '_id': base64.b64encode(str(obj.pk).encode('utf-8')).decode('utf-8'),
+            })
+        if actions:
+            # objects that have never been indexed are not an error
+            bulk(self.es, actions, raise_on_error=False)
+
     def reindex(self, obj):
 
         # get the fedoralink's original class from the obj.
@@ -580,18 +598,20 @@ class ElasticIndexer(Indexer):
     @staticmethod
     def build_instance(doc, id2fld):
         source = doc['_source']
-        metadata = RDFMetadata(source['_fedora_id'])
+        pool = get_term_pool()
+        fedora_id = pool.uri(source['_fedora_id'])
 
-        metadata.rdf_metadata.set((metadata.id, FEDORA.hasParent, URIRef(source['_fedora_parent'])))
+        triples = [(fedora_id, pool.term(FEDORA.hasParent), pool.uri(source['_fedora_parent']))]
+        rdf_type = pool.term(RDF.type)
         for x in source['_fedora_type']:
-            metadata.rdf_metadata.add((metadata.id, RDF.type, URIRef(x)))
+            triples.append((fedora_id, rdf_type, pool.uri(x)))
 
         for fld, field_value in source.items():
             if fld in ('_fedora_type', '_fedora_parent', '_fedora_id', '_fedoralink_model', '_fedora_created',
                        '_fedora_last_modified'):
                 continue
 
-            fld = id2url(fld)
+            fld = pool.uri(id2url(fld))
             if isinstance(field_value, dict):
                 # TODO: nested !!!
                 for lang, val in field_value.items():
@@ -599,12 +619,14 @@ class ElasticIndexer(Indexer):
                         continue
                     if lang == 'null':
                         lang = None
-                    metadata.rdf_metadata.add((metadata.id, URIRef(fld), Literal(val, lang=lang)))
+                    triples.append((fedora_id, fld, pool.literal(val, lang=lang)))
             elif isinstance(field_value, list) or isinstance(field_value, tuple):
                 for val in field_value:
-                    metadata.rdf_metadata.add((metadata.id, URIRef(fld), Literal(val)))
+                    triples.append((fedora_id, fld, pool.literal(val)))
             else:
-                metadata.rdf_metadata.add((metadata.id, URIRef(fld), Literal(field_value)))
+                triples.append((fedora_id, fld, pool.literal(field_value)))
+
+        metadata = RDFMetadata(fedora_id, triples)
 
         highlight = {}
         for k, v in doc.get('highlight', {}).items():
@@ -12,6 +12,7 @@ from rdflib import Literal, XSD, URIRef
 from fedoralink.fedorans import FEDORA
 from fedoralink.forms import LangFormTextField, LangFormTextAreaField, MultiValuedFedoraField, GPSField, \
     FedoraChoiceField, LinkedField
+from fedoralink.term_pool import get_term_pool
 from fedoralink.utils import StringLikeList, TypedStream
 
 
@@ -75,7 +76,12 @@ class IndexedField:
         if data is None:
             return []
 
-        return self.convert_to_rdf(data)
+        value = self.convert_to_rdf(data)
+        term = get_term_pool().term
+        if isinstance(value, (list, tuple)):
+            # convert_to_rdf may return a list of terms, an empty one for empty values
+            return [term(x) for x in value]
+        return term(value)
 
     def __get_streams(self, value):
         streams = []
@@ -8,11 +8,11 @@ import re
 import requests
 from django.conf import settings
 from django.db import connections
-from rdflib import Literal, URIRef
 
 from fedoralink.fedorans import FEDORA_INDEX
 from fedoralink.indexer import Indexer
 from fedoralink.rdfmetadata import RDFMetadata
+from fedoralink.term_pool import get_term_pool
 
 log = logging.getLogger('fedoralink.indexer')
 
@@ -273,14 +273,15 @@ class SOLRIndexer(Indexer):
         resp = json.loads(data)
 
         data = []
+        pool = get_term_pool()
 
         for doc in resp['response']['docs']:
-            metadata = RDFMetadata(doc['id'])
+            metadata = RDFMetadata(pool.uri(doc['id']))
             fields = {}
             for k, v in doc.items():
                 if k in ('id', '_version_', 'solr_all_fields_t', 'fedora_mixin_types_t', 'fedora_parent_id_t'):
                     if k == 'id' and values is not None:
-                        fields['id'] = [URIRef(v)]
+                        fields['id'] = [pool.uri(v)]
 
                     continue
 
@@ -301,9 +302,9 @@ class SOLRIndexer(Indexer):
                         continue
 
                 if language:
-                    fields[key].append(Literal(v, lang=language))
+                    fields[key].append(pool.literal(v, lang=language))
                 else:
-                    fields[key].append(Literal(v))
+                    fields[key].append(pool.literal(v))
 
             if values is None:
                 for field_name, field_values in fields.items():
@@ -15,12 +15,16 @@ class Command(BaseCommand):
     args = ''
     help = 'Reindexuje cely obsah repozitare'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--lazy', action='store_true', default=False,
+                            help='List children lazily, use for containers with many children')
+
     def handle(self, *args, **options):
         obj = FedoraObject.objects.get(pk='')
         indexer = connections['repository'].indexer
-        self.reindex(indexer, obj)
+        self.reindex(indexer, obj, lazy=options['lazy'])
 
-    def reindex(self, indexer, obj, level=0):
+    def reindex(self, indexer, obj, level=0, lazy=False):
 
         if 'fedora:' in obj.id:
             return
@@ -32,5 +36,5 @@ class Command(BaseCommand):
 
         print("   " * level, obj.id, type(obj))
 
-        for c in obj.children:
-            self.reindex(indexer, c, level+1)
\ No newline at end of file
+        for c in (obj.list_children(lazy=True) if lazy else obj.children):
+            self.reindex(indexer, c, level+1, lazy)
\ No newline at end of file
@@ -1,3 +1,5 @@
+import logging
+
 from django.db import connections
 from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
 
@@ -5,6 +7,10 @@ from .utils import TypedStream
 from .fedorans import LDP, EBUCORE
 from .type_manager import FedoraTypeManager
 from .query import LazyFedoraQuery
+from .connection import BatchWriteException
+from .executor import run_in_thread
+
+log = logging.getLogger('fedoralink.manager')
 
 
 class FedoraManager:
@@ -48,6 +54,14 @@ class FedoraManager:
         self.__initialize_connection()
         return self._default_connection
 
+    @property
+    def async_connection(self):
+        """
+        Returns the default asyncio connection
+        :return: instance of AsyncFedoraConnection
+        """
+        return connections['repository'].async_connection
+
     @staticmethod
     def get_manager(model_class=None):
         """
@@ -69,55 +83,163 @@ class FedoraManager:
         :param objects:         the objects to save
         :param connection:      the connection which should be used for saving the object
         :return:                nothing, the objects are updated with the "id" property
+        :raise BatchWriteException  if some of the objects could not be saved. Its results contain the objects
+                                    in the order of the objects parameter, None for those which failed
+
+        Objects which have not been changed since they were fetched or saved (nor by pre_save receivers) are
+        skipped, no request is made and no post_save signal is sent for them.
         """
+        if connection is None:
+            connection = self.connection
 
-        def _serialize_object(object_to_serialize):
-            if object_to_serialize.is_incomplete:
-                raise AttributeError('Object %s is incomplete, probably obtained from search and can not be saved. ' +
-                                     'To get metadata-complete record, call .update() on the object' %
-                                     object_to_serialize)
-            return {
-                'metadata'  : object_to_serialize.metadata,
-                'bitstream' : object_to_serialize.get_local_bitstream(),
-                'slug'      : object_to_serialize.slug
-            }
+        objects = list(objects)
+        objects_to_update, objects_to_create = self._pre_save(objects, connection)
+        skipped = self._skipped_objects(objects, objects_to_update, objects_to_create)
 
-        objects_to_update = []
-        objects_to_create = []
+        failed = {}
+
+        def _write(write, objects_to_write):
+            try:
+                metadata = write([self._serialize_object(o) for o in objects_to_write])
+            except BatchWriteException as e:
+                metadata = self._record_failures(e, objects_to_write, failed)
+            self._assign_metadata(metadata, objects_to_write)
+
+        if objects_to_update:
+            _write(connection.update_objects, objects_to_update)
+
+        if objects_to_create:
+            _write(connection.create_objects, objects_to_create)
+
+        self._post_save(objects, failed, skipped)
 
+    async def asave(self, objects, connection=None):
+        """
+        Asyncio variant of save, uses AsyncFedoraConnection. Signal handlers are run in a worker thread.
+
+        :param objects:         the objects to save
+        :param connection:      AsyncFedoraConnection, if None the default one is used
+        :raise BatchWriteException  see save
+        """
         if connection is None:
-            connection = self.connection
+            connection = self.async_connection
+
+        objects = list(objects)
+        objects_to_update, objects_to_create = await run_in_thread(self._pre_save, objects, connection)
+        skipped = self._skipped_objects(objects, objects_to_update, objects_to_create)
+
+        failed = {}
+
+        async def _write(write, objects_to_write):
+            try:
+                metadata = await write([self._serialize_object(o) for o in objects_to_write])
+            except BatchWriteException as e:
+                metadata = self._record_failures(e, objects_to_write, failed)
+            self._assign_metadata(metadata, objects_to_write)
+
+        if objects_to_update:
+            await _write(connection.update_objects, objects_to_update)
+
+        if objects_to_create:
+            await _write(connection.create_objects, objects_to_create)
+
+        await run_in_thread(self._post_save, objects, failed, skipped)
+
+    @staticmethod
+    def _serialize_object(object_to_serialize):
+        if object_to_serialize.is_incomplete:
+            raise AttributeError('Object %s is incomplete, probably obtained from search and can not be saved. ' +
+                                 'To get metadata-complete record, call .update() on the object' %
+                                 object_to_serialize)
+        return {
+            'metadata'  : object_to_serialize.metadata,
+            'bitstream' : object_to_serialize.get_local_bitstream(),
+            'slug'      : object_to_serialize.slug
+        }
+
+    @staticmethod
+    def _pre_save(objects, connection):
+        """
+        Sends pre_save signal and splits objects to those that will be updated and those that will be created.
+        Objects which are unchanged after pre_save (receivers might have changed them) are left out,
+        see _is_unchanged
+        """
+        objects_to_update = []
+        objects_to_create = []
 
         for o in objects:
+            pre_save.send(sender=o.__class__, instance=o, raw=False, using='repository', update_fields=None)
             if o.objects_fedora_connection == connection and o.id:
+                if FedoraManager._is_unchanged(o):
+                    log.debug('Object %s not changed, skipping save', o.id)
+                    continue
                 objects_to_update.append(o)
-                pre_save.send(sender=o.__class__, instance=o, raw=False, using='repository', update_fields=None)
             else:
                 objects_to_create.append(o)
-                pre_save.send(sender=o.__class__, instance=o, raw=False, using='repository', update_fields=None)
 
-        if objects_to_update:
-            metadata = connection.update_objects([_serialize_object(o) for o in objects_to_update])
-            for md, obj in zip(metadata, objects_to_update):
-                obj.metadata = md
+        return objects_to_update, objects_to_create
 
-        if objects_to_create:
-            metadata = connection.create_objects([_serialize_object(o) for o in objects_to_create])
-            for md, obj in zip(metadata, objects_to_create):
+    @staticmethod
+    def _is_unchanged(obj):
+        """
+        Returns True if saving the object would not change anything on the server - its metadata have no changes
+        and it has no local bitstream or streams to upload
+        """
+        from fedoralink.indexer.models import fedoralink_streams
+
+        return (not obj.metadata.has_changes() and obj.get_local_bitstream() is None and
+                not fedoralink_streams(obj))
+
+    @staticmethod
+    def _skipped_objects(objects, objects_to_update, objects_to_create):
+        """
+        Returns ids of the objects left out by _pre_save
+        """
+        if len(objects_to_update) + len(objects_to_create) == len(objects):
+            return frozenset()
+        written = {id(o) for o in objects_to_update}
+        written.update(id(o) for o in objects_to_create)
+        return {id(o) for o in objects} - written
+
+    @staticmethod
+    def _record_failures(batch_exception, objects_to_write, failed):
+        for index, error in batch_exception.errors.items():
+            failed[id(objects_to_write[index])] = error
+        return batch_exception.results
+
+    @staticmethod
+    def _assign_metadata(metadata, objects_to_write):
+        for md, obj in zip(metadata, objects_to_write):
+            if md is not None:
                 obj.metadata = md
 
+    @staticmethod
+    def _post_save(objects, failed, skipped=frozenset()):
+        """
+        Sends post_save signal for saved objects, raises BatchWriteException if some objects could not be saved
+
+        :param skipped:     ids of unchanged objects which have not been written, no signal is sent for them
+        """
         for o in objects:
-            post_save.send(sender=o.__class__, instance=o, created=None, raw=False, using='repository', update_fields=None)
+            if id(o) not in failed and id(o) not in skipped:
+                post_save.send(sender=o.__class__, instance=o, created=None, raw=False, using='repository',
+                               update_fields=None)
+
+        if failed:
+            raise BatchWriteException([None if id(o) in failed else o for o in objects],
+                                      {index: failed[id(o)] for index, o in enumerate(objects) if id(o) in failed})
 
     def update(self, obj, fetch_child_metadata=True):
         return self.get_query().fetch_child_metadata(fetch_child_metadata).get(pk=obj.id)
 
-    def get_bitstream(self, obj):
+    def get_bitstream(self, obj, range=None, if_range=None):
         """
         Returns a bitstream associated with the object
 
-        :param obj:     the object
-        :return:        TypedStream with object's data
+        :param obj:         the object
+        :param range:       optional value of http Range header, see FedoraConnection.get_bitstream
+        :param if_range:    optional value of http If-Range header
+        :return:            TypedStream with object's data
         """
 
         def get_mimetype(fedora_object):
@@ -132,19 +254,20 @@ class FedoraManager:
                 return ret[0].value
             return None
 
-        return TypedStream(self.connection.get_bitstream(obj.id),
+        return TypedStream(self.connection.get_bitstream(obj.id, range=range, if_range=if_range),
                            mimetype=get_mimetype(obj),
                            filename=get_filename(obj))
 
-    def construct(self, rdf_metadata):
+    def construct(self, rdf_metadata, connection=None):
         """
         creates a new instance from RDFMetadata
 
         :param rdf_metadata:    the metadata
+        :param connection:      connection the metadata have been fetched with, the default one if None
         :return:                instance of the best class(es) which handle the metadata
         """
         clz = FedoraTypeManager.get_object_class(rdf_metadata, self._model_class)
-        ret = clz(__metadata=rdf_metadata, __connection=self.connection)
+        ret = clz(__metadata=rdf_metadata, __connection=connection or self.connection)
 
         from fedoralink.models import fedora_object_fetched
         fedora_object_fetched.send(clz, instance=ret, manager=self)
@@ -168,6 +291,21 @@ class FedoraManager:
         children = meta[LDP.contains]
         return [self.construct(meta.clone_for(child)) for child in children]
 
+    def iter_children(self, obj, page_size=100, concurrency=None):
+        """
+        Lazily loads children of the given resource. The container is fetched without embedded children,
+        then the children are fetched in parallel and yielded as they arrive, not in any particular order.
+        Use instead of load_children for large containers
+
+        :param obj:             container to list
+        :param page_size:       maximum number of children fetched ahead, see FedoraConnection.iter_objects
+        :param concurrency:     maximum number of requests running at the same time
+        :return:                generator of children
+        """
+        child_ids = self.connection.get_child_ids(obj.id)
+        for metadata in self.connection.iter_objects(child_ids, page_size, concurrency):
+            yield self.construct(metadata)
+
     def delete(self, obj):
         """
         deletes an object
@@ -178,6 +316,52 @@ class FedoraManager:
             self.connection.delete(obj.id)
             post_delete.send(sender=obj.__class__, instance=obj, using='repository')
 
+    # number of deleted objects for which post_delete and index deletion are sent together
+    DELETE_TREE_BATCH_SIZE = 500
+
+    def delete_tree(self, obj, purge_tombstones=True, concurrency=None):
+        """
+        deletes an object together with all its descendants, leaves first. pre_delete signal is sent
+        before each object is deleted, post_delete signals (with in_bulk=True) are sent in batches
+        and the deleted objects are removed from the index in bulk
+
+        :param obj:                 root of the tree to be deleted
+        :param purge_tombstones:    if True, remove tombstones of the deleted objects as well
+        :param concurrency:         maximum number of requests to the repository running at the same time
+        :return:                    number of deleted objects
+        :raise DeleteTreeException  if some objects could not be deleted
+        """
+        if not obj.id:
+            return 0
+
+        from fedoralink.apps import bulk_delete_from_index
+
+        instances = {}
+        batch     = []
+
+        def send_batch():
+            for instance in batch:
+                post_delete.send(sender=instance.__class__, instance=instance, using='repository', in_bulk=True)
+            bulk_delete_from_index(batch, 'repository')
+            del batch[:]
+
+        def before_delete(metadata):
+            instance = obj if str(metadata.id) == str(obj.id) else self.construct(metadata)
+            instances[str(metadata.id)] = instance
+            pre_delete.send(sender=instance.__class__, instance=instance, using='repository')
+
+        def after_delete(metadata):
+            batch.append(instances.pop(str(metadata.id)))
+            if len(batch) >= self.DELETE_TREE_BATCH_SIZE:
+                send_batch()
+
+        try:
+            deleted = self.connection.delete_tree(obj.id, purge_tombstones, concurrency,
+                                                  before_delete=before_delete, after_delete=after_delete)
+        finally:
+            send_batch()
+        return len(deleted)
+
     def __getattr__(self, name):
         """
         Whatever attribute is not handled, suppose that it is a query parameter and hand it over to
@@ -0,0 +1,178 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger('fedoralink.metadata_cache')
+
+
+class CachedMetadata:
+    """
+    Serialized representation of a resource together with validators used to revalidate it with the server
+    """
+    __slots__ = ('etag', 'last_modified', 'data', 'content_type')
+
+    def __init__(self, etag, last_modified, data, content_type=None):
+        """
+        :param etag:            ETag header of the response
+        :param last_modified:   Last-Modified header of the response
+        :param data:            body of the response, bytes
+        :param content_type:    content type of the body, one of rdfmetadata.RDF_PARSERS
+        """
+        self.etag          = etag
+        self.last_modified = last_modified
+        self.data          = data
+        self.content_type  = content_type
+
+
+class MetadataCache:
+    """
+    Bounded LRU cache of resource metadata, keyed by resource url and a variant (for example Prefer and Accept
+    headers and identity of the user). Entries are not trusted blindly, the caller revalidates them with
+    If-None-Match/If-Modified-Since and uses them only when the server answers 304 Not Modified.
+
+    If django_cache is given, it is used as a second tier shared between processes. To be able to invalidate
+    all variants of an url there, the keys contain a per-url generation number which is incremented on invalidation.
+    """
+
+    def __init__(self, max_entries=1000, django_cache=None, timeout=None, max_bytes=16 * 1024 * 1024):
+        """
+        :param max_entries:     maximum number of entries kept in process memory
+        :param django_cache:    optional instance of django cache (django.core.cache.caches[alias])
+        :param timeout:         timeout of entries in django cache in seconds, None for the cache's default
+        :param max_bytes:       maximum total size of the cached bodies kept in process memory, larger
+                                bodies are not cached at all
+        """
+        self._max_entries  = max_entries
+        self._max_bytes    = max_bytes
+        self._bytes        = 0                  # total size of bodies in _entries
+        self._django_cache = django_cache
+        self._timeout      = timeout
+        self._entries      = OrderedDict()      # (url, variant) -> CachedMetadata
+        self._variants     = {}                 # url -> set of variants present in _entries
+        self._lock         = threading.Lock()
+
+    def get(self, url, variant):
+        """
+        Returns cached metadata of the url or None
+
+        :param url:         url of the resource
+        :param variant:     tuple of strings distinguishing representations of the same url
+        :return:            CachedMetadata or None
+        """
+        key = (url, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if self._django_cache is not None:
+            entry = self._django_cache.get(self._django_key(url, variant))
+            if entry is not None:
+                self._put_local(key, entry)
+        return entry
+
+    def put(self, url, variant, entry):
+        """
+        Stores metadata of the url
+
+        :param url:         url of the resource
+        :param variant:     see get
+        :param entry:       CachedMetadata
+        """
+        if len(entry.data) > self._max_bytes:
+            log.debug('Metadata of %s have %d bytes, not caching them', url, len(entry.data))
+            return
+        self._put_local((url, variant), entry)
+        if self._django_cache is not None:
+            self._django_cache.set(self._django_key(url, variant), entry, self._timeout)
+
+    def invalidate(self, urls, descendants=False):
+        """
+        Removes all variants of the given urls from the cache
+
+        :param urls:        iterable of urls
+        :param descendants: if True, remove also resources whose url starts with url + '/'. Descendants are
+                            removed only from process memory, in django cache they fail revalidation
+        """
+        urls = set(urls)
+        with self._lock:
+            removed = set(urls)
+            if descendants:
+                prefixes = tuple(url + '/' for url in urls)
+                removed.update(url for url in self._variants if url.startswith(prefixes))
+            for url in removed:
+                for variant in self._variants.pop(url, ()):
+                    self._bytes -= len(self._entries.pop((url, variant)).data)
+
+        if self._django_cache is not None:
+            for url in urls:
+                generation_key = self._generation_key(url)
+                try:
+                    self._django_cache.incr(generation_key)
+                except ValueError:
+                    self._django_cache.set(generation_key, 1, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._variants.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _put_local(self, key, entry):
+        if len(entry.data) > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous.data)
+            self._entries[key] = entry
+            self._bytes += len(entry.data)
+            self._variants.setdefault(key[0], set()).add(key[1])
+            while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+                (url, variant), evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.data)
+                url_variants = self._variants[url]
+                url_variants.discard(variant)
+                if not url_variants:
+                    del self._variants[url]
+
+    @staticmethod
+    def _hash(*parts):
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def _generation_key(self, url):
+        return 'fedoralink:metadata:generation:' + self._hash(url)
+
+    def _django_key(self, url, variant):
+        generation = self._django_cache.get(self._generation_key(url), 0)
+        return 'fedoralink:metadata:v2:' + self._hash(url, generation, variant)
+
+
+_caches      = {}
+_caches_lock = threading.Lock()
+
+
+def get_metadata_cache(key, max_entries=1000, django_cache=None, timeout=None, max_bytes=16 * 1024 * 1024):
+    """
+    Returns a process-wide MetadataCache registered under the given key, creating it if necessary
+
+    :param key:             key of the cache, for example the repository url
+    :param max_entries:     see MetadataCache, used only when the cache is created
+    :param django_cache:    alias of django cache used as the second tier or None, used only when the cache is created
+    :param timeout:         see MetadataCache, used only when the cache is created
+    :param max_bytes:       see MetadataCache, used only when the cache is created
+    :return:                instance of MetadataCache
+    """
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            if django_cache is not None:
+                from django.core.cache import caches
+                django_cache = caches[django_cache]
+            cache = _caches[key] = MetadataCache(max_entries, django_cache, timeout, max_bytes)
+        return cache
@@ -3,7 +3,6 @@ import logging
 
 import django.dispatch
 import rdflib
-from io import BytesIO
 
 from django.apps import apps
 from rdflib import Literal
@@ -11,6 +10,7 @@ from rdflib.namespace import DC, RDF, XSD
 from rdflib.term import URIRef
 
 from fedoralink.fedorans import ACL
+from . import serialization
 from .fedorans import FEDORA, EBUCORE
 from .manager import FedoraManager
 from .rdfmetadata import RDFMetadata
@@ -180,6 +180,12 @@ class FedoraObject(metaclass=FedoraObjectMetaclass):
         """
         getattr(type(self), 'objects').save((self,), None)
 
+    async def asave(self):
+        """
+        saves this instance using asyncio connection
+        """
+        await getattr(type(self), 'objects').asave((self,), None)
+
     @classmethod
     def save_multiple(cls, objects, connection=None):
         """
@@ -194,11 +200,14 @@ class FedoraObject(metaclass=FedoraObjectMetaclass):
         """
         return self.__connection
 
-    def get_bitstream(self):
+    def get_bitstream(self, range=None, if_range=None):
         """
         returns a TypedStream associated with this node
+
+        :param range:       optional value of http Range header, only the requested part is returned then
+        :param if_range:    optional value of http If-Range header
         """
-        return self.objects.get_bitstream(self)
+        return self.objects.get_bitstream(self, range=range, if_range=if_range)
 
     def get_local_bitstream(self):
         """
@@ -221,16 +230,34 @@ class FedoraObject(metaclass=FedoraObjectMetaclass):
     def children(self):
         return self.list_children()
 
-    def list_children(self, refetch=True):
-        return OrderableModelList(get_from_classes(type(self), 'objects')[0].load_children(self, refetch), self)
+    def list_children(self, refetch=True, lazy=False):
+        """
+        Returns children of this object
 
-    def list_self_and_descendants(self):
+        :param refetch:     if False, use the children embedded in the metadata of this object
+        :param lazy:        if True, return a generator fetching the children in pages, see
+                            FedoraManager.iter_children. Use it for large containers
+        """
+        manager = get_from_classes(type(self), 'objects')[0]
+        if lazy:
+            return manager.iter_children(self)
+        return OrderableModelList(manager.load_children(self, refetch), self)
+
+    def list_self_and_descendants(self, lazy=False):
+        """
+        Returns a generator of this object and all its descendants, parents before their children
+
+        :param lazy:        if True, children are listed lazily (see list_children) and come in no particular
+                            order. It makes a request for each descendant, use it only for large containers
+        """
         stack = [self]
         while len(stack):
             el = stack.pop()
             yield el
-            for c in reversed(el.children):
-                stack.append(c)
+            if lazy:
+                stack.extend(el.list_children(lazy=True))
+            else:
+                stack.extend(reversed(el.children))
 
     def create_child(self, child_name, additional_types=None, flavour=None, slug=None):
         child = self._create_child(flavour or FedoraObject, slug)
@@ -283,6 +310,12 @@ class FedoraObject(metaclass=FedoraObjectMetaclass):
     def delete(self):
         getattr(type(self), 'objects').delete(self)
 
+    def delete_tree(self, purge_tombstones=True, concurrency=None):
+        """
+        Deletes this object together with all its descendants, see FedoraManager.delete_tree
+        """
+        return getattr(type(self), 'objects').delete_tree(self, purge_tombstones, concurrency)
+
     def update(self, fetch_child_metadata=True):
         """
         Fetches new data from server and overrides this object's metadata with them
@@ -328,18 +361,35 @@ class FedoraObject(metaclass=FedoraObjectMetaclass):
     def __delitem__(self, key):
         del self.metadata[key]
 
+    def __reduce__(self):
+        # pickled in compact format with model classes recorded by name, see fedoralink.serialization
+        return serialization.loads_object, (serialization.dumps_object(self),)
+
 
 class UploadedFileStream:
+    """
+    Stream reading a django UploadedFile without copying it into memory
+    """
 
     def __init__(self, file):
         self.file = file
-        self.content = BytesIO()
-        for c in self.file.chunks():
-            self.content.write(c)
-        self.content.seek(0)
+        self.file.seek(0)
+
+    @property
+    def size(self):
+        return self.file.size
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
 
-    def read(self):
-        return self.content.read()
+    def tell(self):
+        return self.file.tell()
 
     def close(self):
         pass
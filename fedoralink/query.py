@@ -1,6 +1,8 @@
 import copy
 from django.db.models import Q
 
+from .executor import run_in_thread
+
 
 class LazyFedoraQuery:
     """
@@ -8,7 +10,7 @@ class LazyFedoraQuery:
     """
 
     def __init__(self, manager, current_connection=None, filter_set=None, using='repository',
-                 do_fetch_child_metadata=True, force_via_indexer=False):
+                 do_fetch_child_metadata=True, force_via_indexer=False, force_via_repository=False):
         """
         creates a new query from a given manager
 
@@ -21,9 +23,11 @@ class LazyFedoraQuery:
         self.__using                = using
         self.__fetch_child_metadata = do_fetch_child_metadata
         self.__force_via_indexer    = force_via_indexer
+        self.__force_via_repository = force_via_repository
         self.__start = 0
         self.__end   = None
         self.__executed_data = None
+        self.__async_executed_data = None
         self.__request_facets = None
         self.__orderby = None
         self.__values = None
@@ -40,7 +44,20 @@ class LazyFedoraQuery:
         :raise DoesNotExist              if there is no such object
         """
         query = self.filter(**kwargs)
-        answer = query.execute()
+        return self._get_single(query.execute())
+
+    async def aget(self, **kwargs):
+        """
+        Asyncio variant of get, uses AsyncFedoraConnection
+
+        :param kwargs:      list of query params, same as those that would go to filter(...)
+        :return:            instance of the object
+        """
+        query = self.filter(**kwargs)
+        return self._get_single(await query.aexecute())
+
+    @staticmethod
+    def _get_single(answer):
         ret = None
         for a in answer:
             if ret is None:
@@ -57,6 +74,8 @@ class LazyFedoraQuery:
 
         :param kwargs: Supported parameters (for now)
                         pk      identifier of the resource
+                        pk__in  list of identifiers, fetched directly from the repository if
+                                via_repository() is used
         :return:       lazy set of resources
         """
 
@@ -135,6 +154,15 @@ class LazyFedoraQuery:
         ret.__force_via_indexer = force_via_indexer
         return ret
 
+    def via_repository(self, force_via_repository=True):
+        """
+        Fetches resources of pk__in query from the repository instead of the search engine. The result is
+        always fresh and does not need an indexer mapping. Missing resources are left out of the result.
+        """
+        ret = copy.copy(self)
+        ret.__force_via_repository = force_via_repository
+        return ret
+
     def __getitem__(self, item):
         ret = copy.copy(self)
         if isinstance(item, slice):
@@ -191,6 +219,10 @@ class LazyFedoraQuery:
 
             self.__executed_data = QueryData(self.manager, 1, [(x, {}) for x in self.current_connection.get_object(repository_pk,
                                                 fetch_child_metadata=self.__fetch_child_metadata)])
+        elif self._get_repository_pks() is not None:
+            found, _ = self.current_connection.get_objects(self._get_repository_pks(),
+                                                           fetch_child_metadata=self.__fetch_child_metadata)
+            self.__executed_data = self._repository_query_data(found, self.current_connection)
         else:
             # call search engine
             search_response = self.manager.get_indexer(self.__using).search(self.__filter_set,
@@ -207,6 +239,50 @@ class LazyFedoraQuery:
 
         return self.__executed_data
 
+    async def aexecute(self):
+        """
+        Asyncio variant of execute. Resources are fetched via the AsyncFedoraConnection of the manager, search
+        engine is called in a worker thread. The result is kept apart from the result of execute, objects
+        returned from here are bound to the async connection.
+
+        :return:    QueryData with the fetched values
+        """
+        if self.__async_executed_data:
+            return self.__async_executed_data
+
+        # the query is bound to the synchronous connection, the async one is used only for this call
+        connection = self.manager.async_connection
+
+        repository_pk = self._get_repository_pk()
+        if repository_pk is not None and not self.__force_via_indexer:
+            if self.__values:
+                raise Exception('values() are not yet implemented on .get(pk=)/.filter(pk=)')
+
+            metadata = await connection.get_object(repository_pk,
+                                                   fetch_child_metadata=self.__fetch_child_metadata)
+            self.__async_executed_data = QueryData(self.manager, 1, [(metadata, {})], connection=connection)
+        elif self._get_repository_pks() is not None:
+            found, _ = await connection.get_objects(self._get_repository_pks(),
+                                                    fetch_child_metadata=self.__fetch_child_metadata)
+            self.__async_executed_data = self._repository_query_data(found, connection)
+        else:
+            def search():
+                return self.manager.get_indexer(self.__using).search(self.__filter_set,
+                                                                     self.model,
+                                                                     self.__start, self.__end,
+                                                                     self.__request_facets,
+                                                                     self.__orderby,
+                                                                     self.__values)
+
+            search_response = await run_in_thread(search)
+
+            self.__async_executed_data = QueryData(self.manager, search_response['count'],
+                                                   search_response['data'], incomplete=True,
+                                                   facets = search_response['facets'],
+                                                   values=self.__values, connection=connection)
+
+        return self.__async_executed_data
+
     def values(self, *_values):
         ret = copy.copy(self)
         ret.__values = _values
@@ -235,6 +311,28 @@ class LazyFedoraQuery:
         # otherwise it is not a simple query and go through the indexer ...
         return None
 
+    def _get_repository_pks(self):
+        """
+        Internal method. If the query is just pk__in and via_repository() has been called, returns the list
+        of pks, otherwise None
+
+        :return:    non-null if the resources should be fetched from the repository
+        """
+        if not self.__force_via_repository or self.__force_via_indexer or self.__filter_set is None:
+            return None
+
+        children = self.__filter_set.children
+        if len(children) == 1 and isinstance(children[0], tuple) and children[0][0] == 'pk__in':
+            if self.__values:
+                raise Exception('values() are not yet implemented on .filter(pk__in=)')
+            return list(children[0][1])
+
+        return None
+
+    def _repository_query_data(self, found, connection):
+        return QueryData(self.manager, len(found), [(x, {}) for x in found[self.__start:self.__end]],
+                         connection=connection)
+
     def __iter__(self):
         for r in self.execute():
             yield r
@@ -259,10 +357,11 @@ class MultipleObjectsReturned(Exception):
 
 class QueryData:
 
-    def __init__(self, manager, count, raw_data, incomplete=False, facets=None, values=None):
+    def __init__(self, manager, count, raw_data, incomplete=False, facets=None, values=None, connection=None):
         if not facets:
             facets = {}
         self.manager   = manager
+        self.connection = connection
         self._count    = count
         self._incomplete = incomplete
         self.facets = facets
@@ -276,7 +375,7 @@ class QueryData:
             self.data.extend(raw_data)
 
     def _construct(self, x):
-        x = self.manager.construct(x)
+        x = self.manager.construct(x, self.connection)
         x.is_incomplete = self._incomplete
         return x
 
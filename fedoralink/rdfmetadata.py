@@ -1,52 +1,243 @@
 import logging
+import time
+from collections import ChainMap
+from types import MappingProxyType
 import rdflib
 import rdflib.term
-from .sparql import SparqlSerializer
+try:
+    # rdflib >= 6 - NTriplesParser is the graph parser plugin there, the sink based parser has been renamed
+    from rdflib.plugins.parsers.ntriples import W3CNTriplesParser as NTriplesParser
+except ImportError:
+    from rdflib.plugins.parsers.ntriples import NTriplesParser
+from .serialization import dump_metadata, load_metadata
+from .sparql import serialize_update
 from io import BytesIO
 
-from .fedorans import NAMESPACES, RDF, FEDORA
+from .fedorans import NAMESPACES, RDF, FEDORA, LDP, EBUCORE, PREMIS
+from .middleware import FedoraProfillingMiddleware
+from .term_pool import get_term_pool
 
 log = logging.getLogger('fedoralink.rdfmetadata')
 
+# content type of serialized metadata -> rdflib parser name
+RDF_PARSERS = {
+    'application/n-triples': 'nt',
+    'text/turtle':           'turtle',
+    'application/rdf+xml':   'xml',
+}
+
+# read-only empty mapping, shared by all instances without embedded subjects
+_EMPTY = MappingProxyType({})
+
+# rdflib namespaces create a new URIRef on each attribute access, clone_for keeps this one in every child
+_HAS_PARENT = FEDORA.hasParent
+
+# predicates whose values are read directly from n-triples, without parsing the whole representation
+SCANNED_PREDICATES = frozenset((RDF.type, _HAS_PARENT))
+
+# predicates in these namespaces are maintained by the Fedora server, not by the client
+SERVER_MANAGED_NAMESPACES = tuple(str(x) for x in (FEDORA, LDP, EBUCORE, PREMIS))
+
+
+def is_server_managed(predicate):
+    """
+    Returns True if the value of the predicate is maintained by Fedora server. rdf:type is not, though the server
+    adds its own types (fedora:Container, ldp:RDFSource, ...) to those set by the client, see is_server_managed_type
+    """
+    return str(predicate).startswith(SERVER_MANAGED_NAMESPACES)
+
+
+def is_server_managed_type(rdf_type):
+    """
+    Returns True if the rdf type is added to resources by Fedora server
+    """
+    return str(rdf_type).startswith(SERVER_MANAGED_NAMESPACES)
+
+
+def _group_by_subject(triples):
+    """
+    Groups triples as dict subject -> dict predicate -> list of values, the values keep the order of the triples
+
+    :param triples:     iterable of (subject, predicate, object)
+    """
+    subjects = {}
+    for s, p, o in triples:
+        predicates = subjects.get(s)
+        if predicates is None:
+            predicates = subjects[s] = {}
+        values = predicates.get(p)
+        if values is None:
+            predicates[p] = [o]
+        else:
+            values.append(o)
+    return subjects
+
+
+def _alternative_id(uri):
+    """
+    Returns the uri with the trailing slash removed or added, Fedora uses both forms
+    """
+    if uri.endswith('/'):
+        return rdflib.term.URIRef(uri[:-1])
+    return rdflib.term.URIRef(uri + '/')
+
+
+def _mentions(data, uri):
+    """
+    Returns True if serialized metadata contain the uri as a resource (<uri> or "uri" in rdf+xml)
+    """
+    return ('<%s>' % uri).encode('utf-8') in data or ('"%s"' % uri).encode('utf-8') in data
+
+
+def _scan_ntriples(data, subject, predicate):
+    """
+    Reads IRI values of the predicate of the subject from n-triples without parsing the whole document.
+
+    :param data:        bytes in n-triples format
+    :return:            tuple of rdflib.URIRef or None if some value is not an IRI
+    """
+    subject_token   = ('<%s>' % subject).encode('utf-8')
+    predicate_token = ('<%s>' % predicate).encode('utf-8')
+    values = []
+    pos = data.find(predicate_token)
+    while pos >= 0:
+        line_start = data.rfind(b'\n', 0, pos) + 1
+        line_end   = data.find(b'\n', pos)
+        if line_end < 0:
+            line_end = len(data)
+        parts = data[line_start:line_end].split(None, 2)
+        if len(parts) == 3 and parts[0] == subject_token and parts[1] == predicate_token:
+            value = parts[2].rstrip()
+            if not value.startswith(b'<') or not value.endswith(b'.'):
+                return None
+            value = value[:-1].rstrip()
+            if not value.endswith(b'>'):
+                return None
+            values.append(rdflib.term.URIRef(value[1:-1].decode('utf-8')))
+        pos = data.find(predicate_token, line_end)
+    return tuple(dict.fromkeys(values))
+
+
+class _TripleSink:
+    """
+    Sink of rdflib NTriplesParser collecting the parsed triples into a list, the terms are interned
+    """
+    def __init__(self, term):
+        self.triples = []
+        self.term    = term
+
+    def triple(self, s, p, o):
+        term = self.term
+        self.triples.append((term(s), term(p), term(o)))
+
+
+def _parse(data, content_type):
+    """
+    Parses serialized metadata. The terms are taken from the default term pool.
+
+    :return: iterable of (subject, predicate, object)
+    """
+    term = get_term_pool().term
+    if RDF_PARSERS[content_type] == 'nt':
+        # n-triples do not need a graph, the parser hands over the triples directly
+        return NTriplesParser(_TripleSink(term)).parse(BytesIO(data)).triples
+    graph = rdflib.Graph()
+    graph.parse(BytesIO(data), format=RDF_PARSERS[content_type])
+    return [(term(s), term(p), term(o)) for s, p, o in graph]
+
+
+def _namespace_graph():
+    """
+    Returns an empty rdflib.Graph with the common namespaces bound
+    """
+    graph = rdflib.Graph()
+    for k, v in NAMESPACES.items():
+        graph.bind(k, rdflib.URIRef(v), override=False)
+    return graph
+
+
+def _freeze(predicates):
+    """
+    Converts dict predicate -> list of values to dict predicate -> tuple of distinct values
+    """
+    return {p: tuple(dict.fromkeys(values)) for p, values in predicates.items()}
+
 
 class RDFMetadata:
     """
     Represents a rdf:Description within a rdf:RDF
+
+    Triples with subject=id are kept in a dictionary predicate -> tuple of values, triples about other
+    subjects (children embedded in a container's representation) are kept aside for clone_for. rdflib.Graph
+    is built only when rdf_metadata is accessed - from then on the graph holds all the triples, as it may
+    be modified by the caller. Metadata fetched from the server are kept serialized until they are needed.
     """
 
-    def __init__(self, self_id, metadata=None):
+    __slots__ = ('__id', '__values', '__embedded', '__shared', '__graph', '__raw', '__scanned',
+                 '__added_triplets', '__removed_triplets', '__refetch', 'etag', 'last_modified')
+
+    def __init__(self, self_id, metadata=None, content_type=None):
         """
         the metadata element might contains descriptions about more elements than this.
          self_id is used to filter out the triplets with subject=self_id
 
-        :param self_id:     will look for rdf:about with this id
-        :param metadata:    instance of rdflib.Graph
-        """
-        self.__id = rdflib.term.URIRef(self_id)
+        Serialized metadata are parsed on the first access which needs them. Values of SCANNED_PREDICATES
+        are read from n-triples without parsing.
 
-        if metadata is None:
-            metadata = rdflib.Graph()
-        else:
-            if not len(list(metadata[self.__id])):
-                if self_id.endswith('/'):
-                    test_id = self_id[:-1]
+        :param self_id:         will look for rdf:about with this id
+        :param metadata:        instance of rdflib.Graph, an iterable of (subject, predicate, object) triples
+                                or bytes with serialized metadata
+        :param content_type:    content type of serialized metadata, one of RDF_PARSERS
+        """
+        self.__id = self_id if type(self_id) is rdflib.term.URIRef else rdflib.term.URIRef(self_id)
+
+        # dict predicate -> tuple of values for triples with subject=id
+        self.__values   = {}
+        # dict subject -> dict predicate -> tuple of values for triples about other subjects. The inner dicts
+        # are shared with children created by clone_for, so they are replaced, never modified
+        self.__embedded = _EMPTY
+        # True if __values is shared with the container the metadata were cloned from, see clone_for
+        self.__shared   = False
+        # rdflib.Graph with all the triples, built by rdf_metadata. If set, __values and __embedded are not used
+        self.__graph    = None
+        # tuple (bytes, content type) of metadata not parsed yet
+        self.__raw      = None
+        # values of SCANNED_PREDICATES read before parsing, dict predicate -> tuple of values
+        self.__scanned  = None
+
+        if isinstance(metadata, bytes):
+            if content_type not in RDF_PARSERS:
+                raise AttributeError('Unknown content type %s, expected one of %s' %
+                                     (content_type, sorted(RDF_PARSERS)))
+            self.__raw = (metadata, content_type)
+            self.__scanned = {}
+            if not _mentions(metadata, self.__id):
+                test_id = _alternative_id(self.__id)
+                if _mentions(metadata, test_id):
+                    self.__id = test_id
                 else:
-                    test_id = self_id + '/'
-                test_id = rdflib.term.URIRef(test_id)
-
-                if len(list(metadata[test_id])):
+                    log.warning('Strange thing happened - REST call did not return metadata for %s', self.id)
+        elif metadata is not None:
+            subjects = _group_by_subject(metadata)
+            if self.__id not in subjects:
+                test_id = _alternative_id(self.__id)
+                if test_id in subjects:
                     self.__id = test_id
                 else:
                     log.warning('Strange thing happened - REST call did not return metadata for %s', self.id)
 
-        for k, v in NAMESPACES.items():
-            metadata.bind(k, rdflib.URIRef(v), override=False)
-
-        self.__metadata = metadata
+            self.__load(subjects)
 
         self.__added_triplets    = {}
         self.__removed_triplets  = {}
 
+        # callable returning fresh RDFMetadata from the server, set after a write - see mark_saved
+        self.__refetch = None
+
+        # ETag and Last-Modified headers of the response the metadata come from
+        self.etag          = None
+        self.last_modified = None
+
     @property
     def id(self):
         """
@@ -54,6 +245,39 @@ class RDFMetadata:
         """
         return self.__id
 
+    def __parse(self):
+        """
+        Parses the serialized metadata the instance was created from, if they have not been parsed yet
+        """
+        if self.__raw is None:
+            return
+        data, content_type = self.__raw
+        do_profile = FedoraProfillingMiddleware.profilling_enabled()
+        t1 = time.time()
+        subjects = _group_by_subject(_parse(data, content_type))
+        if do_profile:
+            FedoraProfillingMiddleware.log_time('parse %s (%d bytes)' % (self.__id, len(data)), time.time() - t1)
+
+        self.__load(subjects)
+        self.__raw      = None
+        self.__scanned  = None
+
+    def __load(self, subjects):
+        """
+        Fills the store from dict subject -> dict predicate -> list of values
+        """
+        self.__values   = _freeze(subjects.pop(self.__id, {}))
+        self.__embedded = {s: _freeze(predicates) for s, predicates in subjects.items()}
+
+    def __writable_values(self):
+        """
+        Returns __values for modification, copying them first if they are shared with the container
+        """
+        if self.__shared:
+            self.__values = dict(self.__values)
+            self.__shared = False
+        return self.__values
+
     def set_id(self, id):
         """
         Change the identifier to a new value; This means that all triplets with the original id as subject will
@@ -62,10 +286,12 @@ class RDFMetadata:
         :param id: the new id
         """
         id = rdflib.term.URIRef(id)
-        for p, o in self.__metadata[self.__id]:
-            # change the subject of the triplet
-            self.__metadata.remove((self.__id, p, o))
-            self.__metadata.add((id, p, o))
+        self.__parse()
+        if self.__graph is not None:
+            for p, o in list(self.__graph[self.__id]):
+                # change the subject of the triplet
+                self.__graph.remove((self.__id, p, o))
+                self.__graph.add((id, p, o))
         self.__id = id
 
     def add(self, predicate, value):
@@ -75,13 +301,95 @@ class RDFMetadata:
         :param predicate:   the predicate
         :param value:       the value, must be rdflib.URIRef or rdflib.Literal
         """
+        self.__refresh_server_managed(predicate)
+        if value in self.__objects(predicate):
+            return
         self.__add_to_metadata_only(predicate, value)
-        if predicate not in self.__added_triplets:
-            self.__added_triplets[predicate] = []
-        self.__added_triplets[predicate].append(value)
+        self.__record_change(self.__added_triplets, self.__removed_triplets, predicate, value)
+
+    @staticmethod
+    def __record_change(changes, opposite_changes, predicate, value):
+        """
+        Records addition or removal of a value. Removal of a value added since the last mark_saved (and vice versa)
+        just cancels the former change, so that the change sets are the minimal diff against the saved state.
+        """
+        opposite = opposite_changes.get(predicate)
+        if opposite is not None and value in opposite:
+            opposite.remove(value)
+            if not opposite:
+                del opposite_changes[predicate]
+            return
+        values = changes.get(predicate)
+        if values is None:
+            changes[predicate] = [value]
+        elif value not in values:
+            values.append(value)
 
     def __add_to_metadata_only(self, predicate, value):
-        self.__metadata.add((self.__id, predicate, value))
+        self.__parse()
+        if self.__graph is not None:
+            self.__graph.add((self.__id, predicate, value))
+            return
+        values = self.__values.get(predicate, ())
+        if value not in values:
+            self.__writable_values()[predicate] = values + (value,)
+
+    def __objects(self, predicate):
+        if self.__raw is not None and predicate in SCANNED_PREDICATES:
+            if predicate not in self.__scanned:
+                data, content_type = self.__raw
+                self.__scanned[predicate] = _scan_ntriples(data, self.__id, predicate) \
+                    if RDF_PARSERS[content_type] == 'nt' else None
+            if self.__scanned[predicate] is not None:
+                return self.__scanned[predicate]
+        self.__parse()
+        if self.__graph is not None:
+            return tuple(self.__graph.objects(self.__id, predicate))
+        return self.__values.get(predicate, ())
+
+    def __set_objects(self, predicate, values):
+        self.__parse()
+        if self.__graph is not None:
+            self.__graph.remove((self.__id, predicate, None))
+            for value in values:
+                self.__graph.add((self.__id, predicate, value))
+        elif values:
+            self.__writable_values()[predicate] = tuple(values)
+        elif predicate in self.__values:
+            del self.__writable_values()[predicate]
+
+    def __predicate_objects(self):
+        """
+        :return: list of (predicate, tuple of values) with subject=id
+        """
+        self.__parse()
+        if self.__graph is not None:
+            predicates = {}
+            for p, o in self.__graph.predicate_objects(self.__id):
+                predicates.setdefault(p, []).append(o)
+            return [(p, tuple(values)) for p, values in predicates.items()]
+        return list(self.__values.items())
+
+    def __embedded_triples(self):
+        self.__parse()
+        if self.__graph is not None:
+            return [triple for triple in self.__graph if triple[0] != self.__id]
+        return [(s, p, o) for s, predicates in self.__embedded.items()
+                for p, values in predicates.items() for o in values]
+
+    def __add_embedded(self, subject, predicate, value):
+        self.__parse()
+        if self.__graph is not None:
+            self.__graph.add((subject, predicate, value))
+            return
+        predicates = self.__embedded.get(subject, _EMPTY)
+        values = predicates.get(predicate, ())
+        if value not in values:
+            predicates = dict(predicates)
+            predicates[predicate] = values + (value,)
+            if self.__embedded is _EMPTY:
+                self.__embedded = {}
+            self.__embedded[subject] = predicates
 
     def add_type(self, a_type):
         """
@@ -96,15 +404,29 @@ class RDFMetadata:
         Extract all triplets with subject equal to the given uri and return instance
         of RDFMetadata(uri, selected_triplets)
 
+        The returned metadata share the triples with this instance and copy them on the first change, so
+        cloning all children of a container takes almost no memory.
+
         :param uri: uri to search for in subjects
         :return:    new RDFMetadata
         """
         uriref = rdflib.term.URIRef(uri)
-        ret = RDFMetadata(uri, None) # TODO: add metadata from self
-        for fact in self.__metadata[uriref:]:
-            ret.__add_to_metadata_only(*fact)
-        # the parent uri is not present, so add it ...
-        ret.add(FEDORA.hasParent, self.id)
+        ret = RDFMetadata(uriref, None)
+        self.__parse()
+        if self.__graph is not None:
+            for fact in self.__graph[uriref:]:
+                ret.__add_to_metadata_only(*fact)
+            # the parent uri is not present, so add it ...
+            ret.__add_to_metadata_only(_HAS_PARENT, self.id)
+            return ret
+
+        predicates = self.__embedded.get(uriref, _EMPTY)
+        parents = predicates.get(_HAS_PARENT, ())
+        if self.id not in parents:
+            parents += (self.id,)
+        # the parent uri is not present, so add it in front of the shared triples ...
+        ret.__values = ChainMap({_HAS_PARENT: parents}, predicates)
+        ret.__shared = True
         return ret
 
     def has_type(self, a_type):
@@ -113,11 +435,10 @@ class RDFMetadata:
         :param a_type: rdflib.URIRef with the type
         :return: True if the metadata contain the type
         """
-        types = self.__metadata.objects(self.__id, RDF.type)
-        for t in types:
-            if a_type == t:
-                return True
-        return False
+        if is_server_managed_type(a_type):
+            # types added by the server are not known after a write
+            self.__refresh_server_managed()
+        return a_type in self.__objects(RDF.type)
 
     def __getitem__(self, predicate):
         """
@@ -129,7 +450,8 @@ class RDFMetadata:
         if not isinstance(predicate, rdflib.term.URIRef):
             raise TypeError('Predicate must be an instance of URiRef')
 
-        return list(self.__metadata.objects(self.__id, predicate))
+        self.__refresh_server_managed(predicate)
+        return list(self.__objects(predicate))
 
     def __setitem__(self, predicate, value):
         """
@@ -153,47 +475,178 @@ class RDFMetadata:
 
         self.__delete_predicate(predicate,set(value))
         existing_values = set(self[predicate])
-        added = []
         for v in value:
             if v not in existing_values:
-                self.__metadata.add((self.__id, predicate, v))
-                added.append(v)
-        if added:
-            self.__added_triplets[predicate] = added
+                self.__add_to_metadata_only(predicate, v)
+                self.__record_change(self.__added_triplets, self.__removed_triplets, predicate, v)
+                existing_values.add(v)
 
     def __delitem__(self, predicate):
         self.__delete_predicate(predicate)
 
     def __delete_predicate(self, predicate, ignored_values = None):
         removed = []
+        kept = []
         if ignored_values is None:
             ignored_values = set()
         for val in self[predicate]:
             if val not in ignored_values:
                 removed.append(val)
-                self.__metadata.remove((self.__id, predicate, val))
-        if predicate not in self.__removed_triplets:
-            self.__removed_triplets[predicate] = removed
-        if predicate in self.__added_triplets:
-            self.__added_triplets[predicate]=[x for x in self.__added_triplets[predicate] if x not in ignored_values]
-            if not self.__added_triplets[predicate]:
-                del self.__added_triplets[predicate]
+            else:
+                kept.append(val)
+        if removed:
+            self.__set_objects(predicate, kept)
+        for val in removed:
+            self.__record_change(self.__removed_triplets, self.__added_triplets, predicate, val)
 
     def __contains__(self, predicate):
-        return len(self[predicate]) > 0        # TODO: optimize this
+        self.__refresh_server_managed(predicate)
+        return len(self.__objects(predicate)) > 0
 
     def __str__(self):
-        return self.__metadata.serialize(format='turtle').decode('utf-8')
+        graph = self.__graph if self.__graph is not None else self.__build_graph()
+        return graph.serialize(format='turtle', encoding='utf-8').decode('utf-8')
 
-    def serialize_sparql(self):
-        stream = BytesIO()
-        serializer = SparqlSerializer(self.__metadata, self.__removed_triplets, self.__added_triplets)
-        serializer.serialize(stream)
-        return stream.getvalue()
+    def __build_graph(self):
+        self.__parse()
+        graph = _namespace_graph()
+        graph.addN((self.__id, p, o, graph) for p, values in self.__values.items() for o in values)
+        graph.addN((s, p, o, graph) for s, p, o in self.__embedded_triples())
+        return graph
 
+    def has_changes(self):
+        """
+        Returns True if the metadata have been changed since the last mark_saved. Values removed and added back
+        (or added and removed) are not changes.
+        """
+        return bool(self.__removed_triplets or self.__added_triplets)
 
-    @property
-    def rdf_metadata(self):
-        return self.__metadata
+    def get_changes(self):
+        """
+        Returns changes made since the last mark_saved
+
+        :return: tuple (removed, added), both dictionaries predicate -> list of values
+        """
+        return ({predicate: list(values) for predicate, values in self.__removed_triplets.items()},
+                {predicate: list(values) for predicate, values in self.__added_triplets.items()})
+
+    def serialize_sparql(self, changes=None):
+        """
+        Serializes changes as SPARQL update
 
+        :param changes:     optional tuple (removed, added) as returned by get_changes, serialized instead of
+                            the changes made since the last mark_saved
+        :return:            bytes with the SPARQL update
+        """
+        removed, added = changes if changes is not None else (self.__removed_triplets, self.__added_triplets)
+        return serialize_update(removed, added)
+
+
+    def mark_saved(self, refetch=None, etag=None, last_modified=None):
+        """
+        Called after the metadata have been written to the server. Forgets the tracked changes, so that the next
+        serialize_sparql() contains only changes made from now on.
+
+        Server-managed triples (fedora:lastModified, ldp:contains, types added by the server, ...) are not
+        known locally after a write. If refetch is set, they are fetched from the server the first time
+        a server-managed predicate (or the whole graph) is accessed or has_type asks for a type added by the server.
+
+        :param refetch:         callable returning RDFMetadata of this resource freshly fetched from the server
+        :param etag:            ETag header returned by the write
+        :param last_modified:   Last-Modified header returned by the write
+        """
+        self.__added_triplets   = {}
+        self.__removed_triplets = {}
+        self.__refetch          = refetch
+        self.etag               = etag
+        self.last_modified      = last_modified
 
+    def to_bytes(self):
+        """
+        Serializes the metadata in compact binary format (see fedoralink.serialization), including the changes
+        not saved yet. Metadata are pickled in this format. Server-managed triples not fetched after a write
+        are not fetched here (the serialization would block on the server), the serialized metadata contain
+        only those known locally.
+
+        :return: bytes
+        """
+        if self.__graph is not None:
+            embedded = _group_by_subject(self.__embedded_triples()).items()
+        else:
+            self.__parse()
+            embedded = self.__embedded.items()
+        return dump_metadata(self.__id, self.__predicate_objects(),
+                             [(s, list(predicates.items())) for s, predicates in embedded],
+                             self.__removed_triplets, self.__added_triplets, self.etag, self.last_modified)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Creates RDFMetadata from data returned by to_bytes
+
+        :param data:    bytes
+        :return:        new RDFMetadata
+        :raises ValueError: if data are not serialized metadata or have unsupported format version
+        """
+        subject, values, embedded, removed, added, etag, last_modified = load_metadata(data)
+        ret = cls(subject)
+        ret.__values            = values
+        ret.__embedded          = embedded or _EMPTY
+        ret.__removed_triplets  = {p: list(v) for p, v in removed.items()}
+        ret.__added_triplets    = {p: list(v) for p, v in added.items()}
+        ret.etag                = etag
+        ret.last_modified       = last_modified
+        return ret
+
+    def __reduce__(self):
+        return RDFMetadata.from_bytes, (self.to_bytes(),)
+
+    def __refresh_server_managed(self, predicate=None):
+        if self.__refetch is None or (predicate is not None and not is_server_managed(predicate)):
+            return
+
+        refetch, self.__refetch = self.__refetch, None
+        log.debug('Refetching server-managed triples of %s', self.__id)
+        self.update_server_managed(refetch())
+
+    def update_server_managed(self, fresh):
+        """
+        Replaces server-managed triples (see is_server_managed) and embedded children with those of metadata
+        freshly fetched from the server and adds the types the server has added. ETag and Last-Modified are
+        taken from the fresh metadata as well.
+
+        :param fresh:   RDFMetadata of this resource fetched from the server
+        """
+        self.__refetch = None
+        for p, values in self.__predicate_objects():
+            if is_server_managed(p):
+                self.__set_objects(p, ())
+
+        for p, values in fresh.__predicate_objects():
+            if is_server_managed(p):
+                for o in values:
+                    self.__add_to_metadata_only(p, o)
+            elif p == RDF.type:
+                for o in values:
+                    if is_server_managed_type(o):
+                        self.__add_to_metadata_only(p, o)
+
+        # embedded children
+        for s, p, o in fresh.__embedded_triples():
+            self.__add_embedded(s, p, o)
+
+        self.etag          = fresh.etag
+        self.last_modified = fresh.last_modified
+
+    @property
+    def rdf_metadata(self):
+        """
+        rdflib.Graph with all the triples. The graph is built on the first access and is used instead of
+        the internal dictionaries from then on, so that changes made directly to the graph are visible.
+        """
+        self.__refresh_server_managed()
+        if self.__graph is None:
+            self.__graph    = self.__build_graph()
+            self.__values   = None
+            self.__embedded = None
+        return self.__graph
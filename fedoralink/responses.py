@@ -0,0 +1,56 @@
+import logging
+
+from django.http import StreamingHttpResponse
+
+log = logging.getLogger('fedoralink.responses')
+
+# headers of Fedora's response to a (possibly ranged) binary request that are passed to the client
+PROXIED_HEADERS = ('Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Last-Modified')
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _stream_content(stream, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    try:
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            yield data
+    finally:
+        # return the connection to the pool even if the client has not read the whole content
+        release = getattr(stream, 'release_conn', None) or stream.close
+        release()
+
+
+def bitstream_response(request, fedora_object, filename=None, disposition='inline'):
+    """
+    Streams the binary content of fedora_object to the client. Range and If-Range headers of the request are
+    passed to Fedora so that partial content (206) is proxied back without downloading the whole binary.
+
+    :param request:         django request
+    :param fedora_object:   instance of FedoraObject representing a binary resource
+    :param filename:        filename for Content-Disposition header, the filename stored in Fedora if None
+    :param disposition:     'inline' or 'attachment'
+    :return:                StreamingHttpResponse
+    """
+    range_header = request.META.get('HTTP_RANGE')
+    bitstream = fedora_object.get_bitstream(range=range_header, if_range=request.META.get('HTTP_IF_RANGE'))
+    upstream = bitstream.stream
+
+    status = getattr(upstream, 'status', 200)
+    log.debug('Bitstream %s, range %s, upstream status %s', fedora_object.id, range_header, status)
+
+    resp = StreamingHttpResponse(_stream_content(upstream), status=status, content_type=bitstream.mimetype)
+    upstream_headers = getattr(upstream, 'headers', {})
+    for header in PROXIED_HEADERS:
+        value = upstream_headers.get(header)
+        if value is not None:
+            resp[header] = value
+
+    filename = filename or bitstream.filename
+    if filename:
+        resp['Content-Disposition'] = '%s; filename="%s"' % (disposition, filename)
+    else:
+        resp['Content-Disposition'] = disposition
+    return resp
@@ -0,0 +1,324 @@
+"""
+Compact binary format of RDFMetadata and FedoraObject, used when the objects are pickled (for example when stored
+in django cache).
+
+Layout:
+
+    header          b'FLK', FORMAT_VERSION, kind (METADATA or OBJECT)
+
+    metadata        id, etag, last_modified (strings), own values (predicates), embedded subjects,
+                    removed triples (predicates), added triples (predicates)
+    object          number of classes, class fullnames (strings), slug (string), flags, metadata with header
+
+    predicates      number of predicates, then for each: predicate (node), number of values, values (nodes)
+    embedded        number of subjects, then for each: subject (node), predicates
+    node            varint n >= 1 for the (n-1)-th node already seen in the data, or varint 0 followed by
+                    tag (URIREF, LITERAL, LANG_LITERAL, TYPED_LITERAL, BNODE), lexical form (string) and
+                    language or datatype (string) for LANG_LITERAL and TYPED_LITERAL
+    string          varint 0 for None, 1 followed by varint length and utf-8 bytes for a string seen for the
+                    first time, n >= 2 for the (n-2)-th string already seen in the data
+    varint          unsigned LEB128
+
+Repeated nodes (predicates, types, parents, ...) and strings (datatypes, languages) are written only once.
+Terms are taken from the default term pool when the data are loaded, the writer recognizes repeated nodes
+by identity, so pooled terms are the cheapest to write.
+"""
+
+import rdflib
+
+from .term_pool import get_term_pool
+
+MAGIC          = b'FLK'
+FORMAT_VERSION = 1
+
+# kinds of serialized data
+METADATA = 1
+OBJECT   = 2
+
+# node tags
+URIREF        = 0
+LITERAL       = 1
+LANG_LITERAL  = 2
+TYPED_LITERAL = 3
+BNODE         = 4
+
+# object flags
+FLAG_INCOMPLETE = 1
+FLAG_BOUND      = 2         # the class was generated by FedoraTypeManager from the serialized classes
+
+
+class _Writer:
+    def __init__(self, kind):
+        self.out     = bytearray(MAGIC)
+        self.out.append(FORMAT_VERSION)
+        self.out.append(kind)
+        self.strings = {}
+        # id of node -> index, the nodes are kept so that their ids are not reused
+        self.nodes   = {}
+        self.written = []
+
+    def varint(self, value):
+        out = self.out
+        while value >= 0x80:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    def string(self, value):
+        if value is None:
+            self.out.append(0)
+            return
+        index = self.strings.get(value)
+        if index is not None:
+            self.varint(index + 2)
+            return
+        self.strings[value] = len(self.strings)
+        data = value.encode('utf-8')
+        self.out.append(1)
+        self.varint(len(data))
+        self.out += data
+
+    def blob(self, data):
+        self.varint(len(data))
+        self.out += data
+
+    def node(self, node):
+        index = self.nodes.get(id(node))
+        if index is None:
+            self.new_node(node)
+        elif index < 0x7f:
+            self.out.append(index + 1)
+        else:
+            self.varint(index + 1)
+
+    def new_node(self, node):
+        self.nodes[id(node)] = len(self.written)
+        self.written.append(node)
+        self.out.append(0)
+        if isinstance(node, rdflib.URIRef):
+            self.out.append(URIREF)
+            self.string(str(node))
+        elif isinstance(node, rdflib.Literal):
+            if node.language:
+                self.out.append(LANG_LITERAL)
+                self.string(str(node))
+                self.string(node.language)
+            elif node.datatype:
+                self.out.append(TYPED_LITERAL)
+                self.string(str(node))
+                self.string(str(node.datatype))
+            else:
+                self.out.append(LITERAL)
+                self.string(str(node))
+        elif isinstance(node, rdflib.BNode):
+            self.out.append(BNODE)
+            self.string(str(node))
+        else:
+            raise TypeError('Can not serialize node %r' % (node,))
+
+    def predicates(self, predicates):
+        """
+        :param predicates:  list of (predicate, iterable of values)
+        """
+        out, nodes, node, varint = self.out, self.nodes, self.node, self.varint
+        varint(len(predicates))
+        for predicate, values in predicates:
+            node(predicate)
+            varint(len(values))
+            # node() inlined, most values are short references to nodes already written
+            for value in values:
+                index = nodes.get(id(value))
+                if index is None:
+                    self.new_node(value)
+                elif index < 0x7f:
+                    out.append(index + 1)
+                else:
+                    varint(index + 1)
+
+
+class _Reader:
+    def __init__(self, data, kind):
+        if bytes(data[:3]) != MAGIC or len(data) < 5:
+            raise ValueError('Not a serialized fedoralink %s' % ('object' if kind == OBJECT else 'metadata'))
+        if data[3] != FORMAT_VERSION:
+            raise ValueError('Unsupported serialization format version %d, expected %d' % (data[3], FORMAT_VERSION))
+        if data[4] != kind:
+            raise ValueError('Serialized data of kind %d, expected %d' % (data[4], kind))
+        self.data    = memoryview(data)
+        self.pos     = 5
+        self.strings = []
+        self.nodes   = []
+        self.pool    = get_term_pool()
+
+    def varint(self):
+        data, pos = self.data, self.pos
+        value = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        self.pos = pos
+        return value
+
+    def string(self):
+        code = self.varint()
+        if code == 0:
+            return None
+        if code >= 2:
+            return self.strings[code - 2]
+        value = self.blob().decode('utf-8')
+        self.strings.append(value)
+        return value
+
+    def blob(self):
+        length = self.varint()
+        value = bytes(self.data[self.pos:self.pos + length])
+        self.pos += length
+        return value
+
+    def byte(self):
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def node(self):
+        index = self.varint()
+        if index:
+            return self.nodes[index - 1]
+        tag = self.byte()
+        if tag == URIREF:
+            node = self.pool.uri(self.string())
+        elif tag == LITERAL:
+            node = self.pool.literal(self.string())
+        elif tag == LANG_LITERAL:
+            lexical = self.string()
+            node = self.pool.literal(lexical, lang=self.string())
+        elif tag == TYPED_LITERAL:
+            lexical = self.string()
+            node = self.pool.literal(lexical, datatype=self.pool.uri(self.string()))
+        elif tag == BNODE:
+            node = rdflib.BNode(self.string())
+        else:
+            raise ValueError('Unknown node tag %d at %d' % (tag, self.pos - 1))
+        self.nodes.append(node)
+        return node
+
+    def predicates(self):
+        """
+        :return: dict predicate -> tuple of values
+        """
+        ret = {}
+        for _ in range(self.varint()):
+            predicate = self.node()
+            ret[predicate] = tuple(self.node() for _ in range(self.varint()))
+        return ret
+
+
+def dump_metadata(subject, values, embedded, removed, added, etag=None, last_modified=None):
+    """
+    Serializes the state of RDFMetadata, see RDFMetadata.to_bytes
+
+    :param subject:         id of the resource
+    :param values:          list of (predicate, values) with subject=id
+    :param embedded:        list of (subject, list of (predicate, values)) about other subjects
+    :param removed:         dictionary predicate -> list of removed values
+    :param added:           dictionary predicate -> list of added values
+    :param etag:            ETag of the metadata
+    :param last_modified:   Last-Modified of the metadata
+    :return:                bytes
+    """
+    writer = _Writer(METADATA)
+    writer.node(subject)
+    writer.string(etag)
+    writer.string(last_modified)
+    writer.predicates(values)
+    writer.varint(len(embedded))
+    for embedded_subject, predicates in embedded:
+        writer.node(embedded_subject)
+        writer.predicates(predicates)
+    writer.predicates(list(removed.items()))
+    writer.predicates(list(added.items()))
+    return bytes(writer.out)
+
+
+def load_metadata(data):
+    """
+    Deserializes data written by dump_metadata
+
+    :param data:    bytes
+    :return:        tuple (subject, values, embedded, removed, added, etag, last_modified), values are dictionaries
+                    predicate -> tuple of values, embedded is dictionary subject -> values
+    :raises ValueError: if the data are not serialized metadata or have unsupported format version
+    """
+    reader = _Reader(data, METADATA)
+    subject       = reader.node()
+    etag          = reader.string()
+    last_modified = reader.string()
+    values        = reader.predicates()
+    embedded      = {}
+    for _ in range(reader.varint()):
+        embedded_subject = reader.node()
+        embedded[embedded_subject] = reader.predicates()
+    removed       = reader.predicates()
+    added         = reader.predicates()
+    return subject, values, embedded, removed, added, etag, last_modified
+
+
+def dumps_object(obj):
+    """
+    Serializes FedoraObject together with the fullnames of its model classes. Connection, children and local
+    bitstream of the object are not serialized.
+
+    :param obj:     instance of FedoraObject
+    :return:        bytes
+    """
+    from .utils import fullname
+
+    clz = type(obj)
+    bound = getattr(clz, '_is_bound', False)
+    classes = clz._type if bound else [clz]
+
+    writer = _Writer(OBJECT)
+    writer.varint(len(classes))
+    for c in classes:
+        writer.string(fullname(c))
+    writer.string(obj.slug)
+    writer.varint((FLAG_INCOMPLETE if obj.is_incomplete else 0) | (FLAG_BOUND if bound else 0))
+    writer.blob(obj.metadata.to_bytes())
+    return bytes(writer.out)
+
+
+def loads_object(data, connection=None):
+    """
+    Deserializes FedoraObject written by dumps_object. Model classes are imported by their fullnames, objects
+    of generated classes get the same generated class as when they are fetched from the server.
+
+    :param data:        bytes
+    :param connection:  connection of the object, the default connection of the model class if None
+    :return:            instance of FedoraObject
+    :raises ValueError: if the data are not serialized object or have unsupported format version
+    """
+    from django.utils.module_loading import import_string
+
+    from .models import FedoraObject
+    from .rdfmetadata import RDFMetadata
+    from .type_manager import FedoraTypeManager
+
+    reader = _Reader(data, OBJECT)
+    classes = [import_string(reader.string()) for _ in range(reader.varint())]
+    for c in classes:
+        if not isinstance(c, type) or not issubclass(c, FedoraObject):
+            raise TypeError('%s is not a subclass of FedoraObject' % c)
+    slug  = reader.string()
+    flags = reader.varint()
+    metadata = RDFMetadata.from_bytes(reader.blob())
+
+    clz = FedoraTypeManager.generate_class(classes) if flags & FLAG_BOUND else classes[0]
+    if connection is None:
+        connection = getattr(clz, 'objects').connection
+    ret = clz(__metadata=metadata, __connection=connection, __slug=slug)
+    ret.is_incomplete = bool(flags & FLAG_INCOMPLETE)
+    return ret
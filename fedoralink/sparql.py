@@ -1,80 +1,67 @@
-from rdflib import Literal
-from rdflib.exceptions import Error
+import logging
+
+from rdflib import Literal, URIRef
 
 from fedoralink.fedorans import FEDORA
 
 __author__ = 'simeki'
 
-from rdflib.plugins.serializers.turtle import TurtleSerializer, VERB, OBJECT
-
-
-class SparqlSerializer(TurtleSerializer):
-
-    def __init__(self, base, deleted_triplets, inserted_triplets):
-        super().__init__(base)
-        self.deleted_triplets = deleted_triplets
-        self.inserted_triplets = inserted_triplets
-
-    def serialize(self, stream, base=None, encoding=None, spacious=None, **args):
-        self.reset()
-        self.stream = stream
-        self.base = base
-
-        if spacious is not None:
-            self._spacious = spacious
-
-        # self.preprocess()
-        # subjects_list = self.orderSubjects()
-
-        self.startDocument()
-
-        self.write('DELETE {\n')
-
-        for predicate, objects in self.deleted_triplets.items():
-            for object in objects:
-                self.write('    <> ')
-                self.path(predicate, VERB)
-                self.path(object, OBJECT)
-                self.write(' .\n')
-
-        self.write('}\n')
-
-        self.write('INSERT {\n')
-
-        for predicate, objects in self.inserted_triplets.items():
-            if str(predicate).startswith(str(FEDORA)):
-                continue
-            for object in objects:
-                self.write('    <> ')
-                self.path(predicate, VERB)
-                self.path(object, OBJECT)
-                self.write(' .\n')
-
-
-        self.write('}\n')
-
-        self.write('WHERE { }\n')
-
-        self.endDocument()
-        stream.write("\n".encode('ascii'))
-
-    def startDocument(self):
-        self._started = True
-        ns_list = sorted(self.namespaces.items())
-        for prefix, uri in ns_list:
-            if prefix:
-                self.write(self.indent() + 'PREFIX %s: <%s>\n' % (prefix, uri))
-        if ns_list and self._spacious:
-            self.write('\n')
-
-
-    def label(self, node, position):
-        if isinstance(node, Literal):
-            if not node.datatype and not node.language:
-                raise AttributeError("Datatype or language required on RDF node")
-
-            return node._literal_n3(
-                use_plain=True,
-                qname_callback=lambda dt: None)
-        return super().label(node, position)
-
+log = logging.getLogger('fedoralink.sparql')
+
+# characters escaped in the lexical form of literals, see STRING_LITERAL_QUOTE in n-triples grammar
+_LITERAL_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '"':  '\\"',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+_FEDORA = str(FEDORA)
+
+
+def _node(node):
+    """
+    Returns n-triples representation of an URIRef or Literal
+    """
+    if isinstance(node, Literal):
+        lexical = '"%s"' % str(node).translate(_LITERAL_ESCAPES)
+        if node.language:
+            return '%s@%s' % (lexical, node.language)
+        if node.datatype:
+            return '%s^^<%s>' % (lexical, node.datatype)
+        raise AttributeError("Datatype or language required on RDF node")
+    if isinstance(node, URIRef):
+        return '<%s>' % node
+    return node.n3()
+
+
+def _triples(out, triplets, skip_fedora=False):
+    for predicate, objects in triplets.items():
+        if skip_fedora and str(predicate).startswith(_FEDORA):
+            if objects:
+                log.warning('Values of %s are maintained by Fedora server, not inserting %s', predicate,
+                            ', '.join(_node(obj) for obj in objects))
+            continue
+        predicate = '    <> <%s> ' % predicate
+        for obj in objects:
+            out.append(predicate)
+            out.append(_node(obj))
+            out.append(' .\n')
+
+
+def serialize_update(deleted_triplets, inserted_triplets):
+    """
+    Serializes changes of a resource as SPARQL update. Triples are written in n-triples syntax with full IRIs,
+    so that the update does not depend on prefixes registered in Fedora. Predicates in fedora namespace
+    are never inserted, they are maintained by the server - a warning is logged if there are values to insert.
+
+    :param deleted_triplets:    dictionary predicate -> list of removed values
+    :param inserted_triplets:   dictionary predicate -> list of added values
+    :return:                    bytes with the update
+    """
+    out = ['DELETE {\n']
+    _triples(out, deleted_triplets)
+    out.append('}\nINSERT {\n')
+    _triples(out, inserted_triplets, skip_fedora=True)
+    out.append('}\nWHERE { }\n\n')
+    return ''.join(out).encode('utf-8')
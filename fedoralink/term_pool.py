@@ -0,0 +1,132 @@
+import logging
+import sys
+import threading
+
+import rdflib
+
+log = logging.getLogger('fedoralink.term_pool')
+
+
+class TermPool:
+    """
+    Interning pool of rdflib terms. Metadata of many objects repeat the same predicates, rdf types, datatypes
+    and often the values as well - terms obtained through the pool share a single instance.
+
+    The pool is cleared when it grows over max_terms, terms in use stay valid, the frequent ones get
+    pooled again quickly. Statistics are approximate if the pool is used from several threads.
+    """
+
+    def __init__(self, max_terms=100000):
+        """
+        :param max_terms:   maximum number of pooled URIRefs and (separately) Literals
+        """
+        self._max_terms   = max_terms
+        self._uris        = {}          # str -> URIRef
+        self._literals    = {}          # Literal or (type of value, value, lang, datatype) -> Literal
+        self.lookups      = 0
+        self.hits         = 0
+        self.bytes_saved  = 0
+
+    def term(self, term):
+        """
+        Returns the pooled instance equal to the term. Other nodes than URIRef and Literal are returned as they are.
+
+        :param term:    rdflib.URIRef or rdflib.Literal
+        """
+        if type(term) is rdflib.URIRef:
+            pool, key = self._uris, str(term)
+        elif type(term) is rdflib.Literal:
+            pool, key = self._literals, term
+        else:
+            return term
+        self.lookups += 1
+        ret = pool.get(key)
+        if ret is not None:
+            self._hit(ret)
+            return ret
+        self._add(pool, key, term)
+        return term
+
+    def uri(self, value):
+        """
+        Returns pooled URIRef(value)
+        """
+        key = str(value)
+        self.lookups += 1
+        ret = self._uris.get(key)
+        if ret is not None:
+            self._hit(ret)
+            return ret
+        ret = rdflib.URIRef(value)
+        self._add(self._uris, key, ret)
+        return ret
+
+    def literal(self, value, lang=None, datatype=None):
+        """
+        Returns pooled Literal(value, lang=lang, datatype=datatype)
+        """
+        key = (type(value), value, lang, datatype)
+        self.lookups += 1
+        try:
+            ret = self._literals.get(key)
+        except TypeError:
+            # unhashable value
+            return rdflib.Literal(value, lang=lang, datatype=datatype)
+        if ret is not None:
+            self._hit(ret)
+            return ret
+        ret = rdflib.Literal(value, lang=lang, datatype=datatype)
+        # share the instance with an equal literal pooled by term()
+        ret = self._literals.get(ret, ret)
+        self._add(self._literals, key, ret)
+        self._literals.setdefault(ret, ret)
+        return ret
+
+    def _hit(self, term):
+        self.hits += 1
+        self.bytes_saved += sys.getsizeof(term)
+
+    def _add(self, pool, key, term):
+        if len(pool) >= self._max_terms:
+            log.debug('Term pool full, clearing %d terms', len(pool))
+            pool.clear()
+        pool[key] = term
+
+    def stats(self):
+        """
+        :return: dictionary with the number of pooled terms, lookups, hits, hit_rate and bytes_saved - the total
+                 size of pooled instances returned instead of new ones
+        """
+        return {
+            'terms':        len(self._uris) + len(self._literals),
+            'lookups':      self.lookups,
+            'hits':         self.hits,
+            'hit_rate':     self.hits / self.lookups if self.lookups else 0.0,
+            'bytes_saved':  self.bytes_saved,
+        }
+
+    def clear(self):
+        self._uris.clear()
+        self._literals.clear()
+        self.lookups     = 0
+        self.hits        = 0
+        self.bytes_saved = 0
+
+
+_pools      = {}
+_pools_lock = threading.Lock()
+
+
+def get_term_pool(key='default', max_terms=100000):
+    """
+    Returns a process-wide TermPool registered under the given key, creating it if necessary
+
+    :param key:         key of the pool
+    :param max_terms:   see TermPool, used only when the pool is created
+    :return:            instance of TermPool
+    """
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = TermPool(max_terms)
+        return pool
@@ -0,0 +1,5 @@
+"""
+Stand-ins of the services fedoralink talks to, for tests and benchmarks that must run without them
+"""
+from .elasticsearch import FakeElasticsearch, FakeElasticsearchServer
+from .fedora import FakeFedora, FakeFedoraServer
@@ -0,0 +1,630 @@
+import functools
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from .server import REASONS, WSGIServerThread
+
+log = logging.getLogger('fedoralink.testing.elasticsearch')
+
+TEXT_TYPES = ('text', 'string')
+
+
+class _EsError(Exception):
+    def __init__(self, status, error_type, reason):
+        super().__init__(reason)
+        self.status     = status
+        self.error_type = error_type
+        self.reason     = reason
+
+
+class _Document:
+    def __init__(self, index, doc_type, doc_id, source, version):
+        self.index    = index
+        self.doc_type = doc_type
+        self.id       = doc_id
+        self.source   = source
+        self.version  = version
+        # dotted path -> list of values, with copy_to fields of the mapping, filled by _Index.analyze
+        self.fields   = {}
+        self.types    = {}
+
+    def hit(self, sort_values=None):
+        ret = {
+            '_index':  self.index,
+            '_type':   self.doc_type,
+            '_id':     self.id,
+            '_score':  1.0,
+            '_source': self.source,
+        }
+        if sort_values is not None:
+            ret['sort'] = sort_values
+        return ret
+
+
+class _Index:
+    def __init__(self, name, settings=None, mappings=None):
+        self.name     = name
+        self.settings = settings or {}
+        self.mappings = {}
+        self.docs     = OrderedDict()           # (doc_type, id) -> _Document
+        for doc_type, mapping in (mappings or {}).items():
+            self.put_mapping(doc_type, mapping)
+
+    def put_mapping(self, doc_type, mapping):
+        existing = self.mappings.setdefault(doc_type, {})
+        for k, v in mapping.items():
+            if k == 'properties':
+                existing.setdefault('properties', {}).update(v)
+            else:
+                existing[k] = v
+        for doc in self.docs.values():
+            if doc.doc_type == doc_type:
+                self.analyze(doc)
+
+    def analyze(self, doc):
+        """
+        Flattens the source of the document to dotted paths and applies copy_to of the mapping
+        """
+        doc.fields = {}
+        _flatten(doc.source, '', doc.fields)
+        doc.types = {}
+        copies = []
+        _mapping_paths(self.mappings.get(doc.doc_type, {}).get('properties', {}), '', doc.types, copies)
+        for source_path, targets in copies:
+            values = doc.fields.get(source_path)
+            if values:
+                for target in targets:
+                    doc.fields.setdefault(target, []).extend(values)
+
+
+def _flatten(value, path, fields):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(v, path + '.' + k if path else k, fields)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _flatten(v, path, fields)
+    elif value is not None:
+        fields.setdefault(path, []).append(value)
+
+
+def _mapping_paths(properties, prefix, types, copies):
+    for name, props in properties.items():
+        path = prefix + name
+        types[path] = props.get('type', 'object')
+        copy_to = props.get('copy_to')
+        if copy_to:
+            copies.append((path, [copy_to] if isinstance(copy_to, str) else copy_to))
+        if 'properties' in props:
+            _mapping_paths(props['properties'], path + '.', types, copies)
+
+
+def _tokens(value):
+    return re.findall(r'\w+', str(value).lower())
+
+
+def _equals(a, b):
+    if isinstance(a, bool) or isinstance(b, bool):
+        return str(a).lower() == str(b).lower()
+    return a == b or str(a) == str(b)
+
+
+def _compare(a, b):
+    """
+    compares two field values - numerically if both are numbers, as strings otherwise (iso dates compare fine)
+    """
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return (a > b) - (a < b)
+    a, b = str(a), str(b)
+    return (a > b) - (a < b)
+
+
+def _as_list(clause):
+    if clause is None:
+        return []
+    if isinstance(clause, list):
+        return clause
+    return [clause]
+
+
+def _single_field(clause, query_type):
+    if not isinstance(clause, dict) or len(clause) != 1:
+        raise _EsError(400, 'parsing_exception', '[%s] query requires exactly one field' % query_type)
+    return next(iter(clause.items()))
+
+
+class FakeElasticsearch:
+    """
+    WSGI application implementing in memory the subset of the Elasticsearch 5 REST api used by ElasticIndexer:
+    index create/exists/delete, put/get mapping, index/get/delete of documents, _bulk, _search and _count.
+
+    Search supports bool, term, terms, range, match, exists, ids, nested and match_all queries, terms
+    aggregations (also inside nested), sort, from/size and search_after. Documents are searchable immediately
+    (as if refreshed), copy_to of the mappings is honoured, text fields are matched by lowercased words without
+    stemming and all hits have score 1. Other parts of requests (highlight, _source filtering, ...) are ignored.
+
+    Counts of requests by operation ('search', 'bulk', 'index', ...) are in `counts`.
+    Use FakeElasticsearchServer to run it on localhost.
+    """
+
+    def __init__(self, latency=0, fail=None):
+        """
+        :param latency: seconds added to each request, or a function (method, path) -> seconds
+        :param fail:    function (method, path) -> http status of an injected failure or None
+        """
+        self.latency  = latency
+        self.fail     = fail
+        self.counts   = Counter()
+        self._lock    = threading.RLock()
+        self._indices = OrderedDict()
+
+    def reset_stats(self):
+        with self._lock:
+            self.counts = Counter()
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        path   = environ.get('PATH_INFO', '')
+
+        delay = self.latency(method, path) if callable(self.latency) else self.latency
+        if delay:
+            time.sleep(delay)
+
+        body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+
+        try:
+            failure = self.fail(method, path) if self.fail is not None else None
+            if failure:
+                raise _EsError(failure, 'injected_failure', 'Injected failure')
+            with self._lock:
+                status, data = self._dispatch(method, [x for x in path.split('/') if x], body)
+        except _EsError as e:
+            status, data = e.status, {'error': {'type': e.error_type, 'reason': e.reason}, 'status': e.status}
+
+        data = json.dumps(data).encode('utf-8') if data is not None else b''
+        start_response('%s %s' % (status, REASONS.get(status, 'Unknown')),
+                       [('Content-Type', 'application/json; charset=UTF-8'), ('Content-Length', str(len(data)))])
+        return [data] if method != 'HEAD' else []
+
+    def _dispatch(self, method, parts, body):
+        endpoint = next((x for x in parts if x.startswith('_')), None)
+        before = parts[:parts.index(endpoint)] if endpoint else parts
+        after  = parts[parts.index(endpoint) + 1:] if endpoint else []
+
+        if endpoint in ('_search', '_count'):
+            self.counts[endpoint[1:]] += 1
+            query = self._parse_json(body) or {}
+            indices = self._get_indices(before[0] if before else None)
+            doc_type = before[1] if len(before) > 1 else None
+            if endpoint == '_count':
+                return 200, self._count(indices, doc_type, query)
+            return 200, self._search(indices, doc_type, query)
+
+        if endpoint == '_bulk':
+            self.counts['bulk'] += 1
+            return 200, self._bulk(before, body)
+
+        if endpoint == '_mapping':
+            index = self._get_index(before[0])
+            if method in ('PUT', 'POST'):
+                self.counts['put_mapping'] += 1
+                doc_type = after[0] if after else before[1]
+                index.put_mapping(doc_type, self._parse_json(body) or {})
+                return 200, {'acknowledged': True}
+            self.counts['get_mapping'] += 1
+            doc_types = after[0].split(',') if after else list(index.mappings)
+            return 200, {index.name: {'mappings': {k: v for k, v in index.mappings.items() if k in doc_types}}}
+
+        if endpoint is not None:
+            raise _EsError(400, 'illegal_argument_exception', 'Unsupported endpoint %s' % endpoint)
+
+        if len(parts) == 1:
+            return self._index_operation(method, parts[0], body)
+
+        if len(parts) in (2, 3):
+            return self._document_operation(method, parts, body)
+
+        raise _EsError(400, 'illegal_argument_exception', 'Unsupported request %s /%s' % (method, '/'.join(parts)))
+
+    @staticmethod
+    def _parse_json(body):
+        if not body:
+            return None
+        try:
+            return json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            raise _EsError(400, 'parse_exception', 'Failed to parse request body: %s' % e)
+
+    def _get_index(self, name):
+        index = self._indices.get(name)
+        if index is None:
+            raise _EsError(404, 'index_not_found_exception', 'no such index [%s]' % name)
+        return index
+
+    def _get_indices(self, names):
+        if names is None or names in ('_all', '*'):
+            return list(self._indices.values())
+        return [self._get_index(x) for x in names.split(',')]
+
+    def _get_or_create_index(self, name):
+        if name not in self._indices:
+            self._indices[name] = _Index(name)
+        return self._indices[name]
+
+    # indices
+
+    def _index_operation(self, method, name, body):
+        if method == 'HEAD':
+            self.counts['exists'] += 1
+            return (200 if name in self._indices else 404), None
+        if method == 'PUT':
+            self.counts['create'] += 1
+            if name in self._indices:
+                raise _EsError(400, 'index_already_exists_exception', 'index [%s] already exists' % name)
+            body = self._parse_json(body) or {}
+            self._indices[name] = _Index(name, body.get('settings'), body.get('mappings'))
+            return 200, {'acknowledged': True, 'shards_acknowledged': True}
+        if method == 'DELETE':
+            self.counts['delete_index'] += 1
+            self._get_index(name)
+            del self._indices[name]
+            return 200, {'acknowledged': True}
+        if method == 'GET':
+            index = self._get_index(name)
+            return 200, {name: {'settings': index.settings, 'mappings': index.mappings}}
+        raise _EsError(405, 'method_not_allowed', 'Method %s not allowed' % method)
+
+    # documents
+
+    def _document_operation(self, method, parts, body):
+        index_name, doc_type = parts[0], parts[1]
+        doc_id = parts[2] if len(parts) > 2 else None
+
+        if method in ('PUT', 'POST'):
+            self.counts['index'] += 1
+            return self._index_document(index_name, doc_type, doc_id, self._parse_json(body) or {})
+
+        if doc_id is None:
+            raise _EsError(400, 'illegal_argument_exception', 'Document id is required')
+
+        if method in ('GET', 'HEAD'):
+            self.counts['get'] += 1
+            doc = self._get_index(index_name).docs.get((doc_type, doc_id))
+            if doc is None:
+                return 404, {'_index': index_name, '_type': doc_type, '_id': doc_id, 'found': False}
+            ret = doc.hit()
+            del ret['_score']
+            ret.update({'_version': doc.version, 'found': True})
+            return 200, ret
+
+        if method == 'DELETE':
+            self.counts['delete'] += 1
+            return self._delete_document(index_name, doc_type, doc_id)
+
+        raise _EsError(405, 'method_not_allowed', 'Method %s not allowed' % method)
+
+    def _index_document(self, index_name, doc_type, doc_id, source):
+        index = self._get_or_create_index(index_name)
+        if doc_id is None:
+            doc_id = uuid.uuid4().hex
+        existing = index.docs.get((doc_type, doc_id))
+        doc = _Document(index_name, doc_type, doc_id, source, existing.version + 1 if existing else 1)
+        index.analyze(doc)
+        index.docs[(doc_type, doc_id)] = doc
+        return (200 if existing else 201), {
+            '_index': index_name, '_type': doc_type, '_id': doc_id, '_version': doc.version,
+            'result': 'updated' if existing else 'created', 'created': not existing,
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0}
+        }
+
+    def _delete_document(self, index_name, doc_type, doc_id):
+        index = self._indices.get(index_name)
+        doc = index.docs.pop((doc_type, doc_id), None) if index else None
+        ret = {'_index': index_name, '_type': doc_type, '_id': doc_id, 'found': doc is not None,
+               'result': 'deleted' if doc else 'not_found', '_version': doc.version + 1 if doc else 1,
+               '_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+        return (200 if doc else 404), ret
+
+    def _bulk(self, path_parts, body):
+        lines = [x for x in body.decode('utf-8').split('\n') if x.strip()]
+        lines = iter(lines)
+        items = []
+        errors = False
+        for line in lines:
+            action = json.loads(line)
+            op, meta = next(iter(action.items()))
+            index_name = meta.get('_index', path_parts[0] if path_parts else None)
+            doc_type = meta.get('_type', path_parts[1] if len(path_parts) > 1 else None)
+            doc_id = meta.get('_id')
+            if op in ('index', 'create'):
+                source = json.loads(next(lines))
+                status, result = self._index_document(index_name, doc_type, doc_id, source)
+            elif op == 'delete':
+                status, result = self._delete_document(index_name, doc_type, doc_id)
+            else:
+                # update is not supported, its body is skipped
+                if op == 'update':
+                    next(lines)
+                status = 400
+                result = {'_index': index_name, '_type': doc_type, '_id': doc_id,
+                          'error': {'type': 'illegal_argument_exception', 'reason': 'Unsupported operation ' + op}}
+                errors = True
+            result['status'] = status
+            items.append({op: result})
+        return {'took': 1, 'errors': errors, 'items': items}
+
+    # search
+
+    def _matching(self, indices, doc_type, query):
+        docs = itertools.chain.from_iterable(x.docs.values() for x in indices)
+        if doc_type:
+            doc_types = doc_type.split(',')
+            docs = (x for x in docs if x.doc_type in doc_types)
+        query = query.get('query', {'match_all': {}})
+        return [x for x in docs if self._matches(x, query)]
+
+    def _count(self, indices, doc_type, body):
+        return {'count': len(self._matching(indices, doc_type, body)),
+                '_shards': {'total': len(indices), 'successful': len(indices), 'failed': 0}}
+
+    def _search(self, indices, doc_type, body):
+        docs = self._matching(indices, doc_type, body)
+
+        sort = self._parse_sort(body.get('sort'))
+        sort_values = None
+        if sort:
+            sort_values = {id(doc): [self._sort_value(doc, field, order, missing) for field, order, missing in sort]
+                           for doc in docs}
+            comparator = functools.partial(self._compare_sort_values, sort)
+            docs.sort(key=lambda doc: functools.cmp_to_key(comparator)(sort_values[id(doc)]))
+
+            search_after = body.get('search_after')
+            if search_after is not None:
+                if len(search_after) != len(sort):
+                    raise _EsError(400, 'illegal_argument_exception',
+                                   'search_after has %d value(s) but sort has %d' % (len(search_after), len(sort)))
+                docs = [x for x in docs if comparator(sort_values[id(x)], search_after) > 0]
+        elif body.get('search_after') is not None:
+            raise _EsError(400, 'illegal_argument_exception', 'search_after requires sort')
+
+        start = int(body.get('from', 0))
+        size  = int(body.get('size', 10))
+        hits = [doc.hit(sort_values[id(doc)] if sort else None) for doc in docs[start:start + size]]
+
+        ret = {
+            'took': 1,
+            'timed_out': False,
+            '_shards': {'total': len(indices), 'successful': len(indices), 'failed': 0},
+            'hits': {
+                'total': len(docs),
+                'max_score': 1.0 if docs and not sort else None,
+                'hits': hits
+            }
+        }
+        aggs = body.get('aggs', body.get('aggregations'))
+        if aggs:
+            ret['aggregations'] = self._aggregate(self._matching_for_aggs(body, indices, doc_type, docs), aggs)
+        return ret
+
+    def _matching_for_aggs(self, body, indices, doc_type, docs):
+        if body.get('search_after') is None:
+            return docs
+        # aggregations are computed over all matching documents, not only those after search_after
+        return self._matching(indices, doc_type, body)
+
+    @staticmethod
+    def _parse_sort(sort):
+        ret = []
+        for item in _as_list(sort):
+            if isinstance(item, str):
+                field, options = item, {}
+            else:
+                field, options = next(iter(item.items()))
+            if isinstance(options, str):
+                options = {'order': options}
+            default_order = 'desc' if field == '_score' else 'asc'
+            ret.append((field, options.get('order', default_order), options.get('missing', '_last')))
+        return ret
+
+    @staticmethod
+    def _sort_value(doc, field, order, missing):
+        if field == '_score':
+            return 1.0
+        if field in ('_id', '_uid'):
+            return doc.id
+        if field == '_doc':
+            return 0
+        values = doc.fields.get(field)
+        if not values:
+            return None if missing in ('_last', '_first') else missing
+        # multi valued fields sort by min when ascending and by max when descending
+        values = sorted(values, key=functools.cmp_to_key(_compare))
+        return values[0] if order == 'asc' else values[-1]
+
+    @staticmethod
+    def _compare_sort_values(sort, a, b):
+        for (field, order, missing), x, y in zip(sort, a, b):
+            if x is None or y is None:
+                if x is None and y is None:
+                    continue
+                # missing values are last (or first) regardless of the order
+                ret = 1 if x is None else -1
+                return -ret if missing == '_first' else ret
+            ret = _compare(x, y)
+            if ret:
+                return ret if order == 'asc' else -ret
+        return 0
+
+    # queries
+
+    def _matches(self, doc, query):
+        if not isinstance(query, dict) or len(query) != 1:
+            raise _EsError(400, 'parsing_exception', 'query must be an object with a single key')
+        query_type, clause = next(iter(query.items()))
+        matcher = getattr(self, '_match_%s' % query_type, None)
+        if matcher is None:
+            raise _EsError(400, 'parsing_exception', 'no [query] registered for [%s]' % query_type)
+        return matcher(doc, clause)
+
+    @staticmethod
+    def _match_match_all(doc, clause):
+        return True
+
+    def _match_bool(self, doc, clause):
+        for q in _as_list(clause.get('must')) + _as_list(clause.get('filter')):
+            if not self._matches(doc, q):
+                return False
+        for q in _as_list(clause.get('must_not')):
+            if self._matches(doc, q):
+                return False
+        should = _as_list(clause.get('should'))
+        if not should:
+            return True
+        minimum = clause.get('minimum_should_match')
+        if minimum is None:
+            minimum = 0 if clause.get('must') or clause.get('filter') else 1
+        return sum(1 for q in should if self._matches(doc, q)) >= int(minimum)
+
+    def _match_term(self, doc, clause):
+        field, value = _single_field(clause, 'term')
+        if isinstance(value, dict):
+            value = value.get('value')
+        return self._has_term(doc, field, value)
+
+    def _match_terms(self, doc, clause):
+        field, values = _single_field(clause, 'terms')
+        return any(self._has_term(doc, field, value) for value in values)
+
+    @staticmethod
+    def _has_term(doc, field, value):
+        if field == '_id':
+            return doc.id == value
+        values = doc.fields.get(field, ())
+        if doc.types.get(field) in TEXT_TYPES:
+            return any(value == token for x in values for token in _tokens(x))
+        return any(_equals(x, value) for x in values)
+
+    @staticmethod
+    def _match_ids(doc, clause):
+        return doc.id in clause.get('values', ())
+
+    @staticmethod
+    def _match_range(doc, clause):
+        field, bounds = _single_field(clause, 'range')
+        checks = {
+            'gt':  lambda c: c > 0,
+            'gte': lambda c: c >= 0,
+            'lt':  lambda c: c < 0,
+            'lte': lambda c: c <= 0,
+        }
+        for value in doc.fields.get(field, ()):
+            if all(check(_compare(value, bounds[op])) for op, check in checks.items() if op in bounds):
+                return True
+        return False
+
+    @staticmethod
+    def _match_match(doc, clause):
+        field, query = _single_field(clause, 'match')
+        operator = 'or'
+        if isinstance(query, dict):
+            operator = query.get('operator', 'or').lower()
+            query = query.get('query')
+        values = doc.fields.get(field, ())
+        if doc.types.get(field, 'text') not in TEXT_TYPES:
+            # keyword, numeric and date fields are not analyzed
+            return any(_equals(x, query) for x in values)
+        query_tokens = set(_tokens(query))
+        if not query_tokens:
+            return False
+        doc_tokens = {token for x in values for token in _tokens(x)}
+        if operator == 'and':
+            return query_tokens <= doc_tokens
+        return bool(query_tokens & doc_tokens)
+
+    @staticmethod
+    def _match_exists(doc, clause):
+        field = clause['field']
+        prefix = field + '.'
+        return any(values and (path == field or path.startswith(prefix)) for path, values in doc.fields.items())
+
+    def _match_nested(self, doc, clause):
+        # nested documents are evaluated as if include_in_root were set
+        return self._matches(doc, clause['query'])
+
+    # aggregations
+
+    def _aggregate(self, docs, aggs):
+        ret = {}
+        for name, agg in aggs.items():
+            agg = dict(agg)
+            sub_aggs = agg.pop('aggs', agg.pop('aggregations', None))
+            if len(agg) != 1:
+                raise _EsError(400, 'parsing_exception', 'aggregation [%s] must have a single type' % name)
+            agg_type, options = next(iter(agg.items()))
+            if agg_type == 'terms':
+                ret[name] = self._terms_aggregation(docs, name, options, sub_aggs)
+            elif agg_type == 'nested':
+                ret[name] = {'doc_count': len(docs)}
+                if sub_aggs:
+                    ret[name].update(self._aggregate(docs, sub_aggs))
+            else:
+                raise _EsError(400, 'parsing_exception', 'aggregation type [%s] is not supported' % agg_type)
+        return ret
+
+    def _terms_aggregation(self, docs, name, options, sub_aggs):
+        if 'field' not in options:
+            raise _EsError(400, 'illegal_argument_exception',
+                           'terms aggregation [%s] needs a field, scripts are not supported' % name)
+        field = options['field']
+        buckets = OrderedDict()
+        for doc in docs:
+            seen = set()
+            for value in doc.fields.get(field, ()):
+                key = json.dumps(value)
+                if key not in seen:
+                    seen.add(key)
+                    buckets.setdefault(key, (value, []))[1].append(doc)
+        ordered = sorted(buckets.values(), key=functools.cmp_to_key(
+            lambda a, b: (len(b[1]) - len(a[1])) or _compare(a[0], b[0])))
+        size = int(options.get('size', 10))
+        result = []
+        for value, bucket_docs in ordered[:size]:
+            bucket = {'key': value, 'doc_count': len(bucket_docs)}
+            if sub_aggs:
+                bucket.update(self._aggregate(bucket_docs, sub_aggs))
+            result.append(bucket)
+        return {
+            'doc_count_error_upper_bound': 0,
+            'sum_other_doc_count': sum(len(x[1]) for x in ordered[size:]),
+            'buckets': result
+        }
+
+
+class FakeElasticsearchServer(WSGIServerThread):
+    """
+    Runs FakeElasticsearch on localhost in a background thread:
+
+        with FakeElasticsearchServer() as server:
+            indexer = ElasticIndexer({'SEARCH_URL': server.url + '/repository'})
+            ...
+    """
+
+    def __init__(self, app=None, host='127.0.0.1', port=0):
+        """
+        :param app:     FakeElasticsearch instance, a new one if None
+        :param port:    port to listen on, 0 picks a free one
+        """
+        super().__init__(app if app is not None else FakeElasticsearch(), host, port, name='fake-elasticsearch')
+
+    @property
+    def url(self):
+        """
+        url of the server, append the name of the index to get SEARCH_URL
+        """
+        return self.address
@@ -0,0 +1,674 @@
+import copy
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from email.utils import formatdate
+from urllib.parse import unquote
+
+import rdflib
+from rdflib import Literal, URIRef
+from rdflib.namespace import XSD
+
+from fedoralink.fedorans import NAMESPACES, FEDORA, LDP, RDF, PREMIS, EBUCORE
+from .server import REASONS, WSGIServerThread
+
+log = logging.getLogger('fedoralink.testing.fedora')
+
+# resources are stored with this url and translated to the url of the request when they are sent out
+INTERNAL_URL = 'http://fedora.invalid'
+
+EMBED_RESOURCES = str(FEDORA.EmbedResources)
+
+# media type -> rdflib format
+RDF_FORMATS = {
+    'application/n-triples': 'nt',
+    'text/turtle':           'turtle',
+    'application/rdf+xml':   'xml',
+}
+
+SERVER_MANAGED_NAMESPACES = (str(FEDORA), str(LDP))
+
+
+class _HttpError(Exception):
+    def __init__(self, status, message=''):
+        super().__init__(message)
+        self.status  = status
+        self.message = message
+
+
+class _Resource:
+    """
+    A container or a binary with its user-managed triples
+    """
+
+    def __init__(self, path, content=None, mimetype=None, filename=None):
+        self.path       = path
+        self.graph      = rdflib.Graph()
+        self.children   = set()
+        self.tombstones = set()          # paths of deleted children
+        self.content    = content        # bytes of a binary, None for a container
+        self.mimetype   = mimetype
+        self.filename   = filename
+        self.created    = time.time()
+        self.versions   = []             # list of (label, graph)
+        self.touch()
+
+    @property
+    def uri(self):
+        return URIRef(INTERNAL_URL + self.path)
+
+    @property
+    def is_binary(self):
+        return self.content is not None
+
+    def touch(self):
+        self.modified = time.time()
+        self.etag     = uuid.uuid4().hex
+
+    def copy(self):
+        ret = copy.copy(self)
+        ret.graph = _copy_graph(self.graph)
+        ret.children = set(self.children)
+        ret.tombstones = set(self.tombstones)
+        ret.versions = list(self.versions)
+        return ret
+
+
+def _copy_graph(graph):
+    ret = rdflib.Graph()
+    for triple in graph:
+        ret.add(triple)
+    return ret
+
+
+def _parent_path(path):
+    return path.rsplit('/', 1)[0]
+
+
+class _Store:
+    """
+    Resources of the repository, path -> _Resource
+    """
+
+    def __init__(self):
+        self.resources = {}
+
+    def get(self, path):
+        return self.resources.get(path)
+
+    def get_for_update(self, path):
+        return self.resources.get(path)
+
+    def put(self, resource):
+        self.resources[resource.path] = resource
+
+    def remove(self, path):
+        self.resources.pop(path, None)
+
+
+class _Transaction(_Store):
+    """
+    Changes made in a transaction on top of the repository, resources are copied when they are first modified
+    """
+
+    def __init__(self, parent):
+        super().__init__()
+        self.parent = parent
+
+    def get(self, path):
+        if path in self.resources:
+            return self.resources[path]
+        return self.parent.get(path)
+
+    def get_for_update(self, path):
+        if path not in self.resources:
+            resource = self.parent.get(path)
+            self.resources[path] = resource.copy() if resource is not None else None
+        return self.resources[path]
+
+    def remove(self, path):
+        self.resources[path] = None
+
+    def commit(self):
+        for path, resource in self.resources.items():
+            if resource is None:
+                self.parent.remove(path)
+            else:
+                self.parent.put(resource)
+
+
+class FakeFedora:
+    """
+    WSGI application imitating the subset of Fedora 4 REST API used by fedoralink: containers and binaries
+    created by POST (with Slug) and PUT, SPARQL updates by PATCH, fcr:metadata in n-triples, turtle and rdf/xml
+    with optional EmbedResources, ETag and Range handling, fcr:versions, fcr:tx transactions and tombstones.
+
+    Metadata and content are kept in memory. Authentication is not checked.
+
+    For load tests, latency and failures can be injected:
+        latency         seconds added to each request or callable(method, path) returning them
+        failure_rate    probability that a request fails with failure_status (default 503) without any effect
+        fail            callable(method, path) returning http status of a failed request or None
+
+    fedoralink writes full IRIs in SPARQL updates. Prefixed names not declared in an update are resolved
+    from the namespace registry as in Fedora, the fake registry contains rdflib's default prefixes,
+    fedorans.NAMESPACES and the namespaces argument.
+
+    Counts of requests by method are in `counts`, the list of (method, path, response status) of all requests
+    in `requests`.
+    Use FakeFedoraServer to run it on localhost.
+    """
+
+    def __init__(self, base_path='/rest', latency=0, failure_rate=0, failure_status=503, fail=None, seed=None,
+                 record_requests=True, namespaces=None):
+        """
+        :param base_path:       path of the REST api
+        :param namespaces:      additional registered namespaces, dictionary prefix -> uri
+        :param seed:            seed of the random generator used for failure_rate
+        :param record_requests: if False, `requests` is not filled, use for long running load tests
+        """
+        self.base_path       = base_path.rstrip('/')
+        self.latency         = latency
+        self.failure_rate    = failure_rate
+        self.failure_status  = failure_status
+        self.fail            = fail
+        self.record_requests = record_requests
+        self.requests        = []
+        self.counts          = Counter()
+        self._random         = random.Random(seed)
+        self._lock           = threading.RLock()
+        self._store          = _Store()
+        self._transactions   = {}
+        self.namespaces      = {prefix: str(uri) for prefix, uri in rdflib.Graph().namespaces()}
+        self.namespaces.update(NAMESPACES)
+        self.namespaces.update(namespaces or {})
+        self._store.put(_Resource(self.base_path))
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = []
+            self.counts   = Counter()
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        path   = environ.get('PATH_INFO', '')
+        with self._lock:
+            self.counts[method] += 1
+
+        delay = self.latency(method, path) if callable(self.latency) else self.latency
+        if delay:
+            time.sleep(delay)
+
+        body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+
+        failure = self._get_injected_failure(method, path)
+        if failure:
+            status, headers, data = failure, [], b'Injected failure'
+        else:
+            try:
+                with self._lock:
+                    status, headers, data = self._dispatch(method, path, environ, body)
+            except _HttpError as e:
+                status, headers, data = e.status, [], e.message.encode('utf-8')
+
+        if self.record_requests:
+            with self._lock:
+                self.requests.append((method, path, status))
+
+        headers = list(headers)
+        if not any(name.lower() == 'content-type' for name, _ in headers):
+            headers.append(('Content-Type', 'text/plain'))
+        headers.append(('Content-Length', str(len(data))))
+        start_response('%s %s' % (status, REASONS.get(status, 'Unknown')), headers)
+        return [data] if method != 'HEAD' else []
+
+    def _get_injected_failure(self, method, path):
+        if self.fail is not None:
+            status = self.fail(method, path)
+            if status:
+                return status
+        if self.failure_rate:
+            with self._lock:
+                if self._random.random() < self.failure_rate:
+                    return self.failure_status
+        return None
+
+    def _dispatch(self, method, path, environ, body):
+        if path != self.base_path and not path.startswith(self.base_path + '/'):
+            raise _HttpError(404, 'Not within the REST api')
+
+        public_url = '%s://%s%s' % (environ.get('wsgi.url_scheme', 'http'), environ.get('HTTP_HOST', ''),
+                                    self.base_path)
+        rest = path[len(self.base_path):]
+        store = self._store
+        urls = [public_url]
+
+        tx_match = re.match(r'^/(tx:[^/]+)', rest)
+        if tx_match:
+            txid = tx_match.group(1)
+            store = self._transactions.get(txid)
+            if store is None:
+                raise _HttpError(410, 'Transaction %s does not exist' % txid)
+            rest = rest[len(txid) + 1:]
+            urls.insert(0, '%s/%s' % (public_url, txid))
+
+        if rest.rstrip('/') == '/fcr:tx' or rest.startswith('/fcr:tx/'):
+            return self._transaction(method, rest, store, public_url)
+
+        request = _Request(method, environ, body, store, urls, self.base_path, self.namespaces)
+
+        suffix = None
+        for candidate in ('/fcr:metadata', '/fcr:versions', '/fcr:tombstone'):
+            if rest.endswith(candidate):
+                rest, suffix = rest[:-len(candidate)], candidate
+                break
+        resource_path = (self.base_path + rest).rstrip('/')
+
+        handler = getattr(self, '_%s' % method.lower(), None)
+        if handler is None:
+            raise _HttpError(405, 'Method not allowed')
+        return handler(request, resource_path, suffix)
+
+    # transactions
+
+    def _transaction(self, method, rest, store, public_url):
+        if method != 'POST':
+            raise _HttpError(405, 'Method not allowed')
+        action = rest.rstrip('/')[len('/fcr:tx'):]
+        if store is self._store:
+            if action:
+                raise _HttpError(400, 'Not in a transaction')
+            txid = 'tx:%s' % uuid.uuid4()
+            self._transactions[txid] = _Transaction(self._store)
+            location = '%s/%s' % (public_url, txid)
+            return 201, [('Location', location)], location.encode('utf-8')
+
+        txid = [k for k, v in self._transactions.items() if v is store][0]
+        if action == '/fcr:commit':
+            del self._transactions[txid]
+            store.commit()
+        elif action == '/fcr:rollback':
+            del self._transactions[txid]
+        elif action:
+            raise _HttpError(404, 'Unknown transaction action %s' % action)
+        return 204, [], b''
+
+    # http methods
+
+    def _head(self, request, path, suffix):
+        return self._get(request, path, suffix)
+
+    def _get(self, request, path, suffix):
+        resource = self._get_existing(request.store, path)
+        if suffix == '/fcr:versions':
+            return self._get_versions(request, resource)
+        if suffix == '/fcr:tombstone':
+            raise _HttpError(405, 'Method not allowed')
+        if resource.is_binary and suffix is None:
+            return self._get_content(request, resource)
+        return self._describe(request, resource)
+
+    def _post(self, request, path, suffix):
+        if suffix == '/fcr:versions':
+            return self._make_version(request, path)
+        if suffix is not None:
+            raise _HttpError(405, 'Method not allowed')
+
+        parent = self._get_existing(request.store, path)
+        if parent.is_binary:
+            raise _HttpError(409, 'Binary can not have children')
+        slug = request.headers.get('SLUG', '').strip('/')
+        child_path = '%s/%s' % (path, slug) if slug else None
+        if child_path is None or request.store.get(child_path) is not None or child_path in parent.tombstones:
+            child_path = '%s/%s' % (path, uuid.uuid4())
+        return self._create(request, child_path)
+
+    def _put(self, request, path, suffix):
+        if suffix not in (None, '/fcr:metadata'):
+            raise _HttpError(405, 'Method not allowed')
+        resource = request.store.get_for_update(path)
+        if resource is None:
+            if suffix is not None:
+                raise _HttpError(404, 'Not found')
+            parent = self._get_existing(request.store, _parent_path(path))
+            if path in parent.tombstones:
+                raise _HttpError(410, 'Resource has been deleted')
+            return self._create(request, path)
+
+        self._check_if_match(request, resource)
+        if resource.is_binary and suffix is None:
+            self._set_content(request, resource)
+        else:
+            resource.graph = request.parse_graph(resource.uri)
+        resource.touch()
+        return 204, self._etag_headers(resource), b''
+
+    def _patch(self, request, path, suffix):
+        if suffix not in (None, '/fcr:metadata'):
+            raise _HttpError(405, 'Method not allowed')
+        self._get_existing(request.store, path)
+        resource = request.store.get_for_update(path)
+        self._check_if_match(request, resource)
+        if not request.content_type.startswith('application/sparql-update'):
+            raise _HttpError(415, 'Expected application/sparql-update')
+        deleted, inserted = request.parse_sparql_update(resource.uri)
+        for triple in deleted:
+            resource.graph.remove(triple)
+        for triple in inserted:
+            resource.graph.add(triple)
+        resource.touch()
+        return 204, self._etag_headers(resource), b''
+
+    def _delete(self, request, path, suffix):
+        store = request.store
+        if path == self.base_path or suffix not in (None, '/fcr:tombstone'):
+            raise _HttpError(405, 'Method not allowed')
+        parent = store.get_for_update(_parent_path(path))
+        if suffix == '/fcr:tombstone':
+            if parent is None or path not in parent.tombstones:
+                raise _HttpError(404, 'No tombstone at %s' % path)
+            parent.tombstones.discard(path)
+            return 204, [], b''
+
+        self._get_existing(store, path)
+        stack = [path]
+        while stack:
+            removed = store.get(stack.pop())
+            stack.extend(removed.children)
+            store.remove(removed.path)
+        parent.children.discard(path)
+        parent.tombstones.add(path)
+        parent.touch()
+        return 204, [], b''
+
+    # helpers
+
+    def _get_existing(self, store, path):
+        resource = store.get(path)
+        if resource is not None:
+            return resource
+        ancestor = path
+        while ancestor != self.base_path and '/' in ancestor:
+            parent = store.get(_parent_path(ancestor))
+            if parent is not None:
+                if ancestor in parent.tombstones:
+                    raise _HttpError(410, 'Resource has been deleted')
+                break
+            ancestor = _parent_path(ancestor)
+        raise _HttpError(404, 'Not found')
+
+    def _create(self, request, path):
+        store  = request.store
+        parent = store.get_for_update(_parent_path(path))
+        if request.content_type.split(';')[0].strip() in RDF_FORMATS:
+            resource = _Resource(path)
+            resource.graph = request.parse_graph(resource.uri)
+        else:
+            resource = _Resource(path, b'')
+            self._set_content(request, resource)
+        store.put(resource)
+        parent.children.add(path)
+        parent.touch()
+        location = request.public_uri(path)
+        return 201, [('Location', location)] + self._etag_headers(resource), location.encode('utf-8')
+
+    @staticmethod
+    def _set_content(request, resource):
+        for digest in filter(None, (x.strip() for x in request.headers.get('DIGEST', '').split(','))):
+            algorithm, _, expected = digest.partition('=')
+            algorithm = algorithm.lower().replace('-', '')
+            if algorithm not in ('sha1', 'sha256', 'md5'):
+                raise _HttpError(409, 'Unsupported digest algorithm %s' % algorithm)
+            if hashlib.new(algorithm, request.body).hexdigest() != expected.lower():
+                raise _HttpError(409, 'Checksum mismatch, computed %s digest does not match %s' %
+                                 (algorithm, expected))
+        resource.content  = request.body
+        resource.mimetype = request.content_type or 'application/octet-stream'
+        filename = re.search(r'filename="([^"]*)"', request.headers.get('CONTENT_DISPOSITION', ''))
+        if filename:
+            resource.filename = unquote(filename.group(1))
+
+    @staticmethod
+    def _check_if_match(request, resource):
+        if_match = request.headers.get('IF_MATCH')
+        if if_match and if_match != '*' and _strip_etag(if_match) != resource.etag:
+            raise _HttpError(412, 'ETag does not match')
+
+    @staticmethod
+    def _etag_headers(resource):
+        return [('ETag', 'W/"%s"' % resource.etag),
+                ('Last-Modified', formatdate(resource.modified, usegmt=True))]
+
+    def _server_managed(self, resource):
+        uri = resource.uri
+        triples = [
+            (uri, RDF.type, FEDORA.Resource),
+            (uri, FEDORA.created, Literal(_iso_date(resource.created), datatype=XSD.dateTime)),
+            (uri, FEDORA.lastModified, Literal(_iso_date(resource.modified), datatype=XSD.dateTime)),
+        ]
+        if resource.path != self.base_path:
+            triples.append((uri, FEDORA.hasParent, URIRef(INTERNAL_URL + _parent_path(resource.path))))
+        if resource.is_binary:
+            triples += [
+                (uri, RDF.type, FEDORA.Binary),
+                (uri, RDF.type, LDP.NonRDFSource),
+                (uri, PREMIS.hasMessageDigest,
+                 URIRef('urn:sha1:' + hashlib.sha1(resource.content).hexdigest())),
+                (uri, PREMIS.hasSize, Literal(len(resource.content), datatype=XSD.long)),
+                (uri, EBUCORE.hasMimeType, Literal(resource.mimetype, datatype=XSD.string)),
+            ]
+            if resource.filename:
+                triples.append((uri, EBUCORE.filename, Literal(resource.filename, datatype=XSD.string)))
+        else:
+            triples += [
+                (uri, RDF.type, FEDORA.Container),
+                (uri, RDF.type, LDP.RDFSource),
+                (uri, RDF.type, LDP.Container),
+            ]
+            triples += [(uri, LDP.contains, URIRef(INTERNAL_URL + child)) for child in sorted(resource.children)]
+        return triples
+
+    def _describe(self, request, resource):
+        headers = self._etag_headers(resource)
+        if_none_match = request.headers.get('IF_NONE_MATCH')
+        if if_none_match and _strip_etag(if_none_match) == resource.etag:
+            return 304, headers, b''
+
+        graph = _copy_graph(resource.graph)
+        for triple in self._server_managed(resource):
+            graph.add(triple)
+        if request.embed_resources:
+            for child_path in resource.children:
+                child = request.store.get(child_path)
+                for triple in child.graph:
+                    graph.add(triple)
+                for triple in self._server_managed(child):
+                    graph.add(triple)
+
+        media_type = request.accepted_rdf_format
+        data = graph.serialize(format=RDF_FORMATS[media_type], encoding='utf-8')
+        return 200, headers + [('Content-Type', media_type)], request.to_public(data)
+
+    @staticmethod
+    def _get_content(request, resource):
+        content = resource.content
+        etag = '"%s"' % hashlib.sha1(content).hexdigest()
+        last_modified = formatdate(resource.modified, usegmt=True)
+        headers = [('ETag', etag), ('Content-Type', resource.mimetype), ('Last-Modified', last_modified),
+                   ('Accept-Ranges', 'bytes')]
+        if resource.filename:
+            headers.append(('Content-Disposition', 'attachment; filename="%s"' % resource.filename))
+
+        range_header = request.headers.get('RANGE')
+        if_range = request.headers.get('IF_RANGE')
+        if not range_header or (if_range and if_range not in (etag, last_modified)):
+            return 200, headers, content
+
+        match = re.match(r'^bytes=(\d*)-(\d*)$', range_header.strip())
+        if not match or match.groups() == ('', ''):
+            # multiple or malformed ranges are ignored
+            return 200, headers, content
+        start, end = match.groups()
+        if start:
+            start = int(start)
+            end = min(int(end), len(content) - 1) if end else len(content) - 1
+        else:
+            start = max(0, len(content) - int(end))
+            end = len(content) - 1
+        if start >= len(content) or start > end:
+            return 416, [('Content-Range', 'bytes */%s' % len(content))], b''
+        headers.append(('Content-Range', 'bytes %s-%s/%s' % (start, end, len(content))))
+        return 206, headers, content[start:end + 1]
+
+    def _make_version(self, request, path):
+        self._get_existing(request.store, path)
+        resource = request.store.get_for_update(path)
+        label = request.headers.get('SLUG') or 'version_%s' % len(resource.versions)
+        if label in [x[0] for x in resource.versions]:
+            raise _HttpError(409, 'Version %s already exists' % label)
+        resource.versions.append((label, _copy_graph(resource.graph)))
+        location = request.public_uri(path) + '/fcr:versions/' + label
+        return 201, [('Location', location)], location.encode('utf-8')
+
+    def _get_versions(self, request, resource):
+        graph = rdflib.Graph()
+        for label, _ in resource.versions:
+            version = URIRef('%s/fcr:versions/%s' % (resource.uri, label))
+            graph.add((resource.uri, FEDORA.hasVersion, version))
+            graph.add((version, FEDORA.hasVersionLabel, Literal(label, datatype=XSD.string)))
+        media_type = request.accepted_rdf_format
+        data = graph.serialize(format=RDF_FORMATS[media_type], encoding='utf-8')
+        return 200, [('Content-Type', media_type)], request.to_public(data)
+
+
+class _Request:
+    """
+    Parsed request together with translation between public urls of the request and internal urls
+    """
+
+    def __init__(self, method, environ, body, store, public_urls, base_path, namespaces):
+        self.method  = method
+        self.body    = body
+        self.store   = store
+        self.headers = {k[5:]: v for k, v in environ.items() if k.startswith('HTTP_')}
+        self.content_type = environ.get('CONTENT_TYPE', '')
+        # the first url is the one the responses use (within a transaction if there is one)
+        self._public_urls  = public_urls
+        self._internal_url = INTERNAL_URL + base_path
+        self._base_path    = base_path
+        self._namespaces   = namespaces
+
+    def public_uri(self, path):
+        return self._public_urls[0] + path[len(self._base_path):]
+
+    def to_public(self, data):
+        return data.decode('utf-8').replace(self._internal_url, self._public_urls[0]).encode('utf-8')
+
+    def _to_internal(self, text):
+        for url in self._public_urls:
+            text = text.replace(url, self._internal_url)
+        return text
+
+    @property
+    def embed_resources(self):
+        prefer = self.headers.get('PREFER', '')
+        include = re.search(r'include="([^"]*)"', prefer)
+        return bool(include) and EMBED_RESOURCES in include.group(1).split()
+
+    @property
+    def accepted_rdf_format(self):
+        for media_type in self.headers.get('ACCEPT', '').split(','):
+            media_type = media_type.split(';')[0].strip()
+            if media_type in RDF_FORMATS:
+                return media_type
+        return 'text/turtle'
+
+    def parse_graph(self, uri):
+        """
+        Parses RDF body of the request, server-managed triples are left out
+        """
+        graph = rdflib.Graph()
+        media_type = self.content_type.split(';')[0].strip()
+        if media_type not in RDF_FORMATS:
+            raise _HttpError(415, 'Unsupported media type %s' % media_type)
+        try:
+            graph.parse(data=self._to_internal(self.body.decode('utf-8')), format=RDF_FORMATS[media_type],
+                        publicID=uri)
+        except Exception as e:
+            raise _HttpError(400, 'Could not parse body: %s' % e)
+        return _user_managed(graph)
+
+    def parse_sparql_update(self, uri):
+        """
+        Parses SPARQL update of the form fedoralink sends: PREFIX ... DELETE { ... } INSERT { ... } WHERE { }
+
+        :return: tuple (deleted graph, inserted graph), server-managed triples are left out of the inserted one
+        """
+        text = self._to_internal(self.body.decode('utf-8'))
+        match = re.match(r'^(?P<prefixes>.*?)DELETE\s*\{(?P<deleted>.*)\}\s*INSERT\s*\{(?P<inserted>.*)\}'
+                         r'\s*WHERE\s*\{\s*\}\s*$', text, re.DOTALL)
+        if not match:
+            raise _HttpError(400, 'Unsupported SPARQL update')
+        namespaces = dict(self._namespaces)
+        namespaces.update(re.findall(r'PREFIX\s+([\w-]*):\s*<([^>]*)>', match.group('prefixes')))
+        prefixes = ''.join('@prefix %s: <%s> .\n' % x for x in namespaces.items())
+        graphs = []
+        for part in ('deleted', 'inserted'):
+            graph = rdflib.Graph()
+            try:
+                graph.parse(data=prefixes + match.group(part), format='turtle', publicID=uri)
+            except Exception as e:
+                raise _HttpError(400, 'Could not parse SPARQL update: %s' % e)
+            graphs.append(graph)
+        return graphs[0], _user_managed(graphs[1])
+
+
+def _user_managed(graph):
+    ret = rdflib.Graph()
+    for s, p, o in graph:
+        if str(p).startswith(SERVER_MANAGED_NAMESPACES):
+            continue
+        if p == RDF.type and str(o).startswith(SERVER_MANAGED_NAMESPACES):
+            continue
+        ret.add((s, p, o))
+    return ret
+
+
+def _strip_etag(etag):
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    return etag.strip('"')
+
+
+def _iso_date(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)) + '.%03dZ' % (timestamp % 1 * 1000)
+
+
+class FakeFedoraServer(WSGIServerThread):
+    """
+    Runs FakeFedora on localhost in a background thread:
+
+        with FakeFedoraServer(FakeFedora(latency=0.01)) as server:
+            connection = FedoraConnection(server.url)
+            ...
+            print(server.app.counts)
+    """
+
+    def __init__(self, app=None, host='127.0.0.1', port=0):
+        """
+        :param app:     FakeFedora instance, a new one if None
+        :param port:    port to listen on, 0 picks a free one
+        """
+        super().__init__(app if app is not None else FakeFedora(), host, port, name='fake-fedora')
+
+    @property
+    def url(self):
+        """
+        url of the REST api, pass it to FedoraConnection
+        """
+        return self.address + self.app.base_path
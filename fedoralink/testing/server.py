@@ -0,0 +1,100 @@
+import io
+import logging
+import threading
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, ServerHandler, make_server
+
+log = logging.getLogger('fedoralink.testing.server')
+
+REASONS = {
+    200: 'OK', 201: 'Created', 204: 'No Content', 206: 'Partial Content', 304: 'Not Modified',
+    400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 410: 'Gone',
+    412: 'Precondition Failed', 415: 'Unsupported Media Type', 416: 'Range Not Satisfiable',
+    500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout',
+}
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _RequestHandler(WSGIRequestHandler):
+    """
+    wsgiref request handler that accepts chunked request bodies (streamed uploads) and logs via logging
+    """
+
+    def handle(self):
+        self.raw_requestline = self.rfile.readline(65537)
+        if len(self.raw_requestline) > 65536:
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+
+        body = self.rfile
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = io.BytesIO(self._read_chunked())
+            del self.headers['Transfer-Encoding']
+            self.headers['Content-Length'] = str(len(body.getvalue()))
+
+        handler = ServerHandler(body, self.wfile, self.get_stderr(), self.get_environ(), multithread=True)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+    def _read_chunked(self):
+        data = io.BytesIO()
+        while True:
+            size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+            if not size:
+                # trailers end with an empty line
+                while self.rfile.readline().strip():
+                    pass
+                return data.getvalue()
+            data.write(self.rfile.read(size))
+            self.rfile.readline()
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class WSGIServerThread:
+    """
+    Serves a WSGI application on localhost from a background thread. Use as a context manager or call
+    start() and stop().
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=0, name='wsgi-server'):
+        """
+        :param app:     the WSGI application
+        :param port:    port to listen on, 0 picks a free one
+        :param name:    name of the serving thread
+        """
+        self.app     = app
+        self.name    = name
+        self._server = make_server(host, port, self.app, server_class=_ThreadingWSGIServer,
+                                   handler_class=_RequestHandler)
+        self._thread = None
+
+    @property
+    def address(self):
+        """
+        http://host:port the server listens on
+        """
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,230 @@
+import asyncio
+from unittest import TestCase, skipIf
+
+from rdflib import Literal, URIRef, XSD
+from rdflib.namespace import DC
+
+from fedoralink.async_connection import AsyncFedoraConnection, AsyncSession, get_async_session, httpx
+from fedoralink.connection import FedoraConnection
+from fedoralink.executor import DependencyFailed, run_async_tasks
+from fedoralink.fedorans import FEDORA, LDP
+from fedoralink.manager import FedoraManager
+from fedoralink.models import FedoraObject
+from fedoralink.rdfmetadata import RDFMetadata
+from fedoralink.testing import FakeFedoraServer
+
+
+def _literal(value):
+    return Literal(value, datatype=XSD.string)
+
+
+class RunAsyncTasksTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_results_in_order(self):
+        async def double(item, _):
+            await asyncio.sleep(0.01 * (3 - item))
+            return item * 2
+
+        results, errors = self.loop.run_until_complete(run_async_tasks(double, [1, 2, 3], 3))
+        self.assertEqual(results, [2, 4, 6])
+        self.assertEqual(errors, {})
+
+    def test_dependency_and_failure(self):
+        started = []
+
+        async def task(item, parent):
+            started.append(item)
+            if item == 'failing':
+                raise ValueError(item)
+            return (parent or '') + item
+
+        items = ['child', 'parent', 'failing', 'orphan']
+        results, errors = self.loop.run_until_complete(run_async_tasks(task, items, 4, [1, None, None, 2]))
+
+        self.assertEqual(results[:2], ['parentchild', 'parent'])
+        self.assertLess(started.index('parent'), started.index('child'))
+        self.assertIsInstance(errors[2], ValueError)
+        self.assertIsInstance(errors[3], DependencyFailed)
+        self.assertNotIn('orphan', started)
+
+
+class _StubClient:
+    """
+    Stands in for httpx.AsyncClient, responses are sent when the release event is set
+    """
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.closed = False
+
+    def build_request(self, method, url, **kwargs):
+        return method, url
+
+    async def send(self, request, stream=False):
+        await self.release.wait()
+        if self.closed:
+            raise RuntimeError('client closed')
+        return request
+
+    async def aclose(self):
+        self.closed = True
+
+
+class AsyncSessionTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_evicted_session_closed_after_requests(self):
+        async def run():
+            session = get_async_session('a', max_sessions=1, client=_StubClient())
+            client = session._client
+            request = asyncio.ensure_future(session.request('GET', 'http://example.com/'))
+            await asyncio.sleep(0)
+
+            self.assertIsNot(get_async_session('b', max_sessions=1, client=_StubClient()), session)
+            await asyncio.sleep(0.01)
+            # the request of the evicted session is still running
+            self.assertFalse(client.closed)
+
+            client.release.set()
+            self.assertEqual(await request, ('GET', 'http://example.com/'))
+            self.assertTrue(client.closed)
+
+        self.loop.run_until_complete(run())
+
+    def test_idle_session_closed(self):
+        client = _StubClient()
+        session = AsyncSession(client=client)
+        self.loop.run_until_complete(session.aclose())
+        self.assertTrue(client.closed)
+
+
+class _Manager(FedoraManager):
+    """
+    Manager with explicit connections instead of those configured in django settings
+    """
+    def __init__(self, connection, async_connection):
+        super().__init__(FedoraObject)
+        self._connection = connection
+        self._async_connection = async_connection
+
+    connection = property(lambda self: self._connection)
+    async_connection = property(lambda self: self._async_connection)
+
+
+@skipIf(httpx is None, 'httpx is not installed')
+class AsyncFedoraConnectionTestCase(TestCase):
+
+    def setUp(self):
+        self.server = FakeFedoraServer().start()
+        self.app = self.server.app
+        self.loop = asyncio.new_event_loop()
+        self.connection = AsyncFedoraConnection(self.server.url)
+        self.sync_connection = FedoraConnection(self.server.url)
+        self.manager = _Manager(self.sync_connection, self.connection)
+
+    def tearDown(self):
+        self.loop.close()
+        self.server.stop()
+
+    def _run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def _create(self, slug, parent=None):
+        metadata = RDFMetadata('')
+        metadata[FEDORA.hasParent] = URIRef(parent or self.server.url)
+        metadata[DC.title] = _literal(slug)
+        return self._run(self.connection.create_objects([{'metadata': metadata, 'bitstream': None,
+                                                          'slug': slug}]))[0]
+
+    def test_create_and_get(self):
+        collection = self._create('collection')
+        child = self._create('child', collection.id)
+
+        fetched = self._run(self.connection.get_object(collection.id))
+        self.assertEqual(fetched[DC.title], [_literal('collection')])
+        self.assertEqual(fetched[LDP.contains], [child.id])
+
+        fetched, missing = self._run(self.connection.get_objects([child.id, self.server.url + '/missing']))
+        self.assertEqual([x.id for x in fetched], [child.id])
+        self.assertEqual(missing, [self.server.url + '/missing'])
+
+    def test_server_managed_fetched_after_write(self):
+        collection = self._run(self.connection.get_object(self._create('collection').id))
+        collection[DC.title] = _literal('changed')
+        self._run(self.connection.update_objects([{'metadata': collection, 'bitstream': None}]))
+
+        # the triples are already there, reading them does not make a blocking request
+        self.app.reset_stats()
+        fresh = next(self.sync_connection.get_object(collection.id))
+        self.assertEqual(collection[FEDORA.lastModified], fresh[FEDORA.lastModified])
+        self.assertEqual(collection.etag, fresh.etag)
+        self.assertEqual(self.app.counts['GET'], 1)
+
+    def test_transaction_sends_single_patch(self):
+        collection = self._run(self.connection.get_object(self._create('collection').id))
+        self.app.reset_stats()
+
+        async def update():
+            await self.connection.begin_transaction()
+            for title in ('first', 'second', 'third'):
+                collection[DC.title] = _literal(title)
+                await self.connection.update_objects([{'metadata': collection, 'bitstream': None}])
+            self.assertEqual(self.app.counts['PATCH'], 0)
+            await self.connection.commit()
+
+        self._run(update())
+
+        self.assertEqual(self.app.counts['PATCH'], 1)
+        self.assertEqual(self._run(self.connection.get_object(collection.id))[DC.title], [_literal('third')])
+
+    def test_delete_drops_buffered_updates(self):
+        collection = self._run(self.connection.get_object(self._create('collection').id))
+        child = self._run(self.connection.get_object(self._create('child', collection.id).id))
+        self.app.reset_stats()
+
+        async def update():
+            await self.connection.begin_transaction()
+            child[DC.title] = _literal('changed')
+            await self.connection.update_objects([{'metadata': child, 'bitstream': None}])
+            await self.connection.delete(collection.id)
+            await self.connection.commit()
+
+        self._run(update())
+
+        self.assertEqual(self.app.counts['PATCH'], 0)
+        self.assertEqual(self.app.counts['DELETE'], 1)
+
+    def test_manager(self):
+        collection = self._create('collection')
+
+        query = self.manager.filter(pk=collection.id)
+        obj = self._run(self.manager.aget(pk=collection.id))
+        self.assertIs(obj.objects_fedora_connection, self.connection)
+        self.assertEqual(obj[DC.title], [_literal('collection')])
+
+        # the query keeps using the synchronous connection
+        self.assertIs(self._run(query.aexecute()).connection, self.connection)
+        self.assertIsNone(query.current_connection)
+        self.assertEqual([x.objects_fedora_connection for x in query], [self.sync_connection])
+
+        obj[DC.title] = _literal('changed')
+        created = FedoraObject(__connection=self.connection)
+        created[FEDORA.hasParent] = URIRef(collection.id)
+        created[DC.title] = _literal('created')
+        self._run(self.manager.asave([obj, created], self.connection))
+
+        fetched = next(self.sync_connection.get_object(collection.id))
+        self.assertEqual(fetched[DC.title], [_literal('changed')])
+        self.assertEqual(fetched[LDP.contains], [URIRef(created.id)])
@@ -0,0 +1,434 @@
+import hashlib
+import io
+import logging
+from unittest import TestCase
+from unittest.mock import patch
+
+from django.db.models.signals import post_save, pre_save
+from rdflib import Literal, URIRef, XSD
+from rdflib.namespace import DC
+
+from fedoralink.authentication.Credentials import Credentials
+from fedoralink.authentication.as_user import as_user
+from fedoralink.connection import BatchWriteException, FedoraConnection, UPLOAD_CHUNK_SIZE, _PendingUpdate, \
+    _UploadStream
+from fedoralink.engine import delegated_requests
+from fedoralink.fedorans import FEDORA, LDP
+from fedoralink.manager import FedoraManager
+from fedoralink.models import FedoraObject
+from fedoralink.query import DoesNotExist
+from fedoralink.rdfmetadata import RDFMetadata
+from fedoralink.testing import FakeFedoraServer
+from fedoralink.utils import TypedStream
+
+
+def _literal(value):
+    return Literal(value, datatype=XSD.string)
+
+
+class PendingUpdateTestCase(TestCase):
+
+    def test_merge_has_effect_of_sequential_updates(self):
+        update = _PendingUpdate('http://r/a', None)
+        update.merge({DC.title: [_literal('old')]}, {DC.title: [_literal('t1')], DC.subject: [_literal('s1')]})
+        update.merge({DC.title: [_literal('t1')]}, {DC.title: [_literal('t2')]})
+        update.merge({DC.subject: [_literal('s1')]}, {})
+
+        self.assertEqual(update.removed, {DC.title: [_literal('old'), _literal('t1')],
+                                          DC.subject: [_literal('s1')]})
+        self.assertEqual(update.added, {DC.title: [_literal('t2')]})
+
+    def test_value_added_back_is_not_removed(self):
+        update = _PendingUpdate('http://r/a', None)
+        update.merge({DC.title: [_literal('old')]}, {DC.title: [_literal('new')]})
+        update.merge({DC.title: [_literal('new')]}, {DC.title: [_literal('old')]})
+
+        self.assertEqual(update.removed, {DC.title: [_literal('new')]})
+        self.assertEqual(update.added, {DC.title: [_literal('old')]})
+        self.assertFalse(update.is_empty())
+        self.assertTrue(_PendingUpdate('http://r/b', None).is_empty())
+
+
+class _Pipe:
+    """
+    Stream that can not be seeked
+    """
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._data.read(size)
+
+
+class UploadTestCase(TestCase):
+
+    def test_upload_stream(self):
+        data = bytes(range(256)) * (UPLOAD_CHUNK_SIZE // 100)
+        upload = _UploadStream(_Pipe(data), len(data), 'sha1')
+        self.assertEqual(len(upload), len(data))
+        chunks = list(upload.chunks())
+        self.assertEqual([len(x) for x in chunks], [UPLOAD_CHUNK_SIZE] * 2 + [len(data) - 2 * UPLOAD_CHUNK_SIZE])
+        self.assertEqual(b''.join(chunks), data)
+        self.assertEqual(upload.hexdigest(), hashlib.sha1(data).hexdigest())
+
+    def test_upload_body(self):
+        connection = FedoraConnection('http://test-upload/rest', options={'UPLOAD_DIGEST': 'sha1'})
+        sent = []
+
+        def send(url, body, headers, timeout):
+            sent.append((body, headers))
+            # reading the body as requests would do
+            if isinstance(body, _UploadStream):
+                body.read()
+            elif not isinstance(body, bytes):
+                list(body)
+            return 'response'
+
+        def upload(stream, size):
+            return connection._upload_bitstream(send, 'http://test-upload/rest/a',
+                                                TypedStream(stream, 'text/plain', 'a.txt', size=size), {})
+
+        # seekable stream, the digest is sent with the bitstream
+        self.assertEqual(upload(io.BytesIO(b'data'), 4), ('response', None))
+        body, headers = sent[-1]
+        self.assertEqual(len(body), 4)
+        self.assertEqual(headers['Digest'], 'sha1=' + hashlib.sha1(b'data').hexdigest())
+        self.assertEqual(headers['Content-Disposition'], 'attachment; filename="a.txt"')
+
+        # the digest of a stream that can not be read twice is computed during the upload
+        digest = ('sha1', hashlib.sha1(b'data').hexdigest())
+        self.assertEqual(upload(_Pipe(b'data'), 4), ('response', digest))
+        self.assertIsInstance(sent[-1][0], _UploadStream)
+        self.assertNotIn('Digest', sent[-1][1])
+
+        # unknown size, sent in chunks
+        self.assertEqual(upload(_Pipe(b'data'), None), ('response', digest))
+        self.assertNotIsInstance(sent[-1][0], (bytes, _UploadStream))
+
+        upload(_Pipe(b''), 0)
+        self.assertEqual(sent[-1][0], b'')
+
+
+class SessionTestCase(TestCase):
+
+    def test_lru_eviction(self):
+        first = delegated_requests.get_session('test-lru-1', max_sessions=2)
+        second = delegated_requests.get_session('test-lru-2', max_sessions=2)
+        self.assertIs(delegated_requests.get_session('test-lru-1', max_sessions=2), first)
+
+        delegated_requests.get_session('test-lru-3', max_sessions=2)
+
+        self.assertIn('test-lru-1', delegated_requests._sessions)
+        self.assertNotIn('test-lru-2', delegated_requests._sessions)
+        self.assertIsNot(delegated_requests.get_session('test-lru-2', max_sessions=2), second)
+
+    def test_session_per_credentials(self):
+        connection = FedoraConnection('http://test-sessions/rest', 'admin', 'secret')
+        admin = connection._session
+        with as_user(Credentials('alice', 'secret')):
+            alice = connection._session
+            self.assertIs(connection._session, alice)
+        with as_user(Credentials('alice', 'changed')):
+            self.assertIsNot(connection._session, alice)
+
+        self.assertIsNot(admin, alice)
+        self.assertIs(connection._session, admin)
+        self.assertEqual(alice._session.auth.username, 'alice')
+
+
+class TimeoutsTestCase(TestCase):
+
+    def test_timeouts(self):
+        connection = FedoraConnection('http://test-timeouts/rest', options={'TIMEOUTS': {'read': [5, 30],
+                                                                                         'write': 20}})
+        self.assertEqual(connection._get_timeout('read'), (5, 30))
+        self.assertEqual(connection._get_timeout('write'), 20)
+        # no operation waits for the server forever by default
+        for operation in ('download', 'upload'):
+            self.assertNotIn(None, connection._get_timeout(operation))
+
+
+class FakeFedoraConnectionTestCase(TestCase):
+
+    def setUp(self):
+        self.server = FakeFedoraServer().start()
+        self.app = self.server.app
+        self.connection = FedoraConnection(self.server.url, options={'UPLOAD_DIGEST': 'sha1',
+                                                                     'METADATA_CACHE_SIZE': 100})
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _create(self, slug, parent=None, bitstream=None):
+        metadata = RDFMetadata('')
+        metadata[FEDORA.hasParent] = URIRef(parent or self.server.url)
+        metadata[DC.title] = _literal(slug)
+        return self.connection.create_objects([{'metadata': metadata, 'bitstream': bitstream, 'slug': slug}])[0]
+
+    def _item(self, slug, parent):
+        metadata = RDFMetadata('')
+        metadata[FEDORA.hasParent] = URIRef(parent)
+        metadata[DC.title] = _literal(slug)
+        return {'metadata': metadata, 'bitstream': None, 'slug': slug}
+
+    def _get(self, object_id):
+        return next(self.connection.get_object(object_id))
+
+    def test_create_and_get(self):
+        collection = self._create('collection')
+        child = self._create('child', collection.id)
+
+        fetched = self._get(collection.id)
+        self.assertEqual(fetched[DC.title], [_literal('collection')])
+        self.assertEqual(fetched[LDP.contains], [child.id])
+
+        for status in (200, 304):
+            fetched = next(self.connection.get_object(collection.id, fetch_child_metadata=False))
+            self.assertEqual(self.app.requests[-1][2], status)
+            self.assertEqual(fetched[DC.title], [_literal('collection')])
+
+    def test_embedded_children_not_cached(self):
+        collection = self._create('collection')
+        child = self._create('child', collection.id)
+        self.assertEqual(self._get(collection.id).clone_for(child.id)[DC.title], [_literal('child')])
+
+        other_writer = FedoraConnection(self.server.url)
+        changed = next(other_writer.get_object(child.id))
+        changed[DC.title] = _literal('changed')
+        other_writer.update_objects([{'metadata': changed, 'bitstream': None}])
+
+        self.assertEqual(self._get(collection.id).clone_for(child.id)[DC.title], [_literal('changed')])
+        self.assertEqual(self.app.requests[-1][2], 200)
+
+    def test_empty_batches(self):
+        self.assertEqual(self.connection.create_objects([]), [])
+        self.assertEqual(self.connection.update_objects([]), [])
+        self.assertEqual(self.connection.get_objects([]), ([], []))
+
+    def test_concurrent_batch(self):
+        root = self.server.url
+        # the child is listed before its parent, it must be created after it
+        created = self.connection.create_objects([self._item('child', root + '/parent'), self._item('a', root),
+                                                  self._item('parent', root), self._item('b', root)])
+
+        self.assertEqual([x[DC.title] for x in created],
+                         [[_literal(slug)] for slug in ('child', 'a', 'parent', 'b')])
+        self.assertEqual(created[0][FEDORA.hasParent], [created[2].id])
+        self.assertEqual(self._get(created[2].id)[LDP.contains], [created[0].id])
+
+        fetched, missing = self.connection.get_objects([created[3].id, root + '/missing', created[1].id])
+        self.assertEqual([x.id for x in fetched], [created[3].id, created[1].id])
+        self.assertEqual(missing, [root + '/missing'])
+
+    def test_batch_partial_failure(self):
+        failing = self._create('failing')
+        self.app.fail = lambda method, path: 500 if method == 'POST' and path.endswith('/failing') else None
+
+        with self.assertRaises(BatchWriteException) as e:
+            self.connection.create_objects([self._item('a', self.server.url), self._item('b', failing.id),
+                                            self._item('c', self.server.url)])
+
+        results, errors = e.exception.results, e.exception.errors
+        self.assertEqual(sorted(errors), [1])
+        self.assertIsNone(results[1])
+        self.assertEqual([results[0][DC.title], results[2][DC.title]], [[_literal('a')], [_literal('c')]])
+
+    def test_bitstream_range(self):
+        collection = self._create('collection')
+        binary = self._create('binary', collection.id,
+                              TypedStream(io.BytesIO(b'0123456789'), 'text/plain', 'digits.txt'))
+
+        response = self.connection.get_bitstream(binary.id, range='bytes=2-4')
+        self.assertEqual(response.status, 206)
+        self.assertEqual(response.headers['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(response.read(), b'234')
+        self.assertEqual(self._get(binary.id)[DC.title], [_literal('binary')])
+
+        response = self.connection.get_bitstream(binary.id, range='bytes=-3')
+        self.assertEqual((response.status, response.read()), (206, b'789'))
+
+        # If-Range with the current ETag gets the range, the whole bitstream if it has changed
+        etag = self.connection.get_bitstream(binary.id).headers['ETag']
+        response = self.connection.get_bitstream(binary.id, range='bytes=2-4', if_range=etag)
+        self.assertEqual((response.status, response.read()), (206, b'234'))
+        response = self.connection.get_bitstream(binary.id, range='bytes=2-4', if_range='"changed"')
+        self.assertEqual((response.status, response.read()), (200, b'0123456789'))
+
+        # If-Range alone has no effect
+        response = self.connection.get_bitstream(binary.id, if_range='"changed"')
+        self.assertEqual((response.status, response.read()), (200, b'0123456789'))
+
+    def test_list_children(self):
+        collection = self._create('collection')
+        a = self._create('a', collection.id)
+        grandchild = self._create('grandchild', a.id)
+        b = self._create('b', collection.id)
+
+        # objects constructed by the managers use the test connection
+        with patch.object(FedoraManager, 'connection', property(lambda manager: self.connection)):
+            obj = FedoraManager(FedoraObject).get(pk=collection.id)
+            self.assertEqual(sorted(x.id for x in obj.children), [a.id, b.id])
+
+            self.app.reset_stats()
+            lazy = obj.list_children(lazy=True)
+            self.assertEqual(self.app.counts['GET'], 0)
+            self.assertEqual(sorted(x.id for x in lazy), [a.id, b.id])
+            # the container without its children, then each child
+            self.assertEqual(self.app.counts['GET'], 3)
+
+            children = FedoraManager(FedoraObject).iter_children(obj, page_size=1, concurrency=1)
+            self.assertIn(next(children).id, [a.id, b.id])
+            children.close()
+
+            # depth first, parents before their children
+            descendants = [x.id for x in obj.list_self_and_descendants()]
+            self.assertIn(descendants, ([collection.id, a.id, grandchild.id, b.id],
+                                        [collection.id, b.id, a.id, grandchild.id]))
+            self.assertEqual(sorted(x.id for x in obj.list_self_and_descendants(lazy=True)),
+                             sorted([collection.id, a.id, grandchild.id, b.id]))
+
+    def test_upload_verified(self):
+        collection = self._create('collection')
+        binary = self._create('binary', collection.id, TypedStream(_Pipe(b'0123456789'), 'text/plain', size=10))
+        self.assertEqual(self.connection.get_bitstream(binary.id).read(), b'0123456789')
+
+        self.assertRaises(Exception, self.connection._check_upload_digest, binary.id,
+                          hashlib.sha1(b'other').hexdigest(), self._get(binary.id))
+
+    def test_pk_in_via_repository(self):
+        ids = [self._create(slug).id for slug in ('a', 'b', 'c')]
+        missing = self.server.url + '/missing'
+
+        with patch.object(FedoraManager, 'connection', property(lambda manager: self.connection)):
+            manager = FedoraManager(FedoraObject)
+            self.app.reset_stats()
+            found = manager.filter(pk__in=[ids[2], missing, ids[0]]).via_repository()
+            self.assertEqual([x.id for x in found], [ids[2], ids[0]])
+            self.assertEqual(found.count(), 2)
+            self.assertEqual(self.app.counts['GET'], 3)
+
+            self.assertEqual([x.id for x in manager.filter(pk__in=ids).via_repository()[1:]], ids[1:])
+
+            self.app.reset_stats()
+            self.assertEqual(list(manager.filter(pk__in=[]).via_repository()), [])
+            self.assertEqual(self.app.counts['GET'], 0)
+
+    def test_transaction_sends_single_patch(self):
+        collection = self._get(self._create('collection').id)
+        self.app.reset_stats()
+
+        self.connection.begin_transaction()
+        for title in ('first', 'second', 'third'):
+            collection[DC.title] = _literal(title)
+            self.connection.update_objects([{'metadata': collection, 'bitstream': None}])
+        self.assertEqual(self.app.counts['PATCH'], 0)
+        self.connection.commit()
+
+        self.assertEqual(self.app.counts['PATCH'], 1)
+        self.assertEqual(self._get(collection.id)[DC.title], [_literal('third')])
+
+    def test_server_managed_read_after_commit(self):
+        collection = self._create('collection')
+
+        self.connection.begin_transaction()
+        created = self.connection.create_objects([self._item('a', collection.id)])[0]
+        binary = self._create('binary', collection.id, TypedStream(io.BytesIO(b'data'), 'text/plain'))
+        self.assertIn('tx:', str(created.id))
+        self.connection.commit()
+
+        # the transaction does not exist any more, the values are fetched from outside of it
+        self.assertEqual(created.id, URIRef(collection.id + '/a'))
+        self.assertEqual(len(created[FEDORA.created]), 1)
+        self.assertTrue(binary.has_type(FEDORA.Binary))
+        self.assertEqual(binary[FEDORA.hasParent], [URIRef(collection.id)])
+
+    def test_buffered_update_without_fedora_triples(self):
+        collection = self._create('collection')
+
+        self.connection.begin_transaction()
+        binary = self._create('binary', collection.id, TypedStream(io.BytesIO(b'data'), 'text/plain'))
+        update, = self.connection._pending_updates.values()
+        for predicate in list(update.removed) + list(update.added):
+            self.assertFalse(str(predicate).startswith(str(FEDORA)), predicate)
+        with self.assertLogs('fedoralink.sparql', 'WARNING') as logs:
+            self.assertNotIn(str(FEDORA).encode('utf-8'),
+                             binary.serialize_sparql((update.removed, update.added)))
+            logging.getLogger('fedoralink.sparql').warning('nothing else logged')
+        self.assertEqual(len(logs.output), 1)
+        self.connection.commit()
+
+        self.assertEqual(self._get(binary.id)[DC.title], [_literal('binary')])
+
+    def test_rollback_discards_changes(self):
+        collection = self._get(self._create('collection').id)
+
+        self.connection.begin_transaction()
+        collection[DC.title] = _literal('changed')
+        self.connection.update_objects([{'metadata': collection, 'bitstream': None}])
+        self.connection.rollback()
+
+        self.assertEqual(self._get(collection.id)[DC.title], [_literal('collection')])
+
+    def test_delete_tree(self):
+        collection = self._create('collection')
+        for slug in ('a', 'b'):
+            self._create('child', self._create(slug, collection.id).id)
+
+        deleted = self.connection.delete_tree(collection.id)
+
+        self.assertEqual(len(deleted), 5)
+        self.assertEqual(str(deleted[-1]), str(collection.id))
+        self.assertRaises(DoesNotExist, self._get, collection.id)
+        # each resource and its tombstone
+        self.assertEqual(self.app.counts['DELETE'], 10)
+
+    def test_unchanged_object_not_saved(self):
+        collection = self._get(self._create('collection').id)
+        self.app.reset_stats()
+
+        collection[DC.title] = _literal('changed')
+        collection[DC.title] = _literal('collection')
+        obj = FedoraObject(__metadata=collection, __connection=self.connection)
+        FedoraManager(FedoraObject).save([obj], self.connection)
+        self.assertEqual(self.app.counts['PATCH'], 0)
+
+        obj[DC.title] = _literal('changed')
+        FedoraManager(FedoraObject).save([obj], self.connection)
+        self.assertEqual(self.app.counts['PATCH'], 1)
+        self.assertEqual(self._get(collection.id)[DC.title], [_literal('changed')])
+
+    def test_pre_save_receiver_changes_object(self):
+        collection = self._get(self._create('collection').id)
+        obj = FedoraObject(__metadata=collection, __connection=self.connection)
+        saved = []
+
+        def touch(sender, instance, **kwargs):
+            instance[DC.subject] = _literal('touched')
+
+        def record(sender, instance, **kwargs):
+            saved.append(instance)
+
+        pre_save.connect(touch, dispatch_uid='test-touch')
+        post_save.connect(record, dispatch_uid='test-record')
+        try:
+            self.app.reset_stats()
+            FedoraManager(FedoraObject).save([obj], self.connection)
+            self.assertEqual(self.app.counts['PATCH'], 1)
+            self.assertEqual(saved, [obj])
+
+            # the receiver sets the same value again, nothing to save
+            FedoraManager(FedoraObject).save([obj], self.connection)
+            self.assertEqual(self.app.counts['PATCH'], 1)
+            self.assertEqual(saved, [obj])
+        finally:
+            pre_save.disconnect(dispatch_uid='test-touch')
+            post_save.disconnect(dispatch_uid='test-record')
+
+        self.assertEqual(self._get(collection.id)[DC.subject], [_literal('touched')])
+
+    def test_injected_failure(self):
+        collection = self._get(self._create('collection').id)
+        self.app.fail = lambda method, path: 503 if method == 'PATCH' else None
+
+        collection[DC.title] = _literal('changed')
+        self.assertRaises(Exception, self.connection.update_objects, [{'metadata': collection, 'bitstream': None}])
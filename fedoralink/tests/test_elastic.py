@@ -0,0 +1,83 @@
+import base64
+from unittest import TestCase
+
+from django.conf import settings
+
+if not settings.configured:
+    # DCObject and the indexer read django settings (LANGUAGES), the defaults are sufficient
+    settings.configure()
+
+from django.db.models import Q                          # noqa: E402
+from rdflib.namespace import DC                         # noqa: E402
+
+from fedoralink.common_namespaces.dc import DCObject    # noqa: E402
+from fedoralink.fedorans import RDF                     # noqa: E402
+from fedoralink.indexer.elastic import ElasticIndexer   # noqa: E402
+from fedoralink.term_pool import get_term_pool          # noqa: E402
+from fedoralink.testing import FakeElasticsearchServer  # noqa: E402
+from fedoralink.utils import url2id                     # noqa: E402
+
+CREATOR = url2id(DC.creator)
+
+
+class ElasticIndexerTestCase(TestCase):
+
+    def setUp(self):
+        self.server = FakeElasticsearchServer().start()
+        self.indexer = ElasticIndexer({'SEARCH_URL': self.server.url + '/repository'})
+        self.doc_type = ElasticIndexer._get_elastic_class(DCObject)
+        self.indexer.save_mapping(self.doc_type, {
+            'properties': {
+                CREATOR: {'type': 'keyword', 'copy_to': CREATOR + '__fulltext'},
+                CREATOR + '__fulltext': {'type': 'text'},
+            }
+        })
+        for i, creator in enumerate(('John Smith', 'Jane Smith', 'John Doe', 'Anna Smith')):
+            self._index('http://repo/%d' % i, creator)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _index(self, pk, creator):
+        self.indexer.es.index(index=self.indexer.index_name, doc_type=self.doc_type,
+                              id=base64.b64encode(pk.encode('utf-8')).decode('utf-8'), body={
+                                  '_fedora_id': pk,
+                                  '_fedora_parent': 'http://repo',
+                                  '_fedora_type': [],
+                                  '_fedoralink_model': [self.doc_type],
+                                  CREATOR: [creator],
+                              })
+
+    def _search(self, query, start=None, end=None, facets=None, ordering=None):
+        result = self.indexer.search(query, DCObject, start, end, facets, ordering, None)
+        result['ids'] = [str(metadata.id) for metadata, _ in result['data']]
+        return result
+
+    def test_query_and_facets(self):
+        result = self._search(Q(creator__fulltext='smith') & ~Q(creator='Jane Smith'), facets=['creator'],
+                              ordering=['creator'])
+
+        self.assertEqual(result['count'], 2)
+        self.assertEqual(result['ids'], ['http://repo/3', 'http://repo/0'])
+        self.assertEqual(dict(result['facets'])['creator'], [('Anna Smith', 1), ('John Smith', 1)])
+
+    def test_ordering_and_slicing(self):
+        result = self._search(None, start=1, end=3, ordering=['-creator'])
+
+        self.assertEqual(result['count'], 4)
+        self.assertEqual(result['ids'], ['http://repo/2', 'http://repo/1'])
+        self.assertEqual(self.server.app.counts['search'], 1)
+
+    def test_instance_terms_pooled(self):
+        metadata, _ = ElasticIndexer.build_instance({'_source': {
+            '_fedora_id': 'http://repo/0',
+            '_fedora_parent': 'http://repo',
+            '_fedora_type': [str(DC.Agent)],
+            CREATOR: ['John Smith'],
+        }}, {})
+
+        self.assertEqual(metadata[RDF.type], [DC.Agent])
+        term = get_term_pool().term
+        for triple in metadata.rdf_metadata:
+            for node in triple:
+                self.assertIs(term(node), node)
@@ -0,0 +1,142 @@
+import asyncio
+import itertools
+import threading
+import time
+from unittest import TestCase
+
+from fedoralink.engine.hedging import Hedger, LatencyTracker
+
+
+def _calls(*delays, failing=()):
+    """
+    Returns a function that sleeps for the next of the delays and returns the index of the call. Calls
+    with index in failing raise ValueError after the delay.
+    """
+    counter = itertools.count()
+
+    def call():
+        index = next(counter)
+        time.sleep(delays[index])
+        if index in failing:
+            raise ValueError(index)
+        return index
+
+    return call
+
+
+class HedgerTestCase(TestCase):
+
+    def setUp(self):
+        self.hedger = Hedger(min_delay=0.05, max_delay=0.05, max_workers=4)
+
+    def test_fast_request_not_hedged(self):
+        self.assertEqual(self.hedger.run(_calls(0)), 0)
+        self.assertEqual(self.hedger.stats, {'requests': 1, 'hedged': 0, 'hedge_wins': 0, 'hedges_skipped': 0})
+
+    def test_hedge_wins(self):
+        discarded = threading.Event()
+        losers = []
+
+        def discard(result):
+            losers.append(result)
+            discarded.set()
+
+        self.assertEqual(self.hedger.run(_calls(0.5, 0), discard), 1)
+        self.assertEqual(self.hedger.stats, {'requests': 1, 'hedged': 1, 'hedge_wins': 1, 'hedges_skipped': 0})
+        # the late response of the primary request is discarded
+        self.assertTrue(discarded.wait(2))
+        self.assertEqual(losers, [0])
+
+    def test_first_response_wins(self):
+        start = time.time()
+        self.assertEqual(self.hedger.run(_calls(0.1, 0.5)), 0)
+        self.assertLess(time.time() - start, 0.4)
+        self.assertEqual(self.hedger.stats, {'requests': 1, 'hedged': 1, 'hedge_wins': 0, 'hedges_skipped': 0})
+
+    def test_errors(self):
+        # the failed primary request does not hide the response of the hedge
+        self.assertEqual(self.hedger.run(_calls(0.1, 0.2, failing=(0,))), 1)
+        with self.assertRaises(ValueError) as e:
+            self.hedger.run(_calls(0.1, 0.2, failing=(0, 1)))
+        self.assertEqual(e.exception.args, (0,))
+
+    def test_delay_starts_with_request(self):
+        hedger = Hedger(min_delay=0.1, max_delay=0.1, max_workers=1)
+        blocker = threading.Thread(target=hedger.run, args=(_calls(0.3, 0.3),))
+        blocker.start()
+        time.sleep(0.05)
+        # the request waits for the busy worker longer than the delay, but it is fast once sent
+        self.assertEqual(hedger.run(_calls(0.05)), 0)
+        blocker.join()
+        self.assertEqual(hedger.stats['hedged'], 1)
+
+    def test_max_hedges(self):
+        hedger = Hedger(min_delay=0.05, max_delay=0.05, max_hedges=1)
+        slow = threading.Thread(target=hedger.run, args=(_calls(0.5, 0.2),))
+        slow.start()
+        time.sleep(0.1)
+        # the only hedge slot is taken by the hedge of the slow call
+        self.assertEqual(hedger.run(_calls(0.1, 0)), 0)
+        slow.join()
+        self.assertEqual(hedger.stats, {'requests': 2, 'hedged': 1, 'hedge_wins': 1, 'hedges_skipped': 1})
+
+        # the slot is free again
+        self.assertEqual(hedger.run(_calls(0.3, 0)), 1)
+        self.assertEqual(hedger.stats['hedge_wins'], 2)
+
+    def test_delay(self):
+        hedger = Hedger(percentile=50, min_delay=0.1, max_delay=1)
+        self.assertEqual(hedger.get_delay(), 1)
+        for latency in range(Hedger.MIN_SAMPLES):
+            hedger.latencies.record(latency / 100)
+        self.assertEqual(hedger.get_delay(), 0.1)
+        for _ in range(Hedger.MIN_SAMPLES * 2):
+            hedger.latencies.record(0.5)
+        self.assertEqual(hedger.get_delay(), 0.5)
+
+        tracker = LatencyTracker(window=2)
+        self.assertIsNone(tracker.percentile(50))
+        for latency in (3, 1, 2):
+            tracker.record(latency)
+        self.assertEqual((len(tracker), tracker.percentile(0), tracker.percentile(100)), (2, 1, 2))
+
+
+class AsyncHedgerTestCase(TestCase):
+
+    def setUp(self):
+        self.hedger = Hedger(min_delay=0.05, max_delay=0.05)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_hedge_wins_and_primary_cancelled(self):
+        delays = iter([1, 0])
+        cancelled = []
+
+        async def call():
+            delay = next(delays)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(delay)
+                raise
+            return delay
+
+        self.assertEqual(self.loop.run_until_complete(self.hedger.arun(call)), 0)
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(cancelled, [1])
+        self.assertEqual(self.hedger.stats, {'requests': 1, 'hedged': 1, 'hedge_wins': 1, 'hedges_skipped': 0})
+
+    def test_first_response_wins(self):
+        delays = iter([0.1, 1])
+
+        async def call():
+            delay = next(delays)
+            await asyncio.sleep(delay)
+            return delay
+
+        start = time.time()
+        self.assertEqual(self.loop.run_until_complete(self.hedger.arun(call)), 0.1)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(self.hedger.stats, {'requests': 1, 'hedged': 1, 'hedge_wins': 0, 'hedges_skipped': 0})
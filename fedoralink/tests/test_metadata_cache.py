@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+from fedoralink.metadata_cache import MetadataCache, CachedMetadata
+
+
+class DictCache:
+    """
+    Minimal stand-in for django cache API used by MetadataCache
+    """
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        if key not in self.data:
+            raise ValueError(key)
+        self.data[key] += 1
+
+
+def _entry(etag, data=b''):
+    return CachedMetadata(etag, None, data)
+
+
+class MetadataCacheTestCase(TestCase):
+
+    def test_lru_eviction(self):
+        cache = MetadataCache(max_entries=2)
+        cache.put('http://r/a', (), _entry('a'))
+        cache.put('http://r/b', (), _entry('b'))
+        cache.get('http://r/a', ())
+        cache.put('http://r/c', (), _entry('c'))
+
+        self.assertEqual(cache.get('http://r/a', ()).etag, 'a')
+        self.assertIsNone(cache.get('http://r/b', ()))
+        self.assertEqual(len(cache), 2)
+
+    def test_bounded_by_size(self):
+        cache = MetadataCache(max_bytes=10)
+        cache.put('http://r/a', (), _entry('a', b'12345'))
+        cache.put('http://r/b', (), _entry('b', b'12345'))
+        cache.put('http://r/c', (), _entry('c', b'1'))
+        cache.put('http://r/d', (), _entry('d', b'12345678901'))
+
+        self.assertIsNone(cache.get('http://r/a', ()))
+        self.assertEqual(cache.get('http://r/b', ()).etag, 'b')
+        self.assertEqual(cache.get('http://r/c', ()).etag, 'c')
+        self.assertIsNone(cache.get('http://r/d', ()))
+
+        cache.invalidate(['http://r/b'])
+        cache.put('http://r/a', (), _entry('a', b'12345'))
+        self.assertEqual(len(cache), 2)
+
+    def test_invalidate_all_variants_and_descendants(self):
+        cache = MetadataCache()
+        cache.put('http://r/a', ('embed',), _entry('a1'))
+        cache.put('http://r/a', (None,), _entry('a2'))
+        cache.put('http://r/a/b', (None,), _entry('b'))
+        cache.put('http://r/ab', (None,), _entry('ab'))
+
+        cache.invalidate(['http://r/a'])
+        self.assertIsNone(cache.get('http://r/a', ('embed',)))
+        self.assertIsNone(cache.get('http://r/a', (None,)))
+        self.assertIsNotNone(cache.get('http://r/a/b', (None,)))
+
+        cache.invalidate(['http://r/a'], descendants=True)
+        self.assertIsNone(cache.get('http://r/a/b', (None,)))
+        self.assertIsNotNone(cache.get('http://r/ab', (None,)))
+
+    def test_django_tier(self):
+        shared = DictCache()
+        first  = MetadataCache(django_cache=shared)
+        second = MetadataCache(django_cache=shared)
+
+        first.put('http://r/a', (), _entry('a'))
+        self.assertEqual(second.get('http://r/a', ()).etag, 'a')
+
+        first.invalidate(['http://r/a'])
+        second.clear()
+        self.assertIsNone(second.get('http://r/a', ()))
@@ -0,0 +1,137 @@
+from unittest import TestCase
+
+import rdflib
+from rdflib import Literal, URIRef, XSD
+from rdflib.namespace import DC
+
+from fedoralink.fedorans import FEDORA, LDP, RDF
+from fedoralink.rdfmetadata import RDFMetadata
+
+
+def _string(value):
+    return Literal(value, datatype=XSD.string)
+
+
+def _server_metadata(uri):
+    g = rdflib.Graph()
+    subject = URIRef(uri)
+    g.add((subject, DC.title, Literal('title', datatype=XSD.string)))
+    g.add((subject, FEDORA.lastModified, Literal('2016-01-01T00:00:00.000Z', datatype=XSD.dateTime)))
+    g.add((subject, RDF.type, FEDORA.Container))
+    ret = RDFMetadata(uri, g)
+    ret.etag = 'W/"server"'
+    return ret
+
+
+class RDFMetadataTestCase(TestCase):
+
+    def test_server_managed_refetched_lazily(self):
+        calls = []
+
+        def refetch():
+            calls.append(1)
+            return _server_metadata('http://example.com/a')
+
+        md = RDFMetadata('')
+        md[DC.title] = Literal('title', datatype=XSD.string)
+        md.set_id('http://example.com/a')
+        md.mark_saved(refetch, 'W/"local"')
+
+        self.assertEqual(md.serialize_sparql().count(b'<>'), 0)
+        self.assertEqual(md[DC.title], [Literal('title', datatype=XSD.string)])
+        # types set by the client are known
+        self.assertEqual(md[RDF.type], [])
+        self.assertFalse(md.has_type(URIRef('http://example.com/Type')))
+        self.assertEqual(calls, [])
+        self.assertEqual(md.etag, 'W/"local"')
+
+        self.assertTrue(md.has_type(FEDORA.Container))
+        self.assertEqual(calls, [1])
+        self.assertEqual(len(md[FEDORA.lastModified]), 1)
+        self.assertEqual(md.etag, 'W/"server"')
+
+    def test_graph_built_on_demand(self):
+        g = rdflib.Graph()
+        parent, child = URIRef('http://example.com/a'), URIRef('http://example.com/a/b')
+        g.add((parent, DC.title, Literal('parent', datatype=XSD.string)))
+        g.add((parent, LDP.contains, child))
+        g.add((child, DC.title, Literal('child', datatype=XSD.string)))
+
+        md = RDFMetadata('http://example.com/a/', g)
+        self.assertEqual(md.id, parent)
+        self.assertIn(LDP.contains, md)
+        self.assertNotIn(DC.subject, md)
+
+        cloned = md.clone_for(child)
+        self.assertEqual(cloned[DC.title], [Literal('child', datatype=XSD.string)])
+        self.assertEqual(cloned[FEDORA.hasParent], [parent])
+        self.assertIn('http://example.com/a/b', str(md))
+
+        md.rdf_metadata.add((parent, DC.subject, Literal('subject', datatype=XSD.string)))
+        md[DC.title] = Literal('changed', datatype=XSD.string)
+        self.assertEqual(md[DC.subject], [Literal('subject', datatype=XSD.string)])
+        self.assertEqual(set(md.rdf_metadata.objects(parent, DC.title)), {Literal('changed', datatype=XSD.string)})
+        self.assertEqual(len(md.clone_for(child)[DC.title]), 1)
+
+    def test_parsed_on_first_access(self):
+        subject = URIRef('http://example.com/a/')
+        data = ('<%s> <%s> <%s> .\n' % (subject, RDF.type, FEDORA.Container) +
+                '<%s> <%s> <http://example.com> .\n' % (subject, FEDORA.hasParent) +
+                '<%s> <%s> "title"^^<%s> .\n' % (subject, DC.title, XSD.string)).encode('utf-8')
+
+        md = RDFMetadata('http://example.com/a', data, 'application/n-triples')
+        self.assertEqual(md.id, subject)
+        self.assertTrue(md.has_type(FEDORA.Container))
+        self.assertEqual(md[FEDORA.hasParent], [URIRef('http://example.com')])
+        self.assertIsNotNone(md._RDFMetadata__raw)
+
+        self.assertEqual(md[DC.title], [Literal('title', datatype=XSD.string)])
+        self.assertIsNone(md._RDFMetadata__raw)
+        self.assertEqual(md[RDF.type], [FEDORA.Container])
+
+    def test_serialize_sparql(self):
+        md = RDFMetadata('http://example.com/a')
+        md[DC.title] = Literal('a "quoted" \\ multi\nline', datatype=XSD.string)
+        md[FEDORA.hasParent] = URIRef('http://example.com')
+
+        with self.assertLogs('fedoralink.sparql', 'WARNING') as logs:
+            sparql = md.serialize_sparql()
+        self.assertEqual(sparql,
+                         b'DELETE {\n}\nINSERT {\n'
+                         b'    <> <http://purl.org/dc/elements/1.1/title> '
+                         b'"a \\"quoted\\" \\\\ multi\\nline"^^<http://www.w3.org/2001/XMLSchema#string> .\n'
+                         b'}\nWHERE { }\n\n')
+        # the dropped fedora triple is reported
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(str(FEDORA.hasParent), logs.output[0])
+
+    def test_clone_copied_on_write(self):
+        g = rdflib.Graph()
+        parent, child = URIRef('http://example.com/a'), URIRef('http://example.com/a/b')
+        g.add((parent, LDP.contains, child))
+        g.add((child, DC.title, Literal('child', datatype=XSD.string)))
+        md = RDFMetadata(parent, g)
+
+        first, second = md.clone_for(child), md.clone_for(child)
+        first[DC.title] = Literal('changed', datatype=XSD.string)
+        del first[FEDORA.hasParent]
+
+        self.assertEqual(first[DC.title], [Literal('changed', datatype=XSD.string)])
+        self.assertNotIn(FEDORA.hasParent, first)
+        self.assertEqual(second[DC.title], [Literal('child', datatype=XSD.string)])
+        self.assertEqual(second[FEDORA.hasParent], [parent])
+        self.assertEqual(md.clone_for(child)[DC.title], [Literal('child', datatype=XSD.string)])
+
+    def test_minimal_changes(self):
+        md = RDFMetadata('http://example.com/a', [(URIRef('http://example.com/a'), DC.title, _string('old'))])
+        md[DC.title] = [_string('t1'), _string('t2')]
+        md[DC.title] = [_string('t2'), _string('t3')]
+        md.add(DC.subject, _string('s'))
+        self.assertEqual(md.get_changes(), ({DC.title: [_string('old')]},
+                                            {DC.title: [_string('t2'), _string('t3')], DC.subject: [_string('s')]}))
+
+        md[DC.title] = _string('old')
+        del md[DC.subject]
+        self.assertFalse(md.has_changes())
+        self.assertEqual(md.get_changes(), ({}, {}))
+        self.assertFalse(md.clone_for('http://example.com/a/b').has_changes())
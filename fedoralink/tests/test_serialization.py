@@ -0,0 +1,83 @@
+import pickle
+from unittest import TestCase
+
+import rdflib
+from rdflib import BNode, Literal, URIRef, XSD
+from rdflib.namespace import DC
+
+from fedoralink import serialization
+from fedoralink.fedorans import FEDORA, LDP, RDF
+from fedoralink.models import FedoraObject
+from fedoralink.rdfmetadata import RDFMetadata
+from fedoralink.type_manager import FedoraTypeManager
+
+
+class Note(FedoraObject):
+    pass
+
+
+def _metadata():
+    g = rdflib.Graph()
+    parent, child = URIRef('http://example.com/a'), URIRef('http://example.com/a/b')
+    g.add((parent, RDF.type, FEDORA.Container))
+    g.add((parent, DC.title, Literal('title', lang='en')))
+    g.add((parent, DC.date, Literal('2016-01-01', datatype=XSD.date)))
+    g.add((parent, LDP.contains, child))
+    g.add((child, DC.title, Literal('child', datatype=XSD.string)))
+    g.add((BNode('b0'), DC.title, Literal('anonymous')))
+    md = RDFMetadata(parent, g)
+    md.etag = 'W/"1"'
+    md[DC.title] = Literal('changed', datatype=XSD.string)
+    return md
+
+
+class SerializationTestCase(TestCase):
+
+    def test_metadata_round_trip(self):
+        md = _metadata()
+        data = md.to_bytes()
+        self.assertTrue(data.startswith(serialization.MAGIC + bytes([serialization.FORMAT_VERSION])))
+
+        loaded = pickle.loads(pickle.dumps(md))
+        self.assertEqual(loaded.id, md.id)
+        self.assertEqual(loaded.etag, 'W/"1"')
+        for predicate in (RDF.type, DC.title, DC.date, LDP.contains):
+            self.assertEqual(loaded[predicate], md[predicate])
+        self.assertEqual(loaded.get_changes(), md.get_changes())
+        self.assertEqual(loaded.serialize_sparql(), md.serialize_sparql())
+        self.assertEqual(loaded.clone_for('http://example.com/a/b')[DC.title],
+                         [Literal('child', datatype=XSD.string)])
+        self.assertEqual(set(loaded.rdf_metadata), set(md.rdf_metadata))
+        # graph mode serializes the same state
+        self.assertEqual(RDFMetadata.from_bytes(md.to_bytes()).get_changes(), md.get_changes())
+
+        self.assertRaises(ValueError, RDFMetadata.from_bytes, data[:3] + b'\xff' + data[4:])
+
+    def test_saved_metadata_not_refetched(self):
+        md = _metadata()
+        refetched = []
+        md.mark_saved(lambda: refetched.append(md) or md, 'W/"2"')
+
+        loaded = pickle.loads(pickle.dumps(md))
+        self.assertEqual(refetched, [])
+        self.assertEqual(loaded.etag, 'W/"2"')
+        self.assertEqual(loaded[DC.title], [Literal('changed', datatype=XSD.string)])
+        self.assertEqual(loaded.get_changes(), ({}, {}))
+
+    def test_object_round_trip(self):
+        clz = FedoraTypeManager.generate_class([Note, FedoraObject])
+        self.assertIs(FedoraTypeManager.generate_class([Note, FedoraObject]), clz)
+
+        connection = object()
+        obj = clz(__metadata=_metadata(), __connection=connection, __slug='a')
+        obj.is_incomplete = True
+
+        loaded = serialization.loads_object(serialization.dumps_object(obj), connection)
+        self.assertIs(type(loaded), clz)
+        self.assertIs(loaded.objects_fedora_connection, connection)
+        self.assertEqual(loaded.slug, 'a')
+        self.assertTrue(loaded.is_incomplete)
+        self.assertEqual(loaded[DC.title], obj[DC.title])
+
+        note = Note(__connection=connection)
+        self.assertIs(type(serialization.loads_object(serialization.dumps_object(note), connection)), Note)
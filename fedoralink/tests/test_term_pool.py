@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from rdflib import Literal, URIRef, XSD
+from rdflib.namespace import DC
+
+from fedoralink.indexer.fields import IndexedTextField
+from fedoralink.models import FedoraObject
+from fedoralink.term_pool import TermPool, get_term_pool
+
+
+class _TranslatedField(IndexedTextField):
+    """
+    Field converting a value to a list of literals
+    """
+    def convert_to_rdf(self, value):
+        return [Literal(value, lang='cs'), Literal(value, lang='en')]
+
+
+class TermPoolTestCase(TestCase):
+
+    def test_terms_are_shared(self):
+        pool = TermPool()
+        uri = pool.uri('http://example.com/a')
+        self.assertIs(pool.term(URIRef('http://example.com/a')), uri)
+        self.assertIs(pool.uri(URIRef('http://example.com/a')), uri)
+
+        literal = pool.term(Literal('1', datatype=XSD.integer))
+        self.assertIs(pool.literal(1, datatype=XSD.integer), literal)
+        self.assertIs(pool.literal(1, datatype=XSD.integer), literal)
+        self.assertIsNot(pool.literal(True), pool.literal(1))
+        self.assertEqual(pool.literal('title', lang='en'), Literal('title', lang='en'))
+
+        stats = pool.stats()
+        self.assertEqual((stats['lookups'], stats['hits']), (9, 3))
+        self.assertGreater(stats['bytes_saved'], 0)
+
+    def test_cleared_when_full(self):
+        pool = TermPool(max_terms=2)
+        first = pool.uri('http://example.com/1')
+        pool.uri('http://example.com/2')
+        pool.uri('http://example.com/3')
+
+        self.assertIsNot(pool.uri('http://example.com/1'), first)
+        self.assertLessEqual(pool.stats()['terms'], 2)
+
+    def test_field_values_are_pooled(self):
+        obj = FedoraObject()
+        _TranslatedField(DC.title)._setter(obj, 'title')
+
+        values = obj.metadata[DC.title]
+        self.assertEqual(len(values), 2)
+        for value in values:
+            self.assertIs(get_term_pool().term(Literal('title', lang=value.language)), value)
@@ -0,0 +1,92 @@
+import threading
+import time
+from unittest import TestCase
+
+from rdflib import Literal, URIRef, XSD
+from rdflib.namespace import DC
+
+from fedoralink import versioning
+from fedoralink.connection import FedoraConnection
+from fedoralink.fedorans import FEDORA
+from fedoralink.rdfmetadata import RDFMetadata
+from fedoralink.testing import FakeFedoraServer
+
+
+class _Recorder:
+    def __init__(self, fail=()):
+        self.versions = []
+        self.fail = fail
+        self.event = threading.Event()
+
+    def __call__(self, object_id):
+        self.versions.append(object_id)
+        self.event.set()
+        if object_id in self.fail:
+            raise Exception('Could not make version')
+
+
+class CoalescingVersionerTestCase(TestCase):
+
+    def test_writes_coalesced(self):
+        recorder = _Recorder()
+        versioner = versioning.CoalescingVersioner(recorder, 0.3)
+        for _ in range(3):
+            versioner.schedule('a')
+            time.sleep(0.1)
+        # the quiet period started again with each write
+        self.assertEqual(recorder.versions, [])
+
+        self.assertTrue(recorder.event.wait(2))
+        time.sleep(0.3)
+        self.assertEqual(recorder.versions, ['a'])
+
+    def test_flush(self):
+        recorder = _Recorder(fail=('a',))
+        versioner = versioning.CoalescingVersioner(recorder, 60)
+        for object_id in ('a', 'b', 'a'):
+            versioner.schedule(object_id)
+
+        # failure of one version does not stop the others
+        versioner.flush()
+        self.assertEqual(sorted(recorder.versions), ['a', 'b'])
+        versioner.flush()
+        self.assertEqual(len(recorder.versions), 2)
+
+    def test_policy(self):
+        self.assertEqual(versioning.get_versioning_policy(versioning.NEVER), versioning.NEVER)
+        with versioning.versioning_policy(versioning.COALESCED):
+            self.assertEqual(versioning.get_versioning_policy(versioning.NEVER), versioning.COALESCED)
+        self.assertEqual(versioning.get_versioning_policy(), versioning.ALWAYS)
+        self.assertRaises(AttributeError, versioning.versioning_policy, 'sometimes')
+
+
+class CoalescedVersioningTestCase(TestCase):
+
+    def setUp(self):
+        self.server = FakeFedoraServer().start()
+        self.app = self.server.app
+        self.connection = FedoraConnection(self.server.url, options={'VERSIONING': versioning.COALESCED,
+                                                                     'VERSIONING_QUIET_PERIOD': 60})
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _versions(self):
+        return [path for method, path, status in self.app.requests if method == 'POST' and 'fcr:versions' in path]
+
+    def test_one_version_after_writes(self):
+        metadata = RDFMetadata('')
+        metadata[FEDORA.hasParent] = URIRef(self.server.url)
+        metadata[DC.title] = Literal('first', datatype=XSD.string)
+        metadata = self.connection.create_objects([{'metadata': metadata, 'bitstream': None, 'slug': 'a'}])[0]
+
+        versioner = self.connection._get_coalescing_versioner()
+        for title in ('second', 'third'):
+            metadata[DC.title] = Literal(title, datatype=XSD.string)
+            self.connection.update_objects([{'metadata': metadata, 'bitstream': None}])
+        # the versioner and its connection are created just once
+        self.assertIs(self.connection._get_coalescing_versioner(), versioner)
+        self.assertEqual(self._versions(), [])
+
+        versioner.flush()
+        self.assertEqual(len(self._versions()), 1)
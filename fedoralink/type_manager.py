@@ -30,6 +30,9 @@ class FedoraTypeManager:
     # clazz -> (rdf_predicates, priority)
     on_rdf_predicates = {}
 
+    # tuple of superclasses -> class generated by generate_class
+    bound_classes = {}
+
     @staticmethod
     def register_model(model_class, on_rdf_type=(), on_has_predicate=(), priority=1.0):
         """
@@ -137,9 +140,13 @@ class FedoraTypeManager:
         :param classes: list of superclasses
         :return:    dynamically generated class
         """
-        # TODO: class cache
-        return type('_'.join([x.__name__ for x in classes]) + "_bound", tuple(classes), {'_is_bound':True,
-                                                                                         '_type' : classes})
+        key = tuple(classes)
+        clz = FedoraTypeManager.bound_classes.get(key)
+        if clz is None:
+            clz = type('_'.join([x.__name__ for x in classes]) + "_bound", key, {'_is_bound':True,
+                                                                                '_type' : classes})
+            clz = FedoraTypeManager.bound_classes.setdefault(key, clz)
+        return clz
 
     @staticmethod
     def populate():
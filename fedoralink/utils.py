@@ -1,5 +1,6 @@
 import binascii
 import logging
+import os
 
 from rdflib import Literal
 
@@ -57,7 +58,7 @@ class StringLikeList(list):
 
 
 class TypedStream:
-    def __init__(self, stream_or_filepath, mimetype=None, filename=None):
+    def __init__(self, stream_or_filepath, mimetype=None, filename=None, size=None):
         """
         Creates a new instance of stream with optional mimetype and filename
 
@@ -65,8 +66,10 @@ class TypedStream:
         :param mimetype:            mimetype. If not provided will be guessed
                                     (only if stream_or_filepath points to local file)
         :param filename:            filename in case stream_or_filepath is an input stream
+        :param size:                number of bytes in the stream if known. If not set, it is taken from the file
         :return:
         """
+        self.__size = size
         if isinstance(stream_or_filepath, str):
             self.__stream = None
             self.__filename = stream_or_filepath
@@ -94,6 +97,37 @@ class TypedStream:
             self.__stream = open(self.__filename, 'rb')
         return self.__stream
 
+    @property
+    def size(self):
+        """
+        Returns the number of bytes that remain to be read from the stream, None if it can not be determined
+        without reading the stream
+        """
+        if self.__size is not None:
+            return self.__size
+        if not self.__stream and self.__filename is not None:
+            return os.path.getsize(self.__filename)
+
+        stream = self.__stream
+        size = getattr(stream, 'size', None)
+        if isinstance(size, int):
+            return size
+        # noinspection PyBroadException
+        try:
+            return os.fstat(stream.fileno()).st_size - stream.tell()
+        except Exception:
+            pass
+        # noinspection PyBroadException
+        try:
+            if stream.seekable():
+                position = stream.tell()
+                end = stream.seek(0, os.SEEK_END)
+                stream.seek(position)
+                return end - position
+        except Exception:
+            pass
+        return None
+
     @property
     def mimetype(self):
         """
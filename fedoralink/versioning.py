@@ -0,0 +1,145 @@
+import atexit
+import logging
+import threading
+import time
+
+log = logging.getLogger('fedoralink.versioning')
+
+# take a snapshot after every create and update (the default)
+ALWAYS = 'always'
+
+# never take snapshots
+NEVER = 'never'
+
+# inside a transaction take one snapshot of each written resource after commit, outside behave as ALWAYS
+ONCE_PER_TRANSACTION = 'once-per-transaction'
+
+# take one snapshot of a resource after it has not been written for VERSIONING_QUIET_PERIOD seconds
+COALESCED = 'coalesced'
+
+POLICIES = (ALWAYS, NEVER, ONCE_PER_TRANSACTION, COALESCED)
+
+versioning_local = threading.local()
+
+
+class versioning_policy:
+    """
+    Overrides the versioning policy configured in settings (DATABASES['repository']['VERSIONING']) for all
+    writes made in the current thread, for example:
+
+        with versioning_policy('never'):
+            FedoraObject.save_multiple(objects)
+    """
+
+    def __init__(self, policy):
+        if policy not in POLICIES:
+            raise AttributeError('Unknown versioning policy %s, expected one of %s' % (policy, POLICIES))
+        self.policy = policy
+        self.original_policy = None
+
+    def __enter__(self):
+        self.original_policy = getattr(versioning_local, 'policy', None)
+        versioning_local.policy = self.policy
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        versioning_local.policy = self.original_policy
+
+
+def get_versioning_policy(default=ALWAYS):
+    """
+    Returns the versioning policy active in the current thread
+
+    :param default: policy from settings, used if there is no versioning_policy block active
+    :return:        one of POLICIES
+    """
+    policy = getattr(versioning_local, 'policy', None)
+    if policy is None:
+        policy = default
+    if policy not in POLICIES:
+        raise AttributeError('Unknown versioning policy %s, expected one of %s' % (policy, POLICIES))
+    return policy
+
+
+class CoalescingVersioner:
+    """
+    Background worker that takes one snapshot of a resource after the resource has not been written
+    for quiet_period seconds.
+    """
+
+    def __init__(self, make_version, quiet_period):
+        """
+        :param make_version:    callable(object_id) taking the snapshot
+        :param quiet_period:    number of seconds without writes after which the snapshot is taken
+        """
+        self._make_version = make_version
+        self._quiet_period = quiet_period
+        self._pending      = {}                    # object_id -> time when the snapshot should be taken
+        self._condition    = threading.Condition()
+        self._thread       = None
+
+    def schedule(self, object_id):
+        """
+        Registers a write of the resource; postpones its snapshot if it has already been scheduled
+        """
+        with self._condition:
+            self._pending[object_id] = time.time() + self._quiet_period
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='fedoralink-versioning', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+            self._condition.notify()
+
+    def flush(self):
+        """
+        Takes snapshots of all pending resources now
+        """
+        with self._condition:
+            object_ids = list(self._pending)
+            self._pending.clear()
+        for object_id in object_ids:
+            self._version(object_id)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.time()
+                    due = [object_id for object_id, when in self._pending.items() if when <= now]
+                    if due:
+                        for object_id in due:
+                            del self._pending[object_id]
+                        break
+                    if self._pending:
+                        self._condition.wait(min(self._pending.values()) - now)
+                    else:
+                        self._condition.wait()
+            for object_id in due:
+                self._version(object_id)
+
+    def _version(self, object_id):
+        # noinspection PyBroadException
+        try:
+            self._make_version(object_id)
+        except:
+            log.exception('Could not make a version of %s', object_id)
+
+
+_versioners      = {}
+_versioners_lock = threading.Lock()
+
+
+def get_coalescing_versioner(key, make_version, quiet_period):
+    """
+    Returns a process-wide CoalescingVersioner registered under the given key, creating it if necessary
+
+    :param key:             key of the versioner, for example the repository url
+    :param make_version:    see CoalescingVersioner, used only when the versioner is created
+    :param quiet_period:    see CoalescingVersioner, used only when the versioner is created
+    :return:                instance of CoalescingVersioner
+    """
+    with _versioners_lock:
+        versioner = _versioners.get(key)
+        if versioner is None:
+            versioner = _versioners[key] = CoalescingVersioner(make_version, quiet_period)
+        return versioner
@@ -3,7 +3,7 @@ import requests
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core.urlresolvers import reverse
 from django.db.models import Q
-from django.http import HttpResponseRedirect, FileResponse, Http404, HttpResponse
+from django.http import HttpResponseRedirect, Http404, HttpResponse
 from django.shortcuts import render
 from django.template import Template, RequestContext
 from django.utils.translation import ugettext as _
@@ -12,6 +12,7 @@ from django.views.generic import View, CreateView, DetailView, UpdateView
 from fedoralink.forms import FedoraForm
 from fedoralink.indexer.models import IndexableFedoraObject
 from fedoralink.models import FedoraObject
+from fedoralink.responses import bitstream_response
 from fedoralink_ui.templatetags.fedoralink_tags import id_from_path
 from fedoralink_ui.models import ResourceType
 from .utils import get_class, fullname
@@ -63,10 +64,7 @@ class GenericDownloadView(View):
 
     def get(self, request, bitstream_id):
         attachment = self.model.objects.get(pk=bitstream_id.replace('_', '/'))
-        bitstream = attachment.get_bitstream()
-        resp = FileResponse(bitstream.stream, content_type=bitstream.mimetype)
-        resp['Content-Disposition'] = 'inline; filename="' + attachment.filename
-        return resp
+        return bitstream_response(request, attachment, filename=attachment.filename)
 
 
 class GenericChangeStateView(View):
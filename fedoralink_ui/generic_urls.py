@@ -149,7 +149,7 @@ def cache_breadcrumbs(obj):
         ids = [
             prefix + '/'.join(ids[:k]) for k in range(1, len(ids)+1)
         ]
-        for found_obj in DCObject.objects.filter(pk__in=ids):
+        for found_obj in DCObject.objects.filter(pk__in=ids).via_repository().fetch_child_metadata(False):
             cache.set('title__%s__%s' % (found_obj.local_id, lang),
                       rdf2lang(found_obj.title, lang=lang), 3600)
 
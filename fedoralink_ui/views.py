@@ -6,7 +6,6 @@ from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core.urlresolvers import resolve
 from django.core.urlresolvers import reverse
 from django.db.models import Q
-from django.http import FileResponse
 from django.http import HttpResponseRedirect, Http404, HttpResponse
 from django.shortcuts import render
 from django.template import Template, RequestContext
@@ -23,6 +22,7 @@ from fedoralink.fedorans import FEDORA
 from fedoralink.forms import FedoraForm
 from fedoralink.indexer.models import IndexableFedoraObject
 from fedoralink.models import FedoraObject
+from fedoralink.responses import bitstream_response
 from fedoralink.type_manager import FedoraTypeManager
 from fedoralink_ui.template_cache import FedoraTemplateCache
 from fedoralink_ui.templatetags.fedoralink_tags import id_from_path, rdf2lang
@@ -311,10 +311,7 @@ class GenericDetailView(DetailView):
         self.object = self.get_object()
 
         if (FEDORA.Binary in self.object.types):
-            bitstream = self.object.get_bitstream()
-            resp = FileResponse(bitstream.stream, content_type=bitstream.mimetype)
-            resp['Content-Disposition'] = 'inline; filename="%s"' % bitstream.filename
-            return resp
+            return bitstream_response(request, self.object)
         # noinspection PyTypeChecker
         template = FedoraTemplateCache.get_template_string(self.object, view_type='view')
         if template: